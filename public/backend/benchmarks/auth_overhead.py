@@ -0,0 +1,99 @@
+"""
+Token validation cost per authenticated request, python-jose vs the
+decoded-token cache (src/utils/token_cache.py).
+
+First times ``decode_access_token`` alone, ``--decodes`` times with the
+cache off (every call is a full ``jwt.decode``) and on (every call after the
+first is a hit). Each request decodes its token twice, once to pick the
+tenant shard and once in ``get_current_user``.
+
+Then serves GET /api/auth/profile in-process through the ASGI app against
+a temporary SQLite database, ``--requests`` times per mode, so the per
+request difference can be read against everything else a request costs.
+The principal cache is on in both modes, so no request runs SQL.
+
+    py -3.10 -m benchmarks.auth_overhead --decodes 20000 --requests 2000
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def time_decodes(decodes: int, token: str) -> dict:
+    from src.utils.auth import decode_access_token, token_cache
+
+    results = {}
+    for mode, size in (("python-jose", 0), ("cached", 10000)):
+        token_cache.max_size = size
+        token_cache.clear()
+        decode_access_token(token)
+        start = time.perf_counter()
+        for _ in range(decodes):
+            decode_access_token(token)
+        results[mode] = (time.perf_counter() - start) / decodes
+    return results
+
+
+async def time_requests(requests: int) -> dict:
+    import httpx
+
+    from src.main import app
+    from src.config.database import dispose_engines
+    from src.utils.auth import token_cache
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.post("/api/auth/register", json={
+                "email": "auth-bench@example.com", "password": "auth-bench-password", "role": "owner",
+                "organization_name": "Auth Bench",
+            })
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['token']}"}
+            for mode, size in (("python-jose", 0), ("cached", 10000)) * 2:  # second round is the one kept
+                token_cache.max_size = size
+                token_cache.clear()
+                (await client.get("/api/auth/profile", headers=headers)).raise_for_status()
+                start = time.perf_counter()
+                for _ in range(requests):
+                    await client.get("/api/auth/profile", headers=headers)
+                results[mode] = (time.perf_counter() - start) / requests
+    finally:
+        await dispose_engines()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--decodes", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'auth.db')}"
+        os.environ["DB_MAINTENANCE_ENABLED"] = "False"
+        subprocess.run([sys.executable, "-m", "src.migrations", "upgrade"], check=True, stdout=subprocess.DEVNULL)
+
+        from src.utils.auth import create_access_token
+
+        token = create_access_token({"userId": 1, "organizationId": 1, "role": "owner"})
+        decodes = time_decodes(args.decodes, token)
+        print("decode_access_token:")
+        for mode, seconds in decodes.items():
+            print(f"  {mode:12} {seconds * 1e6:8.1f} us per call, {2 * seconds * 1e6:8.1f} us per request")
+
+        requests = asyncio.run(time_requests(args.requests))
+        print("GET /api/auth/profile, in-process:")
+        for mode, seconds in requests.items():
+            print(f"  {mode:12} {seconds * 1e6:8.1f} us per request")
+        saved = requests["python-jose"] - requests["cached"]
+        print(f"  the cache saves {saved * 1e6:.1f} us ({saved / requests['python-jose']:.1%}) per request")
+
+
+if __name__ == "__main__":
+    main()
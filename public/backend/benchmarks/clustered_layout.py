@@ -0,0 +1,125 @@
+"""
+Tenant-scoped scans under the default and the clustered storage layout
+(see src/migrations/storage_layout.py).
+
+Builds two SQLite files with the same data: customers of ``--organizations``
+tenants inserted round-robin, the way a busy shared database fills up, so
+every tenant's rows are spread over the whole table. Then, for a sample of
+tenants, pages through all of one tenant's customers with the statement
+GET /api/customers/ runs, on a fresh connection with a tiny page cache and
+no mmap. That way every page the scan touches is read from the file, and
+the bytes read (from /proc/self/io, Linux only) divided by the page size
+give the pages read.
+
+Also prints the file size and seeding time, i.e. what the second copy of
+each row costs.
+
+    py -3.10 -m benchmarks.clustered_layout --organizations 50 --customers 2000
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from src.migrations import runner, storage_layout
+from src.models.database import Customer, Organization
+from src.repositories import customers as customer_repository
+
+PAGE_LIMIT = 100
+
+
+def bytes_read() -> int:
+    try:
+        with open("/proc/self/io") as io:
+            for line in io:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def build(path: str, layout: str, organizations: int, customers: int) -> float:
+    engine = create_engine(f"sqlite:///{path}", poolclass=NullPool)
+    try:
+        runner.upgrade(engine)
+        storage_layout.apply_to(engine, layout)
+        start = time.perf_counter()
+        with engine.begin() as connection:
+            connection.execute(insert(Organization), [{"name": f"Org {i}"} for i in range(organizations)])
+            rows = [
+                {"organization_id": n % organizations + 1, "phone_number": f"555{n:07d}",
+                 "name": f"Customer {n}", "email": f"customer{n}@example.com", "points": n % 100, "visits": n % 7}
+                for n in range(organizations * customers)
+            ]
+            for i in range(0, len(rows), 10000):
+                connection.execute(insert(Customer), rows[i:i + 10000])
+        return time.perf_counter() - start
+    finally:
+        engine.dispose()
+
+
+def scan_tenant(path: str, organization_id: int) -> tuple:
+    """Page through one tenant from a cold page cache; returns (seconds, bytes read, rows)"""
+    engine = create_engine(f"sqlite:///{path}", poolclass=NullPool)
+    try:
+        with Session(engine) as session:
+            connection = session.connection()
+            connection.exec_driver_sql("PRAGMA mmap_size=0")
+            connection.exec_driver_sql("PRAGMA cache_size=16")
+            rows, offset = 0, 0
+            read_before, start = bytes_read(), time.perf_counter()
+            while True:
+                page = session.execute(customer_repository.CUSTOMERS_BY_ORG, {
+                    "organization_id": organization_id, "limit": PAGE_LIMIT, "offset": offset,
+                }).scalars().all()
+                if not page:
+                    break
+                rows += len(page)
+                offset += PAGE_LIMIT
+                session.expunge_all()
+            return time.perf_counter() - start, bytes_read() - read_before, rows
+    finally:
+        engine.dispose()
+
+
+def plan(path: str) -> str:
+    engine = create_engine(f"sqlite:///{path}", poolclass=NullPool)
+    try:
+        with engine.connect() as connection:
+            sql = "SELECT * FROM customers WHERE organization_id = :org_id ORDER BY id LIMIT 100 OFFSET 0"
+            return "; ".join(runner.explain(connection, sql, {"org_id": 1}))
+    finally:
+        engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--organizations", type=int, default=50)
+    parser.add_argument("--customers", type=int, default=2000, help="customers per organization")
+    parser.add_argument("--tenants", type=int, default=10, help="tenants scanned per layout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for layout in storage_layout.LAYOUTS:
+            path = os.path.join(directory, f"{layout}.db")
+            seconds = build(path, layout, args.organizations, args.customers)
+            with sqlite3.connect(path) as connection:
+                page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+            results = [scan_tenant(path, org_id) for org_id in range(1, min(args.tenants, args.organizations) + 1)]
+            pages = statistics.mean(read for _, read, _ in results) / page_size
+            print(f"{layout} layout: {plan(path)}")
+            print(f"  seed {args.organizations * args.customers} rows: {seconds:.2f} s, "
+                  f"file {os.path.getsize(path) / 2 ** 20:.1f} MiB")
+            print(f"  scan {results[0][2]} rows of one tenant: "
+                  f"{statistics.mean(s for s, _, _ in results) * 1000:.1f} ms, ~{pages:.0f} pages read")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Latency under concurrent load against a running backend.
+
+Seeds one organization with customers through the public API, then has
+N concurrent clients hammer a mix of authenticated read and write endpoints
+and prints p50/p95/p99 latency. Run it once against the old sync-session
+build and once against the current tree to compare:
+
+    py -3.10 -m uvicorn src.main:app --port 8001
+    py -3.10 -m benchmarks.concurrent_latency --url http://127.0.0.1:8001 --clients 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+
+
+async def seed(client: httpx.AsyncClient, customers: int):
+    email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+    response = await client.post("/api/auth/register", json={
+        "email": email, "password": "bench-password", "role": "owner",
+        "organization_name": "Benchmark Org",
+    })
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+    customer_ids = []
+    for i in range(customers):
+        response = await client.post("/api/customers/", headers=headers, json={
+            "phone_number": f"555{i:07d}", "name": f"Customer {i}",
+        })
+        response.raise_for_status()
+        customer_ids.append(response.json()["id"])
+    return headers, customer_ids
+
+
+async def run_client(client, headers, customer_ids, requests, latencies, errors):
+    for i in range(requests):
+        customer_id = customer_ids[i % len(customer_ids)]
+        if i % 4 == 3:
+            request = client.post(f"/api/customers/{customer_id}/visits", headers=headers)
+        elif i % 4 == 2:
+            request = client.get(f"/api/customers/{customer_id}", headers=headers)
+        else:
+            request = client.get("/api/customers/", headers=headers, params={"limit": 50})
+        start = time.perf_counter()
+        try:
+            response = await request
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+        except httpx.HTTPError as exc:
+            errors.append(type(exc).__name__)
+        latencies.append(time.perf_counter() - start)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        headers, customer_ids = await seed(client, args.customers)
+
+        latencies, errors = [], []
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            run_client(client, headers, customer_ids, args.requests, latencies, errors)
+            for _ in range(args.clients)
+        ])
+        elapsed = time.perf_counter() - start
+
+    print(f"clients={args.clients} requests={len(latencies)} errors={len(errors)} "
+          f"throughput={len(latencies) / elapsed:.0f} req/s")
+    print(f"p50={percentile(latencies, 50) * 1000:.1f}ms "
+          f"p95={percentile(latencies, 95) * 1000:.1f}ms "
+          f"p99={percentile(latencies, 99) * 1000:.1f}ms "
+          f"mean={statistics.mean(latencies) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8001")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=20, help="requests per client")
+    parser.add_argument("--customers", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
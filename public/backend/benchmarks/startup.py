@@ -0,0 +1,160 @@
+"""
+Time from process start to first served request.
+
+Migrates a temporary SQLite database, registers one owner, then starts
+``uvicorn src.main:app`` ``--runs`` times with the startup warm-up on and
+off (STARTUP_WARMUP, see src/utils/warmup.py). For each start it records
+how long until /health answers, then the latency of the first customer
+list, login and /openapi.json requests the fresh process serves. Prints
+medians per mode.
+
+``--import-profile`` instead runs ``python -X importtime -c "import src.main"``
+and prints the modules with the largest cumulative and self import times,
+plus the total per top-level package.
+
+    py -3.10 -m benchmarks.startup --runs 5
+    py -3.10 -m benchmarks.startup --import-profile --top 25
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+PASSWORD = "startup-password"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(env: dict, port: int) -> tuple:
+    """Start uvicorn; returns (process, seconds until /health answered)"""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = start + 60
+    while time.perf_counter() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return process, time.perf_counter() - start
+        except httpx.HTTPError:
+            pass
+        if process.poll() is not None:
+            break
+        time.sleep(0.005)
+    process.kill()
+    raise RuntimeError("server did not come up")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def timed(client: httpx.Client, method: str, path: str, **kwargs) -> float:
+    start = time.perf_counter()
+    client.request(method, path, **kwargs).raise_for_status()
+    return time.perf_counter() - start
+
+
+def setup(env: dict) -> dict:
+    subprocess.run([sys.executable, "-m", "src.migrations", "upgrade"], env=env, check=True, stdout=subprocess.DEVNULL)
+    port = free_port()
+    process, _ = start_server(env, port)
+    try:
+        response = httpx.post(f"http://127.0.0.1:{port}/api/auth/register", timeout=30, json={
+            "email": "startup@example.com", "password": PASSWORD, "role": "owner", "organization_name": "Startup",
+        })
+        response.raise_for_status()
+        return {"Authorization": f"Bearer {response.json()['token']}"}
+    finally:
+        stop_server(process)
+
+
+def measure(env: dict, headers: dict) -> dict:
+    port = free_port()
+    process, ready = start_server(env, port)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=30) as client:
+            return {
+                "ready": ready,
+                "customers": timed(client, "GET", "/api/customers/", headers=headers),
+                "login": timed(client, "POST", "/api/auth/login",
+                               json={"email": "startup@example.com", "password": PASSWORD}),
+                "openapi": timed(client, "GET", "/openapi.json"),
+            }
+    finally:
+        stop_server(process)
+
+
+def import_profile(top: int):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import src.main"], capture_output=True, text=True, check=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "self" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(own), int(cumulative)))
+    packages = defaultdict(int)
+    for name, own, _ in modules:
+        packages[name.split(".")[0]] += own
+    total = max(cumulative for name, _, cumulative in modules if name == "src.main")
+    print(f"import src.main: {total / 1000:.0f} ms, {len(modules)} modules")
+    print("\nslowest by cumulative time (ms):")
+    for name, own, cumulative in sorted(modules, key=lambda m: m[2], reverse=True)[:top]:
+        print(f"  {cumulative / 1000:8.1f}  {name}")
+    print("\nslowest by self time (ms):")
+    for name, own, cumulative in sorted(modules, key=lambda m: m[1], reverse=True)[:top]:
+        print(f"  {own / 1000:8.1f}  {name}")
+    print("\nper top-level package (ms):")
+    for package, own in sorted(packages.items(), key=lambda p: p[1], reverse=True)[:top]:
+        print(f"  {own / 1000:8.1f}  {package}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="server starts per mode")
+    parser.add_argument("--import-profile", action="store_true")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.import_profile:
+        import_profile(args.top)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{os.path.join(directory, 'startup.db')}",
+            "DB_MAINTENANCE_ENABLED": "False",
+        }
+        headers = setup(env)
+        modes = {"False": [], "True": []}
+        for _ in range(args.runs):  # alternate, so both modes see the same machine load
+            for warmup, runs in modes.items():
+                runs.append(measure({**env, "STARTUP_WARMUP": warmup}, headers))
+        for warmup, runs in modes.items():
+            medians = {key: statistics.median(run[key] for run in runs) * 1000 for key in runs[0]}
+            print(f"STARTUP_WARMUP={warmup}: ready in {medians['ready']:.0f} ms; first requests: "
+                  f"customers {medians['customers']:.1f} ms, login {medians['login']:.1f} ms, "
+                  f"openapi {medians['openapi']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
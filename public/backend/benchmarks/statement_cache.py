@@ -0,0 +1,132 @@
+"""
+Per-call overhead of the tenant-scoped customer lookup, three ways:
+
+- legacy:  session.query(Customer).filter(...).first(), the pre-async style
+- inline:  select(Customer).where(...) rebuilt with literal values per call
+- prebuilt: the bound-parameter statement from src.repositories.customers
+
+Runs against a throwaway in-memory SQLite database, so the numbers are
+Python-side statement construction and cache-key overhead plus a
+primary-key lookup. The engine's compiled-cache size is printed after each
+variant to show every one of them compiles once; what prebuilt saves is
+rebuilding the expression and regenerating its cache key on every call.
+
+    py -3.10 -m benchmarks.statement_cache --calls 20000
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from src.config.database import Base, create_async_db_engine, create_db_engine
+from src.models.database import Customer, Organization
+from src.repositories import customers as customer_repository
+
+MEMORY_URL = "sqlite:///:memory:"
+
+
+def seed(bind, customers: int) -> list:
+    """Create the tables on ``bind`` (an engine or connection) and add one organization's customers"""
+    Base.metadata.create_all(bind)
+    with Session(bind) as session:
+        org = Organization(name="Benchmark Org")
+        session.add(org)
+        session.flush()
+        session.add_all([
+            Customer(organization_id=org.id, phone_number=f"555{i:07d}", points=0, visits=0)
+            for i in range(customers)
+        ])
+        session.flush()
+        keys = [(customer_id, org.id) for customer_id in session.scalars(select(Customer.id))]
+        session.commit()
+    return keys
+
+
+def compiled_cache_size(engine) -> int:
+    return len(engine._compiled_cache) if engine._compiled_cache is not None else 0
+
+
+def report(label: str, calls: int, seconds: float, engine):
+    print(f"{label:10} {seconds / calls * 1e6:8.1f} us/call   compiled cache entries: {compiled_cache_size(engine)}")
+
+
+def run_sync(calls: int, customers: int):
+    engine = create_db_engine(MEMORY_URL, name="bench")
+    keys = seed(engine, customers)
+
+    def legacy(session, customer_id, org_id):
+        return session.query(Customer).filter(
+            Customer.id == customer_id, Customer.organization_id == org_id
+        ).first()
+
+    def inline(session, customer_id, org_id):
+        return session.execute(select(Customer).where(
+            Customer.id == customer_id, Customer.organization_id == org_id
+        )).scalars().first()
+
+    def prebuilt(session, customer_id, org_id):
+        return session.execute(customer_repository.CUSTOMER_BY_ID, {
+            "customer_id": customer_id, "organization_id": org_id
+        }).scalars().first()
+
+    print(f"sync Session, {calls} lookups")
+    for label, lookup in (("legacy", legacy), ("inline", inline), ("prebuilt", prebuilt)):
+        engine.clear_compiled_cache()
+        with Session(engine) as session:
+            lookup(session, *keys[0])  # warm up
+            start = time.perf_counter()
+            for i in range(calls):
+                lookup(session, *keys[i % len(keys)])
+                session.expunge_all()  # measure the query, not the identity map
+            report(label, calls, time.perf_counter() - start, engine)
+    engine.dispose()
+
+
+async def run_async(calls: int, customers: int):
+    engine = create_async_db_engine(MEMORY_URL, name="bench-async")
+    try:
+        # Seed through the sync side of the same StaticPool connection
+        async with engine.connect() as conn:
+            keys = await conn.run_sync(lambda sync_conn: seed(sync_conn, customers))
+            await conn.commit()
+
+        async def inline(session, customer_id, org_id):
+            result = await session.execute(select(Customer).where(
+                Customer.id == customer_id, Customer.organization_id == org_id
+            ))
+            return result.scalars().first()
+
+        async def prebuilt(session, customer_id, org_id):
+            return await customer_repository.get_customer(session, customer_id, org_id)
+
+        print(f"AsyncSession (aiosqlite), {calls} lookups")
+        for label, lookup in (("inline", inline), ("prebuilt", prebuilt)):
+            engine.sync_engine.clear_compiled_cache()
+            async with AsyncSession(engine) as session:
+                await lookup(session, *keys[0])
+                start = time.perf_counter()
+                for i in range(calls):
+                    await lookup(session, *keys[i % len(keys)])
+                    session.expunge_all()
+                report(label, calls, time.perf_counter() - start, engine.sync_engine)
+    finally:
+        # aiosqlite's worker threads keep the process alive until disposed
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--customers", type=int, default=1000)
+    args = parser.parse_args()
+
+    run_sync(args.calls, args.customers)
+    print()
+    asyncio.run(run_async(args.calls, args.customers))
+
+
+if __name__ == "__main__":
+    main()
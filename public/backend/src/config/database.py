@@ -1,20 +1,335 @@
-from sqlalchemy import create_engine
+from fastapi import Request
+from sqlalchemy import create_engine, event, Insert, Update, Delete
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool, StaticPool
+import itertools
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
+from src.utils.consistency import CONSISTENCY_HEADER, requires_primary
+from src.utils.db_maintenance import DatabaseActivity, MaintenanceScheduler
+from src.utils.slow_query_log import SlowQueryLog
+from src.utils.sql_metrics import instrument_engine
+from src.utils.write_queue import WriteQueue
+
 load_dotenv()
 
 # Use SQLite for development (no PostgreSQL required)
-DATABASE_URL = "sqlite:///./test.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
+# Comma-separated read replicas of DATABASE_URL, e.g. a second SQLite file
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+
+# Async drivers used for the request handlers, keyed by sync backend name
+ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+    "mysql": "aiomysql",
+}
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
 
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False}  # Required for SQLite
+# Production pragma set, applied to every new SQLite connection.
+# Each one can be overridden with SQLITE_<NAME>, e.g. SQLITE_MMAP_SIZE=0
+SQLITE_PRAGMAS = {
+    # Only takes effect on a new database (or after a full VACUUM); lets the
+    # maintenance scheduler hand freed pages back with incremental_vacuum
+    "auto_vacuum": os.getenv("SQLITE_AUTO_VACUUM", "INCREMENTAL"),
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": _env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024),
+    "cache_size": _env_int("SQLITE_CACHE_SIZE", -64 * 1024),  # negative = KiB
+    "busy_timeout": _env_int("SQLITE_BUSY_TIMEOUT", 5000),  # ms
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+}
+
+# Pool sizing, see /api/metrics/database for the numbers to tune these from
+POOL_SETTINGS = {
+    "pool_size": _env_int("DB_POOL_SIZE", 5),
+    "max_overflow": _env_int("DB_MAX_OVERFLOW", 10),
+    "pool_recycle": _env_int("DB_POOL_RECYCLE", 1800),  # seconds, -1 disables
+    "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", False),
+    "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),  # seconds
+}
+
+# Statements slower than DB_SLOW_QUERY_MS are logged with their route, source
+# line and organization; GET /api/metrics/slow-queries ranks statement shapes
+# by total time. Lower the sample rates on busy deployments.
+slow_query_log = SlowQueryLog(
+    threshold_ms=_env_float("DB_SLOW_QUERY_MS", 100),
+    log_sample_rate=_env_float("DB_SLOW_QUERY_LOG_SAMPLE_RATE", 1.0),
+    stats_sample_rate=_env_float("DB_QUERY_STATS_SAMPLE_RATE", 1.0),
 )
+
+# ANALYZE, WAL checkpoints and incremental vacuum for every SQLite file,
+# run from the app lifespan whenever a file has been idle for a while;
+# last runs are shown at GET /api/metrics/maintenance
+db_activity = DatabaseActivity()
+MAINTENANCE_ENABLED = _env_bool("DB_MAINTENANCE_ENABLED", True)
+maintenance_scheduler = MaintenanceScheduler(
+    db_activity,
+    idle_seconds=_env_float("MAINTENANCE_IDLE_SECONDS", 2.0),
+    poll_seconds=_env_float("MAINTENANCE_POLL_SECONDS", 5.0),
+    busy_timeout_ms=_env_int("MAINTENANCE_BUSY_TIMEOUT_MS", 100),
+    analysis_limit=_env_int("MAINTENANCE_ANALYSIS_LIMIT", 1000),
+    wal_truncate_mb=_env_float("MAINTENANCE_WAL_TRUNCATE_MB", 64),
+    vacuum_step_pages=_env_int("MAINTENANCE_VACUUM_STEP_PAGES", 256),
+)
+
+
+def to_async_url(url: str) -> str:
+    """Swap the driver of a sync database URL for its asyncio counterpart"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for '{backend}' databases")
+    return parsed.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+def _is_memory_sqlite(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+class PoolStats:
+    """Counters for one engine's connection pool"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.checkout_timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def record_connect(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def snapshot(self, pool) -> dict:
+        with self._lock:
+            data = {
+                "connections_opened": self.connections_opened,
+                "checkouts": self.checkouts,
+                "checkout_timeouts": self.checkout_timeouts,
+                "wait_avg_ms": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+            }
+        data["pool_class"] = type(pool).__name__
+        if isinstance(pool, QueuePool):
+            data.update({
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+            })
+        return data
+
+
+_pool_stats = {}
+
+
+def _instrumented_pool_class(base, stats: PoolStats):
+    """Subclass of ``base`` timing how long each checkout waits for a connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = base._do_get(self)
+        except Exception:
+            stats.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        stats.record_wait(time.perf_counter() - start)
+        return connection
+
+    # recreate() on dispose instantiates self.__class__, so the stats survive
+    return type(f"Instrumented{base.__name__}", (base,), {"stats": stats, "_do_get": _do_get})
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+# Statements that make every transaction on a connection read-only
+READ_ONLY_STATEMENTS = {
+    "sqlite": "PRAGMA query_only=ON",
+    "postgresql": "SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY",
+    "mysql": "SET SESSION TRANSACTION READ ONLY",
+}
+
+
+def _engine_options(url, async_driver: bool, name: str) -> dict:
+    options = {}
+    if url.get_backend_name() == "sqlite":
+        if not async_driver:
+            options["connect_args"] = {"check_same_thread": False}  # Required for SQLite
+        if _is_memory_sqlite(url):
+            # Every connection to :memory: is a separate database
+            options["poolclass"] = StaticPool
+            return options
+    stats = _pool_stats.setdefault(name, PoolStats(name))
+    base = AsyncAdaptedQueuePool if async_driver else QueuePool
+    options["poolclass"] = _instrumented_pool_class(base, stats)
+    options.update(POOL_SETTINGS)
+    return options
+
+
+_pool_engines = {}
+
+
+def _attach_listeners(sync_engine, name: str, read_only: bool = False):
+    dialect = sync_engine.dialect.name
+    instrument_engine(sync_engine)
+    slow_query_log.attach(sync_engine)
+    db_activity.attach(sync_engine, read_only)
+    # immutable=1 files (backup snapshots) cannot take journal or vacuum settings
+    if dialect == "sqlite" and sync_engine.url.query.get("immutable") != "1":
+        event.listen(sync_engine, "connect", _set_sqlite_pragmas)
+    if read_only:
+        statement = READ_ONLY_STATEMENTS[dialect]
+
+        def mark_read_only(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute(statement)
+            cursor.close()
+
+        event.listen(sync_engine, "connect", mark_read_only)
+    stats = _pool_stats.get(name)
+    if stats is not None:
+        event.listen(sync_engine, "connect", lambda *args: stats.record_connect())
+        _pool_engines[name] = sync_engine
+
+
+def create_db_engine(url: str = DATABASE_URL, name: str = "sync", read_only: bool = False, **kwargs):
+    """Build a sync engine with the configured pool settings and pragmas"""
+    parsed = make_url(url)
+    engine = create_engine(url, **{**_engine_options(parsed, False, name), **kwargs})
+    _attach_listeners(engine, name, read_only)
+    return engine
+
+
+def create_async_db_engine(url: str = DATABASE_URL, name: str = "async", read_only: bool = False, **kwargs):
+    """Async counterpart of ``create_db_engine``, takes the same sync-style URL"""
+    parsed = make_url(to_async_url(url))
+    engine = create_async_engine(parsed, **{**_engine_options(parsed, True, name), **kwargs})
+    _attach_listeners(engine.sync_engine, name, read_only)
+    return engine
+
+
+def get_pool_stats() -> dict:
+    return {
+        name: _pool_stats[name].snapshot(sync_engine.pool)
+        for name, sync_engine in _pool_engines.items()
+    }
+
+
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_db_engine()
+# expire_on_commit=False keeps committed objects readable after the await,
+# attribute access on an expired instance would need IO outside the session
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+IS_SQLITE = make_url(DATABASE_URL).get_backend_name() == "sqlite"
+
+# Read-only pool for GET endpoints. On SQLite in WAL mode readers never block
+# the writer, and query_only guarantees nothing on this path takes the lock.
+read_engine = create_async_db_engine(name="read", read_only=True)
+
+# Replica engines for GET endpoints, all connections read-only
+replica_engines = [
+    create_async_db_engine(url, name=f"replica{index}", read_only=True)
+    for index, url in enumerate(DATABASE_REPLICA_URLS)
+]
+_next_replica = itertools.cycle(replica_engines) if replica_engines else None
+# How long a write may take to reach every replica; a client holding a
+# consistency token younger than this is pinned to the primary
+REPLICA_MAX_LAG = float(os.getenv("DATABASE_REPLICA_MAX_LAG", "2.0"))
+
+read_routing_stats = {"replica": 0, "primary_pinned": 0, "primary": 0}
+
+
+class RoutingSession(Session):
+    """
+    Session that reads from the engine picked for the request (``info["read_bind"]``)
+    and sends anything that writes - flushes and DML statements - to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or isinstance(clause, (Insert, Update, Delete)):
+            return async_engine.sync_engine
+        return self.info.get("read_bind", read_engine.sync_engine)
+
+
+AsyncRoutingSessionLocal = async_sessionmaker(
+    class_=AsyncSession, sync_session_class=RoutingSession, autoflush=False, expire_on_commit=False
+)
+
+
+def choose_read_engine(consistency_token=None):
+    """Round-robin over the replicas unless the caller must read its own writes"""
+    if _next_replica is None:
+        read_routing_stats["primary"] += 1
+        return read_engine
+    if requires_primary(consistency_token, REPLICA_MAX_LAG):
+        read_routing_stats["primary_pinned"] += 1
+        return read_engine
+    read_routing_stats["replica"] += 1
+    return next(_next_replica)
+
+
+# SQLite has a single writer anyway, so hot write paths go through one
+# dedicated connection fed by a queue instead of racing for the lock
+SINGLE_WRITER = _env_bool("DB_SINGLE_WRITER", IS_SQLITE)
+if SINGLE_WRITER:
+    writer_engine = create_async_db_engine(name="writer", pool_size=1, max_overflow=0)
+    AsyncWriteSessionLocal = async_sessionmaker(
+        writer_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+    )
+else:
+    writer_engine = async_engine
+    AsyncWriteSessionLocal = AsyncSessionLocal
+write_queue = WriteQueue(
+    AsyncWriteSessionLocal,
+    serialize=SINGLE_WRITER,
+    max_retries=_env_int("DB_WRITE_RETRIES", 5),
+)
+
 Base = declarative_base()
 
 def get_db():
@@ -24,3 +339,16 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_read_db(request: Request):
+    bind = choose_read_engine(request.headers.get(CONSISTENCY_HEADER))
+    async with AsyncRoutingSessionLocal(info={"read_bind": bind.sync_engine}) as db:
+        yield db
+
+async def dispose_engines():
+    await write_queue.close()
+    for eng in {async_engine, read_engine, writer_engine, *replica_engines}:
+        await eng.dispose()
@@ -0,0 +1,387 @@
+"""
+Database-per-tenant routing.
+
+Each organization's businesses, users and customers live in one tenant
+database ("shard"): its own SQLite file or database URL. Lock contention,
+table growth and index size then scale per tenant instead of globally.
+
+A small catalog database (TENANT_CATALOG_URL, defaults to DATABASE_URL)
+keeps what has to be global:
+
+- ``organizations``: allocates organization ids, which are what JWTs carry
+- ``tenant_shards``: the database each organization lives in
+- ``user_directory``: email -> organization, so login knows where to look
+
+Organizations without a ``tenant_shards`` row live in DATABASE_URL, which
+is where every tenant created before sharding was turned on still is. With
+TENANT_SHARDING on, new organizations get a database of their own from
+TENANT_SHARD_URL_TEMPLATE; shards are created and migrated on first use.
+
+Placements are cached for TENANT_PLACEMENT_TTL seconds. While
+``src/tools/rebalance.py`` moves a tenant its placement is write-fenced:
+``shard_for(..., write=True)`` raises ``TenantMoving`` and reads keep going
+to the old shard until the placement flips.
+"""
+import asyncio
+import os
+import time
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+from src.config.database import (
+    DATABASE_URL, async_engine, AsyncSessionLocal, AsyncRoutingSessionLocal,
+    choose_read_engine, create_async_db_engine, write_queue,
+)
+from src.migrations import runner, storage_layout
+from src.models.database import AdminUser, Organization, TenantShard, UserDirectory
+from src.utils.write_queue import WriteQueue
+
+TENANT_SHARDING = os.getenv("TENANT_SHARDING", "False").strip().lower() in ("1", "true", "yes", "on")
+TENANT_SHARD_URL_TEMPLATE = os.getenv("TENANT_SHARD_URL_TEMPLATE", "sqlite:///./shards/org_{organization_id}.db")
+TENANT_CATALOG_URL = os.getenv("TENANT_CATALOG_URL", DATABASE_URL)
+
+# Every open shard holds its own pools, keep them small
+SHARD_POOL_SETTINGS = {
+    "pool_size": int(os.getenv("TENANT_SHARD_POOL_SIZE", "2")),
+    "max_overflow": int(os.getenv("TENANT_SHARD_MAX_OVERFLOW", "3")),
+}
+SHARD_WRITE_RETRIES = int(os.getenv("DB_WRITE_RETRIES", "5"))
+# How stale a process's view of tenant placements (and write fences) can be
+TENANT_PLACEMENT_TTL = float(os.getenv("TENANT_PLACEMENT_TTL", "5"))
+
+
+class TenantMoving(Exception):
+    """Writes to the organization are fenced while it moves to another shard"""
+
+
+class Shard:
+    """Engines, sessions and write queue of one tenant database"""
+
+    def __init__(self, url: str, name: str, engine, read_engine, writer_engine, write_queue: WriteQueue):
+        self.url = url
+        self.name = name
+        self.engine = engine
+        self.read_engine = read_engine
+        self.writer_engine = writer_engine
+        self.write_queue = write_queue
+        self.session_factory = async_sessionmaker(
+            engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+        )
+        self.read_session_factory = async_sessionmaker(
+            read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+        )
+
+    def session(self) -> AsyncSession:
+        return self.session_factory()
+
+    def read_session(self, consistency_token=None) -> AsyncSession:
+        return self.read_session_factory()
+
+    async def dispose(self):
+        await self.write_queue.close()
+        for engine in {self.engine, self.read_engine, self.writer_engine}:
+            await engine.dispose()
+
+
+class DefaultShard(Shard):
+    """DATABASE_URL, served by the engines (and replicas) in ``src.config.database``"""
+
+    def __init__(self):
+        self.url = DATABASE_URL
+        self.name = "default"
+        self.engine = async_engine
+        self.write_queue = write_queue
+        self.session_factory = AsyncSessionLocal
+
+    def read_session(self, consistency_token=None) -> AsyncSession:
+        bind = choose_read_engine(consistency_token)
+        return AsyncRoutingSessionLocal(info={"read_bind": bind.sync_engine})
+
+    async def dispose(self):
+        pass  # dispose_engines() owns these
+
+
+default_shard = DefaultShard()
+
+# Catalog writes go through a write queue like tenant writes: DATABASE_URL's
+# own when the catalog lives there, so they share its single writer
+if TENANT_CATALOG_URL == DATABASE_URL:
+    catalog_engine = async_engine
+    catalog_writer_engine = None
+    catalog_write_queue = write_queue
+else:
+    catalog_engine = create_async_db_engine(TENANT_CATALOG_URL, name="catalog")
+    if make_url(TENANT_CATALOG_URL).get_backend_name() == "sqlite":
+        catalog_writer_engine = create_async_db_engine(
+            TENANT_CATALOG_URL, name="catalog-writer", pool_size=1, max_overflow=0
+        )
+    else:
+        catalog_writer_engine = catalog_engine
+    catalog_write_queue = WriteQueue(
+        async_sessionmaker(catalog_writer_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False),
+        serialize=catalog_writer_engine is not catalog_engine,
+        max_retries=SHARD_WRITE_RETRIES,
+    )
+CatalogSessionLocal = async_sessionmaker(
+    catalog_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+_shards = {DATABASE_URL: default_shard}
+_shard_locks = {}
+# organization_id -> (shard URL, write fenced, expires at), from tenant_shards
+_placements = {}
+
+
+async def get_catalog_db():
+    async with CatalogSessionLocal() as db:
+        yield db
+
+
+def new_tenant_url(organization_id: int) -> str:
+    """Where a newly created organization's data goes"""
+    if not TENANT_SHARDING:
+        return DATABASE_URL
+    return TENANT_SHARD_URL_TEMPLATE.format(organization_id=organization_id)
+
+
+def migrate_shard(url: str):
+    """Create (for SQLite files) and migrate a tenant database, blocking"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database not in (None, "", ":memory:"):
+        os.makedirs(os.path.dirname(os.path.abspath(parsed.database)), exist_ok=True)
+    engine = create_engine(url, poolclass=NullPool)
+    try:
+        runner.upgrade(engine, catalog=False)
+        storage_layout.apply_to(engine)
+    finally:
+        engine.dispose()
+
+
+async def open_shard(url: str) -> Shard:
+    """The shard for ``url``, migrating it and opening its pools on first use"""
+    shard = _shards.get(url)
+    if shard is not None:
+        return shard
+    lock = _shard_locks.setdefault(url, asyncio.Lock())
+    async with lock:
+        shard = _shards.get(url)
+        if shard is None:
+            await asyncio.to_thread(migrate_shard, url)
+            name = f"shard{len(_shards)}"
+            engine = create_async_db_engine(url, name=name, **SHARD_POOL_SETTINGS)
+            read_engine = create_async_db_engine(url, name=f"{name}-read", read_only=True, **SHARD_POOL_SETTINGS)
+            serialize = make_url(url).get_backend_name() == "sqlite"
+            if serialize:
+                writer = create_async_db_engine(url, name=f"{name}-writer", pool_size=1, max_overflow=0)
+            else:
+                writer = engine
+            queue = WriteQueue(
+                async_sessionmaker(writer, class_=AsyncSession, autoflush=False, expire_on_commit=False),
+                serialize=serialize,
+                max_retries=SHARD_WRITE_RETRIES,
+            )
+            shard = _shards[url] = Shard(url, name, engine, read_engine, writer, queue)
+    return shard
+
+
+def _remember_placement(organization_id: int, url: str, fenced: bool = False):
+    _placements[organization_id] = (url, fenced, time.monotonic() + TENANT_PLACEMENT_TTL)
+
+
+async def shard_for(organization_id: int, write: bool = False) -> Shard:
+    """
+    The shard holding ``organization_id``'s data. With ``write`` set, raises
+    ``TenantMoving`` while the tenant's writes are fenced.
+    """
+    placement = _placements.get(organization_id)
+    if placement is None or placement[2] <= time.monotonic():
+        async with CatalogSessionLocal() as db:
+            row = (await db.execute(
+                select(TenantShard.shard_url, TenantShard.write_fenced)
+                .where(TenantShard.organization_id == organization_id)
+            )).first()
+        if row is None:
+            _remember_placement(organization_id, DATABASE_URL)
+        else:
+            _remember_placement(organization_id, row.shard_url, bool(row.write_fenced))
+        placement = _placements[organization_id]
+    url, fenced, _ = placement
+    if write and fenced:
+        raise TenantMoving(organization_id)
+    return await open_shard(url)
+
+
+def forget_placement(organization_id: int):
+    """Drop a cached placement, e.g. after the tenant moved to another shard"""
+    _placements.pop(organization_id, None)
+
+
+async def create_organization(**fields) -> Organization:
+    """
+    Allocate an organization in the catalog and set up its tenant database.
+
+    The catalog row is committed first (it hands out the id); the tenant
+    database then gets a copy of the row for its foreign keys. Both writes
+    go through their database's write queue.
+    """
+    async def allocate(catalog_db: AsyncSession):
+        organization = Organization(**fields)
+        catalog_db.add(organization)
+        await catalog_db.flush()
+        url = new_tenant_url(organization.id)
+        if url != DATABASE_URL:
+            catalog_db.add(TenantShard(organization_id=organization.id, shard_url=url))
+        await catalog_db.commit()
+        await catalog_db.refresh(organization)
+        return organization, url
+
+    organization, url = await catalog_write_queue.submit(allocate)
+    _remember_placement(organization.id, url)
+
+    shard = await open_shard(url)
+    if shard.url != TENANT_CATALOG_URL:
+        async def copy(db: AsyncSession):
+            db.add(Organization(**{
+                column.key: getattr(organization, column.key) for column in Organization.__table__.columns
+            }))
+            await db.commit()
+
+        async def release(catalog_db: AsyncSession):
+            await catalog_db.execute(TenantShard.__table__.delete().where(
+                TenantShard.organization_id == organization.id
+            ))
+            await catalog_db.execute(Organization.__table__.delete().where(Organization.id == organization.id))
+            await catalog_db.commit()
+
+        try:
+            await shard.write_queue.submit(copy)
+        except Exception:
+            await catalog_write_queue.submit(release)
+            forget_placement(organization.id)
+            raise
+    return organization
+
+
+async def update_organization(organization_id: int, **fields):
+    """Set ``fields`` on a live catalog organization, returns it or None"""
+    async def update(catalog_db: AsyncSession):
+        result = await catalog_db.execute(select(Organization).where(
+            Organization.id == organization_id,
+            Organization.deleted_at.is_(None),
+        ))
+        organization = result.scalars().first()
+        if organization is None:
+            return None
+        for field, value in fields.items():
+            setattr(organization, field, value)
+        await catalog_db.commit()
+        await catalog_db.refresh(organization)
+        return organization
+
+    return await catalog_write_queue.submit(update)
+
+
+async def sync_organization(organization: Organization):
+    """Copy a catalog organization's columns to its tenant database"""
+    shard = await shard_for(organization.id)
+    if shard.url == TENANT_CATALOG_URL:
+        return
+
+    async def sync(db: AsyncSession):
+        copy = await db.get(Organization, organization.id)
+        if copy is not None:
+            for column in Organization.__table__.columns:
+                setattr(copy, column.key, getattr(organization, column.key))
+            await db.commit()
+
+    await shard.write_queue.submit(sync)
+
+
+async def email_registered(catalog_db: AsyncSession, email: str) -> bool:
+    return await catalog_db.get(UserDirectory, email) is not None
+
+
+async def create_user(shard: Shard, **fields) -> AdminUser:
+    """
+    Create a user in its tenant database and list it in the login directory.
+
+    The directory row is inserted first, so two registrations racing for one
+    email cannot both succeed; returns None if the email is taken.
+    """
+    email = fields["email"]
+
+    async def reserve(catalog_db: AsyncSession) -> bool:
+        catalog_db.add(UserDirectory(email=email, organization_id=fields["organization_id"]))
+        try:
+            await catalog_db.commit()
+        except IntegrityError:
+            await catalog_db.rollback()
+            return False
+        return True
+
+    async def insert(db: AsyncSession) -> AdminUser:
+        user = AdminUser(**fields)
+        db.add(user)
+        await db.commit()
+        await db.refresh(user)
+        return user
+
+    if not await catalog_write_queue.submit(reserve):
+        return None
+    try:
+        user = await shard.write_queue.submit(insert)
+    except Exception:
+        await remove_user(email)
+        raise
+
+    async def link(catalog_db: AsyncSession):
+        entry = await catalog_db.get(UserDirectory, email)
+        entry.admin_user_id = user.id
+        await catalog_db.commit()
+
+    await catalog_write_queue.submit(link)
+    return user
+
+
+async def find_login(catalog_db: AsyncSession, email: str):
+    """Directory entry for ``email``, or None"""
+    entry = await catalog_db.get(UserDirectory, email)
+    if entry is None or entry.admin_user_id is None:
+        return None
+    return entry
+
+
+async def remove_user(email: str):
+    async def remove(catalog_db: AsyncSession):
+        await catalog_db.execute(UserDirectory.__table__.delete().where(UserDirectory.email == email))
+        await catalog_db.commit()
+
+    await catalog_write_queue.submit(remove)
+
+
+def shard_stats() -> dict:
+    stats = {
+        shard.name: {"url": make_url(url).render_as_string(hide_password=True), "write_queue": shard.write_queue.stats()}
+        for url, shard in _shards.items()
+    }
+    if catalog_write_queue is not write_queue:
+        stats["catalog"] = {
+            "url": make_url(TENANT_CATALOG_URL).render_as_string(hide_password=True),
+            "write_queue": catalog_write_queue.stats(),
+        }
+    return stats
+
+
+async def dispose_shards():
+    for url, shard in list(_shards.items()):
+        await shard.dispose()
+        if shard is not default_shard:
+            del _shards[url]
+    if catalog_engine is not async_engine:
+        await catalog_write_queue.close()
+        for engine in {catalog_engine, catalog_writer_engine}:
+            await engine.dispose()
@@ -1,15 +1,45 @@
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from src.routes import auth, organizations, customers, businesses, users
-from src.config.database import engine, Base
+from src.routes import auth, organizations, customers, businesses, users, metrics, me
+from src.config.database import MAINTENANCE_ENABLED, dispose_engines, maintenance_scheduler
+from src.config.sharding import dispose_shards
+from src.utils.consistency import ConsistencyTokenMiddleware, CONSISTENCY_HEADER
+from src.utils.sql_metrics import SqlMetricsMiddleware, SQL_HEADERS
+from src.utils.auth import password_pool
+from src.utils.purge import purger
+from src.utils.warmup import STARTUP_WARMUP, warm_up
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+# Schema changes are applied by `python -m src.migrations upgrade`, not on import;
+# importing this module opens no connections
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if STARTUP_WARMUP:
+        logger.info("startup warm-up (ms): %s", await warm_up(app))
+    if MAINTENANCE_ENABLED:
+        maintenance_scheduler.start()
+    # Finish deletes a previous process accepted but did not purge
+    await purger.resume()
+    try:
+        yield
+    finally:
+        await maintenance_scheduler.stop()
+        await purger.shutdown()
+        await password_pool.shutdown()
+        # Drain the write queue and close pooled aiosqlite connections, their
+        # worker threads keep the process alive otherwise
+        await dispose_shards()
+        await dispose_engines()
 
 app = FastAPI(
     title="Rewards & Ads API",
     description="Multi-tenant backend API for rewards and optspot systems",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -19,7 +49,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[CONSISTENCY_HEADER, *SQL_HEADERS],
 )
+app.add_middleware(ConsistencyTokenMiddleware)
+# Statement count/DB time per request: X-DB-* headers with DEBUG on,
+# per-route totals at /api/metrics/sql either way
+app.add_middleware(SqlMetricsMiddleware)
 
 # Include routers
 app.include_router(auth.router)
@@ -27,6 +62,8 @@ app.include_router(organizations.router)
 app.include_router(users.router)
 app.include_router(businesses.router)
 app.include_router(customers.router)
+app.include_router(metrics.router)
+app.include_router(me.router)
 
 @app.get("/health")
 async def health_check():
@@ -0,0 +1,104 @@
+import argparse
+import sys
+
+from sqlalchemy import create_engine, func, insert, select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+
+from src.config.database import DATABASE_URL, engine
+from src.config.sharding import TENANT_CATALOG_URL, migrate_shard
+from src.migrations import runner, storage_layout
+from src.models.database import AdminUser, Organization, TenantShard, UserDirectory
+
+
+def backfill_catalog(catalog_engine) -> tuple:
+    """
+    Copy DATABASE_URL's organizations and sign-in emails into a separate
+    catalog. Migration 0003 fills the directory from the catalog's own
+    admin_users, which is empty when the catalog is another database; the
+    tenants already in DATABASE_URL stay there (no tenant_shards row).
+    """
+    with engine.connect() as source:
+        organizations = [dict(row) for row in source.execute(select(Organization.__table__)).mappings()]
+        users = source.execute(select(AdminUser.email, AdminUser.organization_id, AdminUser.id)).all()
+    with catalog_engine.begin() as catalog:
+        known_orgs = set(catalog.execute(select(Organization.id)).scalars())
+        known_emails = set(catalog.execute(select(UserDirectory.email)).scalars())
+        new_orgs = [row for row in organizations if row["id"] not in known_orgs]
+        new_users = [
+            {"email": email, "organization_id": organization_id, "admin_user_id": user_id}
+            for email, organization_id, user_id in users if email not in known_emails
+        ]
+        if new_orgs:
+            catalog.execute(insert(Organization.__table__), new_orgs)
+            if catalog.dialect.name == "postgresql":
+                # Explicit ids leave the sequence behind; new organizations must not reuse them
+                catalog.execute(text("SELECT setval(pg_get_serial_sequence('organizations', 'id'), :last)"),
+                                {"last": catalog.execute(select(func.max(Organization.id))).scalar()})
+        if new_users:
+            catalog.execute(insert(UserDirectory.__table__), new_users)
+    return len(new_orgs), len(new_users)
+
+
+def upgrade_all(explain: bool) -> int:
+    """Migrate the catalog, then DATABASE_URL and every tenant shard it lists"""
+    catalog_engine = engine if TENANT_CATALOG_URL == DATABASE_URL else create_engine(TENANT_CATALOG_URL, poolclass=NullPool)
+    try:
+        applied = runner.upgrade(catalog_engine, explain_plans=explain)
+        print(f"{len(applied)} migration(s) applied to catalog {catalog_engine.url.render_as_string(hide_password=True)}")
+        storage_layout.apply_to(catalog_engine)
+        with catalog_engine.connect() as connection:
+            shard_urls = set(connection.execute(select(TenantShard.shard_url).distinct()).scalars())
+    finally:
+        if catalog_engine is not engine:
+            catalog_engine.dispose()
+    if TENANT_CATALOG_URL != DATABASE_URL:
+        shard_urls.add(DATABASE_URL)
+    for url in sorted(shard_urls - {TENANT_CATALOG_URL}):
+        migrate_shard(url)
+        print(f"Tenant shard {make_url(url).render_as_string(hide_password=True)} is up to date")
+    if TENANT_CATALOG_URL != DATABASE_URL:
+        catalog_engine = create_engine(TENANT_CATALOG_URL, poolclass=NullPool)
+        try:
+            organizations, users = backfill_catalog(catalog_engine)
+        finally:
+            catalog_engine.dispose()
+        print(f"Catalog backfilled with {organizations} organization(s) and {users} user(s) from DATABASE_URL")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.migrations", description="Database schema migrations")
+    commands = parser.add_subparsers(dest="command", required=True)
+    upgrade_parser = commands.add_parser("upgrade", help="apply pending migrations")
+    upgrade_parser.add_argument("--explain", action="store_true",
+                                help="print each migration's plan checks before and after applying it")
+    commands.add_parser("status", help="list applied and pending migrations")
+    commands.add_parser("check-plans", help="fail if a migration's plan checks no longer use their index")
+    commands.add_parser("layout", help="show the storage layout of the hot tables (see STORAGE_LAYOUT)")
+    args = parser.parse_args(argv)
+
+    if args.command == "upgrade":
+        return upgrade_all(args.explain)
+    elif args.command == "status":
+        pending = {module.revision for module in runner.pending_migrations(engine)}
+        for module in runner.load_migrations():
+            state = "pending" if module.revision in pending else "applied"
+            print(f"{module.revision}  {state:8} {module.description}")
+    elif args.command == "check-plans":
+        failures = runner.check_plans(engine)
+        for failure in failures:
+            print(f"FAIL {failure}")
+        if failures:
+            return 1
+        print("All plan checks use their index")
+    elif args.command == "layout":
+        with engine.connect() as connection:
+            for table, layout in storage_layout.current_layout(connection).items():
+                print(f"{table:16} {layout}")
+        print(f"STORAGE_LAYOUT={storage_layout.STORAGE_LAYOUT}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
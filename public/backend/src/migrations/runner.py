@@ -0,0 +1,140 @@
+"""
+Versioned schema migrations.
+
+Each module in ``src/migrations/versions`` declares a ``revision`` string,
+a ``description`` and an ``upgrade(connection)`` function. Revisions are
+applied in order, each in its own transaction, and recorded in the
+``schema_migrations`` table. Run them before starting the app:
+
+    python -m src.migrations upgrade
+
+Migrations that set ``catalog_only = True`` create the tenant catalog
+tables (see ``src/config/sharding.py``); on a tenant shard they are recorded
+as applied without running.
+
+The optional clustered layout for the hot tables is not a migration but a
+setting applied after them, see ``src/migrations/storage_layout.py``.
+
+A migration can also list ``PLAN_CHECKS``: queries that must use a given
+index once it is applied. ``upgrade --explain`` prints their query plans
+before and after the migration, and ``check-plans`` asserts them against
+the current database.
+"""
+import importlib
+import pkgutil
+from dataclasses import dataclass, field
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from src.migrations import storage_layout, versions
+
+MIGRATIONS_TABLE = "schema_migrations"
+
+
+@dataclass
+class PlanCheck:
+    """A query that must be served by ``index`` once its migration has run"""
+    index: str
+    sql: str
+    params: dict = field(default_factory=dict)
+
+
+def load_migrations() -> list:
+    modules = [
+        importlib.import_module(f"{versions.__name__}.{info.name}")
+        for info in pkgutil.iter_modules(versions.__path__)
+    ]
+    return sorted(modules, key=lambda module: module.revision)
+
+
+def _ensure_migrations_table(connection: Connection):
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ("
+        " revision VARCHAR(32) PRIMARY KEY,"
+        " description VARCHAR(255),"
+        " applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    ))
+
+
+def applied_revisions(connection: Connection) -> set:
+    if not inspect(connection).has_table(MIGRATIONS_TABLE):
+        return set()
+    return set(connection.execute(text(f"SELECT revision FROM {MIGRATIONS_TABLE}")).scalars())
+
+
+def pending_migrations(engine: Engine) -> list:
+    with engine.connect() as connection:
+        applied = applied_revisions(connection)
+    return [module for module in load_migrations() if module.revision not in applied]
+
+
+def explain(connection: Connection, sql: str, params: dict) -> list:
+    """Query plan lines for ``sql`` on the connection's backend"""
+    if connection.dialect.name == "sqlite":
+        rows = connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params)
+        return [row[-1] for row in rows]
+    return [row[0] for row in connection.execute(text(f"EXPLAIN {sql}"), params)]
+
+
+def _print_plans(connection: Connection, module, label: str):
+    for check in getattr(module, "PLAN_CHECKS", []):
+        print(f"  [{label}] {check.index}: {check.sql}")
+        for line in explain(connection, check.sql, check.params):
+            print(f"      {line}")
+
+
+def upgrade(engine: Engine, explain_plans: bool = False, catalog: bool = True) -> list:
+    """Apply every pending migration, returns the revisions applied"""
+    applied = []
+    for module in pending_migrations(engine):
+        with engine.begin() as connection:
+            _ensure_migrations_table(connection)
+            print(f"Applying {module.revision}: {module.description}")
+            if explain_plans:
+                _print_plans(connection, module, "before")
+            if catalog or not getattr(module, "catalog_only", False):
+                module.upgrade(connection)
+            if explain_plans:
+                _print_plans(connection, module, "after")
+            connection.execute(
+                text(f"INSERT INTO {MIGRATIONS_TABLE} (revision, description) VALUES (:revision, :description)"),
+                {"revision": module.revision, "description": module.description},
+            )
+        applied.append(module.revision)
+    return applied
+
+
+def check_plans(engine: Engine) -> list:
+    """Returns a description of every plan check whose index is not used"""
+    failures = []
+    with engine.connect() as connection:
+        applied = applied_revisions(connection)
+        for module in load_migrations():
+            if module.revision not in applied:
+                continue
+            for check in getattr(module, "PLAN_CHECKS", []):
+                plan = explain(connection, check.sql, check.params)
+                # A clustered storage layout serves some checks from its own index
+                accepted = [check.index, *storage_layout.replacements(check.index)]
+                if not any(name in line for line in plan for name in accepted):
+                    failures.append(f"{module.revision} {check.index} not used by: {check.sql}\n    " + "\n    ".join(plan))
+    return failures
+
+
+# Helpers for migration modules. They inspect first so a migration can run
+# against databases that were created by the old create_all() on startup.
+
+def has_column(connection: Connection, table: str, column: str) -> bool:
+    return any(col["name"] == column for col in inspect(connection).get_columns(table))
+
+
+def has_index(connection: Connection, table: str, name: str) -> bool:
+    return any(index["name"] == name for index in inspect(connection).get_indexes(table))
+
+
+def create_index(connection: Connection, name: str, table: str, columns: list, unique: bool = False):
+    if has_index(connection, table, name):
+        return
+    unique_sql = "UNIQUE " if unique else ""
+    connection.execute(text(f"CREATE {unique_sql}INDEX {name} ON {table} ({', '.join(columns)})"))
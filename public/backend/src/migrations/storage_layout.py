@@ -0,0 +1,147 @@
+"""
+Optional storage layouts for the tenant-scoped hot tables.
+
+``default`` stores customers and business_users in rowid order, i.e. the
+order rows were inserted in, so one organization's rows are spread across
+the whole table and paging through them touches a page for every row or
+two.
+
+``clustered`` adds an index keyed by the tenant column and ``id`` that
+carries every other column as well. Tenant-scoped scans are answered from
+that index alone, with the tenant's rows packed into adjacent pages: the
+read pattern of a table clustered on ``(organization_id, id)``. SQLite
+``WITHOUT ROWID`` tables would give the same without a second copy of
+each row, but they cannot allocate ``INTEGER PRIMARY KEY`` ids, which the
+models and every insert rely on. Writes pay for that second copy.
+
+Without statistics SQLite's planner also prefers the covering index for
+the (organization_id, phone_number) lookup, so applying the layout runs
+ANALYZE; keep statistics fresh as tenants grow (``PRAGMA optimize``).
+
+On Postgres the key columns are indexed with the rest as INCLUDE columns,
+and the table is CLUSTERed on the index once (an exclusive lock while it
+rewrites); later inserts are not kept in order until the next CLUSTER.
+
+STORAGE_LAYOUT picks the layout. ``python -m src.migrations upgrade``
+applies it after migrating each database, new tenant shards get it when
+they are created, and ``python -m src.migrations layout`` shows what
+DATABASE_URL has.
+"""
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+STORAGE_LAYOUT = os.getenv("STORAGE_LAYOUT", "default").strip().lower()
+LAYOUTS = ("default", "clustered")
+
+
+@dataclass
+class ClusteredIndex:
+    name: str
+    table: str
+    key: list
+    # Plain index from the hot-path pack that this one makes redundant
+    replaces: Optional[str] = None
+
+
+CLUSTERED_INDEXES = [
+    # GET /api/customers/ pages through one organization's customers in id order
+    ClusteredIndex("cx_customers_org_id", "customers", ["organization_id", "id"], replaces="ix_customers_org_id"),
+    # GET /api/businesses/{id}/users and the business_users loads of GET /api/businesses/{id}
+    ClusteredIndex("cx_business_users_business_id", "business_users", ["business_id", "id"]),
+]
+
+
+def replacements(index_name: str) -> list:
+    """Clustered indexes that serve the queries of ``index_name`` once applied"""
+    return [index.name for index in CLUSTERED_INDEXES if index.replaces == index_name]
+
+
+def _indexes(connection: Connection, table: str) -> dict:
+    return {index["name"]: index for index in inspect(connection).get_indexes(table)}
+
+
+def _carried_columns(connection: Connection, index: ClusteredIndex) -> list:
+    # Read from the database rather than the models, so the index keeps
+    # covering columns added by later migrations once re-applied
+    return [column["name"] for column in inspect(connection).get_columns(index.table) if column["name"] not in index.key]
+
+
+def _is_current(existing: dict, index: ClusteredIndex, carried: list, dialect: str) -> bool:
+    if dialect == "postgresql":
+        included = existing.get("include_columns") or existing.get("dialect_options", {}).get("postgresql_include", [])
+        return existing["column_names"] == index.key and list(included) == carried
+    return existing["column_names"] == index.key + carried
+
+
+def _create_clustered(connection: Connection, index: ClusteredIndex, carried: list):
+    if connection.dialect.name == "postgresql":
+        connection.execute(text(
+            f"CREATE INDEX {index.name} ON {index.table} ({', '.join(index.key)}) INCLUDE ({', '.join(carried)})"
+        ))
+        connection.execute(text(f"CLUSTER {index.table} USING {index.name}"))
+    else:
+        connection.execute(text(f"CREATE INDEX {index.name} ON {index.table} ({', '.join(index.key + carried)})"))
+
+
+def current_layout(connection: Connection) -> dict:
+    """table -> "clustered", "stale" (misses columns added since) or "default" """
+    layout = {}
+    for index in CLUSTERED_INDEXES:
+        existing = _indexes(connection, index.table).get(index.name)
+        if existing is None:
+            layout[index.table] = "default"
+        elif _is_current(existing, index, _carried_columns(connection, index), connection.dialect.name):
+            layout[index.table] = "clustered"
+        else:
+            layout[index.table] = "stale"
+    return layout
+
+
+def apply_layout(connection: Connection, layout: str = STORAGE_LAYOUT) -> list:
+    """Create or drop the clustered indexes; returns a line per change made"""
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown STORAGE_LAYOUT {layout!r}, expected one of {', '.join(LAYOUTS)}")
+    dialect = connection.dialect.name
+    if layout == "clustered" and dialect not in ("sqlite", "postgresql"):
+        raise ValueError(f"The clustered layout is not implemented for {dialect}")
+
+    # The replaced plain indexes are only known by name; their definitions
+    # live in the migration that created them
+    from src.migrations.versions.v0002_hot_path_indexes import INDEXES
+
+    plain = {name: (table, columns) for name, table, columns, _ in INDEXES}
+    changes = []
+    for index in CLUSTERED_INDEXES:
+        existing = _indexes(connection, index.table)
+        if layout == "clustered":
+            carried = _carried_columns(connection, index)
+            if index.name in existing and not _is_current(existing[index.name], index, carried, dialect):
+                connection.execute(text(f"DROP INDEX {index.name}"))
+                del existing[index.name]
+            if index.name not in existing:
+                _create_clustered(connection, index, carried)
+                changes.append(f"created {index.name} on {index.table}")
+                if dialect == "sqlite":
+                    connection.execute(text(f"ANALYZE {index.table}"))
+            if index.replaces in existing:
+                connection.execute(text(f"DROP INDEX {index.replaces}"))
+                changes.append(f"dropped {index.replaces}")
+        else:
+            if index.name in existing:
+                connection.execute(text(f"DROP INDEX {index.name}"))
+                changes.append(f"dropped {index.name}")
+            if index.replaces and index.replaces not in existing:
+                table, columns = plain[index.replaces]
+                connection.execute(text(f"CREATE INDEX {index.replaces} ON {table} ({', '.join(columns)})"))
+                changes.append(f"created {index.replaces} on {table}")
+    return changes
+
+
+def apply_to(engine: Engine, layout: str = STORAGE_LAYOUT):
+    with engine.begin() as connection:
+        for change in apply_layout(connection, layout):
+            print(f"  [{layout} layout] {change}")
@@ -0,0 +1,90 @@
+"""Baseline schema, as previously created by Base.metadata.create_all() on startup"""
+from sqlalchemy import (
+    MetaData, Table, Column, Integer, String, Boolean, ForeignKey, Text, TIMESTAMP,
+    CheckConstraint, text,
+)
+from sqlalchemy.sql import func
+
+from src.migrations.runner import has_column
+
+revision = "0001"
+description = "initial schema"
+
+# Snapshot of the tables at this revision; later revisions alter them
+# instead of editing this file.
+metadata = MetaData()
+
+Table(
+    "organizations", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String(255), nullable=False),
+    Column("address", Text),
+    Column("industry_type", String(100)),
+    Column("logo_url", Text),
+    Column("billing_plan", String(50)),
+    Column("created_at", TIMESTAMP, server_default=func.now()),
+    Column("updated_at", TIMESTAMP, server_default=func.now()),
+    CheckConstraint("billing_plan IN ('free', 'basic', 'pro')", name="check_billing_plan"),
+)
+
+Table(
+    "admin_users", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("organization_id", Integer, ForeignKey("organizations.id", ondelete="CASCADE"), nullable=False),
+    Column("email", String(255), nullable=False, unique=True),
+    Column("password_hash", String(255), nullable=False),
+    Column("role", String(50)),
+    Column("is_active", Boolean),
+    Column("created_at", TIMESTAMP, server_default=func.now()),
+    Column("updated_at", TIMESTAMP, server_default=func.now()),
+    CheckConstraint("role IN ('owner', 'manager', 'staff')", name="check_role"),
+)
+
+Table(
+    "businesses", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("organization_id", Integer, ForeignKey("organizations.id", ondelete="CASCADE"), nullable=False),
+    Column("name", String(255), nullable=False),
+    Column("address", Text),
+    Column("industry_type", String(100)),
+    Column("logo_url", Text),
+    Column("created_at", TIMESTAMP, server_default=func.now()),
+    Column("updated_at", TIMESTAMP, server_default=func.now()),
+)
+
+Table(
+    "business_users", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("business_id", Integer, ForeignKey("businesses.id", ondelete="CASCADE"), nullable=False),
+    Column("admin_user_id", Integer, ForeignKey("admin_users.id", ondelete="CASCADE"), nullable=False),
+    Column("role", String(50)),
+    Column("created_at", TIMESTAMP, server_default=func.now()),
+    Column("updated_at", TIMESTAMP, server_default=func.now()),
+    CheckConstraint("role IN ('owner', 'manager', 'staff')", name="check_business_user_role"),
+)
+
+Table(
+    "customers", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("organization_id", Integer, ForeignKey("organizations.id", ondelete="CASCADE"), nullable=False),
+    Column("business_id", Integer, ForeignKey("businesses.id", ondelete="CASCADE"), nullable=True),
+    Column("phone_number", String(20)),
+    Column("name", String(255)),
+    Column("email", String(255)),
+    Column("points", Integer),
+    Column("visits", Integer),
+    Column("created_at", TIMESTAMP, server_default=func.now()),
+    Column("updated_at", TIMESTAMP, server_default=func.now()),
+)
+
+
+def upgrade(connection):
+    metadata.create_all(connection, checkfirst=True)
+
+    # customers.business_id was added to the model after some databases had
+    # already been created, and create_all() never altered existing tables
+    if not has_column(connection, "customers", "business_id"):
+        connection.execute(text(
+            "ALTER TABLE customers ADD COLUMN business_id INTEGER "
+            "REFERENCES businesses (id) ON DELETE CASCADE"
+        ))
@@ -0,0 +1,60 @@
+"""Composite indexes for the tenant-scoped queries the routes actually run"""
+from sqlalchemy import text
+
+from src.migrations.runner import PlanCheck, create_index
+
+revision = "0002"
+description = "hot-path indexes for tenant-scoped lookups"
+
+# (name, table, columns, unique)
+INDEXES = [
+    # GET /api/customers/ pages through one organization's customers in id order
+    ("ix_customers_org_id", "customers", ["organization_id", "id"], False),
+    # kiosk check-in looks a customer up by phone within the organization
+    ("ix_customers_org_phone", "customers", ["organization_id", "phone_number"], False),
+    # cascades and per-branch lookups when a business is deleted
+    ("ix_customers_business_id", "customers", ["business_id"], False),
+    # GET /api/businesses/ for org owners
+    ("ix_businesses_org_id", "businesses", ["organization_id", "id"], False),
+    # GET /api/users/ and the "last owner" count in DELETE /api/users/{id}
+    ("ix_admin_users_org_role", "admin_users", ["organization_id", "role"], False),
+    # one assignment per (business, user); also serves GET /businesses/{id}/users
+    ("uq_business_users_business_user", "business_users", ["business_id", "admin_user_id"], True),
+    # GET /api/businesses/ for non-owners joins on the user's assignments
+    ("ix_business_users_admin_user", "business_users", ["admin_user_id", "business_id"], False),
+]
+
+PLAN_CHECKS = [
+    PlanCheck("ix_customers_org_id",
+              "SELECT * FROM customers WHERE organization_id = :org_id ORDER BY id LIMIT 100 OFFSET 0",
+              {"org_id": 1}),
+    PlanCheck("ix_customers_org_phone",
+              "SELECT * FROM customers WHERE organization_id = :org_id AND phone_number = :phone",
+              {"org_id": 1, "phone": "5550000000"}),
+    PlanCheck("ix_customers_business_id",
+              "SELECT id FROM customers WHERE business_id = :business_id",
+              {"business_id": 1}),
+    PlanCheck("ix_businesses_org_id",
+              "SELECT * FROM businesses WHERE organization_id = :org_id",
+              {"org_id": 1}),
+    PlanCheck("ix_admin_users_org_role",
+              "SELECT count(*) FROM admin_users WHERE organization_id = :org_id AND role = 'owner'",
+              {"org_id": 1}),
+    PlanCheck("uq_business_users_business_user",
+              "SELECT * FROM business_users WHERE business_id = :business_id AND admin_user_id = :user_id",
+              {"business_id": 1, "user_id": 1}),
+    PlanCheck("ix_business_users_admin_user",
+              "SELECT business_id FROM business_users WHERE admin_user_id = :user_id",
+              {"user_id": 1}),
+]
+
+
+def upgrade(connection):
+    # Nothing stopped duplicate assignments before the unique index existed;
+    # keep the oldest row of each (business, user) pair
+    connection.execute(text(
+        "DELETE FROM business_users WHERE id NOT IN ("
+        " SELECT MIN(id) FROM business_users GROUP BY business_id, admin_user_id)"
+    ))
+    for name, table, columns, unique in INDEXES:
+        create_index(connection, name, table, columns, unique=unique)
@@ -0,0 +1,37 @@
+"""Catalog tables for database-per-tenant sharding"""
+from sqlalchemy import MetaData, Table, Column, Integer, String, Text, TIMESTAMP, text
+from sqlalchemy.sql import func
+
+revision = "0003"
+description = "tenant shard placements and login directory"
+# Only the catalog database gets these tables; tenant shards skip it
+catalog_only = True
+
+metadata = MetaData()
+
+Table(
+    "tenant_shards", metadata,
+    Column("organization_id", Integer, primary_key=True, autoincrement=False),
+    Column("shard_url", Text, nullable=False),
+    Column("created_at", TIMESTAMP, server_default=func.now()),
+    Column("updated_at", TIMESTAMP, server_default=func.now()),
+)
+
+Table(
+    "user_directory", metadata,
+    Column("email", String(255), primary_key=True),
+    Column("organization_id", Integer, nullable=False),
+    Column("admin_user_id", Integer),
+    Column("created_at", TIMESTAMP, server_default=func.now()),
+)
+
+
+def upgrade(connection):
+    metadata.create_all(connection, checkfirst=True)
+    # Every existing tenant lives in this database, so the directory starts
+    # as a copy of its admin_users (a separate catalog has none; upgrade_all
+    # backfills it from DATABASE_URL)
+    connection.execute(text(
+        "INSERT INTO user_directory (email, organization_id, admin_user_id) "
+        "SELECT email, organization_id, id FROM admin_users"
+    ))
@@ -0,0 +1,12 @@
+"""Write fence flag on tenant placements, set while a tenant moves between shards"""
+from sqlalchemy import text
+
+revision = "0004"
+description = "write fence on tenant shard placements"
+catalog_only = True
+
+
+def upgrade(connection):
+    connection.execute(text(
+        "ALTER TABLE tenant_shards ADD COLUMN write_fenced BOOLEAN NOT NULL DEFAULT FALSE"
+    ))
@@ -0,0 +1,11 @@
+"""Per-user token version, bumped to revoke every token issued to the user so far"""
+from sqlalchemy import text
+
+revision = "0005"
+description = "token_version on admin_users"
+
+
+def upgrade(connection):
+    connection.execute(text(
+        "ALTER TABLE admin_users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0"
+    ))
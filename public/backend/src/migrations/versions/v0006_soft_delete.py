@@ -0,0 +1,16 @@
+"""Soft-delete markers for businesses and organizations, purged in the background"""
+from sqlalchemy import inspect, text
+
+from src.migrations.runner import create_index, has_column
+
+revision = "0006"
+description = "deleted_at on businesses and organizations"
+
+
+def upgrade(connection):
+    for table in ("businesses", "organizations"):
+        if not has_column(connection, table, "deleted_at"):
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN deleted_at TIMESTAMP"))
+    # The organization purge removes a tenant's login directory entries in batches
+    if inspect(connection).has_table("user_directory"):
+        create_index(connection, "ix_user_directory_org", "user_directory", ["organization_id"])
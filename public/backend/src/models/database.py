@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Text, TIMESTAMP, CheckConstraint
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Text, TIMESTAMP, CheckConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from src.config.database import Base
@@ -14,15 +14,21 @@ class Organization(Base):
     billing_plan = Column(String(50), default='free')
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+    # Set by DELETE /api/organizations/{id}; src/utils/purge.py removes the rows
+    deleted_at = Column(TIMESTAMP, nullable=True)
 
     __table_args__ = (
         CheckConstraint("billing_plan IN ('free', 'basic', 'pro')", name='check_billing_plan'),
     )
 
-    # Relationships
-    admin_users = relationship("AdminUser", back_populates="organization", cascade="all, delete-orphan")
-    customers = relationship("Customer", back_populates="organization", cascade="all, delete-orphan")
-    businesses = relationship("Business", back_populates="organization", cascade="all, delete-orphan")
+    # Relationships. passive_deletes: children go with the ON DELETE CASCADE
+    # foreign keys, or in batches from src/utils/purge.py, never loaded by the ORM
+    admin_users = relationship("AdminUser", back_populates="organization", cascade="all, delete-orphan",
+                               passive_deletes=True)
+    customers = relationship("Customer", back_populates="organization", cascade="all, delete-orphan",
+                             passive_deletes=True)
+    businesses = relationship("Business", back_populates="organization", cascade="all, delete-orphan",
+                              passive_deletes=True)
 
 
 class AdminUser(Base):
@@ -34,11 +40,14 @@ class AdminUser(Base):
     password_hash = Column(String(255), nullable=False)
     role = Column(String(50), default='staff')
     is_active = Column(Boolean, default=True)
+    # Copied into every token issued; bumping it revokes them all
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
 
     __table_args__ = (
         CheckConstraint("role IN ('owner', 'manager', 'staff')", name='check_role'),
+        Index('ix_admin_users_org_role', 'organization_id', 'role'),
     )
 
     # Relationships
@@ -57,11 +66,19 @@ class Business(Base):
     logo_url = Column(Text)
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+    # Set by DELETE /api/businesses/{id}; hidden from then on, purged in the background
+    deleted_at = Column(TIMESTAMP, nullable=True)
+
+    __table_args__ = (
+        Index('ix_businesses_org_id', 'organization_id', 'id'),
+    )
 
     # Relationships
     organization = relationship("Organization", back_populates="businesses")
-    business_users = relationship("BusinessUser", back_populates="business", cascade="all, delete-orphan")
-    customers = relationship("Customer", back_populates="business", cascade="all, delete-orphan")
+    business_users = relationship("BusinessUser", back_populates="business", cascade="all, delete-orphan",
+                                  passive_deletes=True)
+    customers = relationship("Customer", back_populates="business", cascade="all, delete-orphan",
+                             passive_deletes=True)
 
 
 class BusinessUser(Base):
@@ -76,6 +93,8 @@ class BusinessUser(Base):
 
     __table_args__ = (
         CheckConstraint("role IN ('owner', 'manager', 'staff')", name='check_business_user_role'),
+        Index('uq_business_users_business_user', 'business_id', 'admin_user_id', unique=True),
+        Index('ix_business_users_admin_user', 'admin_user_id', 'business_id'),
     )
 
     # Relationships
@@ -97,7 +116,43 @@ class Customer(Base):
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
 
+    # Created by migration 0002, declared here so the metadata matches the schema
+    __table_args__ = (
+        Index('ix_customers_org_id', 'organization_id', 'id'),
+        Index('ix_customers_org_phone', 'organization_id', 'phone_number'),
+        Index('ix_customers_business_id', 'business_id'),
+    )
+
     # Relationships
     organization = relationship("Organization", back_populates="customers")
     business = relationship("Business", back_populates="customers")
 
+
+
+# Catalog tables. They live in the catalog database only (see
+# src/config/sharding.py): which database each tenant is stored in, and the
+# email -> organization directory used to route logins.
+
+class TenantShard(Base):
+    __tablename__ = "tenant_shards"
+
+    organization_id = Column(Integer, primary_key=True, autoincrement=False)
+    shard_url = Column(Text, nullable=False)
+    # Set by src/tools/rebalance.py while the tenant is copied to another shard
+    write_fenced = Column(Boolean, nullable=False, default=False)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+
+
+class UserDirectory(Base):
+    __tablename__ = "user_directory"
+
+    email = Column(String(255), primary_key=True)
+    organization_id = Column(Integer, nullable=False)
+    # NULL while the user row is being created in the tenant database
+    admin_user_id = Column(Integer)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+
+    __table_args__ = (
+        Index('ix_user_directory_org', 'organization_id'),
+    )
@@ -0,0 +1,160 @@
+"""
+Tenant-scoped business and assignment lookups, prebuilt like ``repositories.customers``.
+
+Statements for read endpoints spell out what they load and end with
+``raiseload("*")``: response models serialize relationships, and an
+attribute nobody loaded should fail in development rather than run a query
+per row (an async session cannot lazy load anyway).
+
+Soft-deleted businesses (``deleted_at`` set, waiting for src/utils/purge.py)
+are filtered out of every lookup here.
+"""
+from typing import Iterable, Optional
+
+from sqlalchemy import bindparam, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload, selectinload
+
+from src.models.database import Business, BusinessUser
+
+BUSINESS_BY_ID = select(Business).where(
+    Business.id == bindparam("business_id"),
+    Business.organization_id == bindparam("organization_id"),
+    Business.deleted_at.is_(None),
+)
+
+# GET /{business_id}: business_users is serialized by the response model
+BUSINESS_WITH_USERS_BY_ID = BUSINESS_BY_ID.options(
+    selectinload(Business.business_users).raiseload("*"),
+    raiseload("*"),
+)
+
+# GET /: columns only, or with ?include=users the assignments and their
+# users, two IN (...) queries however many businesses there are
+LIST_OPTIONS = (raiseload("*"),)
+LIST_WITH_TEAM_OPTIONS = (
+    selectinload(Business.business_users).selectinload(BusinessUser.admin_user).raiseload("*"),
+    raiseload("*"),
+)
+
+# GET /{business_id}/users: the users come from the request's batch loader
+ASSIGNMENTS_OF_BUSINESS = select(BusinessUser).where(
+    BusinessUser.business_id == bindparam("business_id"),
+).options(raiseload("*"))
+
+ASSIGNMENT_BY_ID = select(BusinessUser).join(Business).where(
+    BusinessUser.id == bindparam("assignment_id"),
+    Business.organization_id == bindparam("organization_id"),
+    Business.deleted_at.is_(None),
+)
+
+# A user's business roles, for the permission index (src/utils/permission_index.py);
+# organization owners act as owner of every business of their organization
+BUSINESS_ROLES_OF_USER = select(BusinessUser.business_id, BusinessUser.role).join(Business).where(
+    BusinessUser.admin_user_id == bindparam("admin_user_id"),
+    Business.organization_id == bindparam("organization_id"),
+    Business.deleted_at.is_(None),
+)
+
+BUSINESS_IDS_OF_ORGANIZATION = select(Business.id).where(
+    Business.organization_id == bindparam("organization_id"),
+    Business.deleted_at.is_(None),
+)
+
+ORG_BUSINESS_IDS = BUSINESS_IDS_OF_ORGANIZATION.where(Business.id.in_(bindparam("business_ids", expanding=True)))
+
+# Superset of the pairs asked for (every business x every user), filtered by the caller
+ASSIGNMENT_ROLES = select(BusinessUser.business_id, BusinessUser.admin_user_id, BusinessUser.role).where(
+    BusinessUser.business_id.in_(bindparam("business_ids", expanding=True)),
+    BusinessUser.admin_user_id.in_(bindparam("admin_user_ids", expanding=True)),
+)
+
+# Branch cloning: multi-row INSERT ... RETURNING batches. Only PostgreSQL
+# can tie returned rows to their parameters (sort_by_parameter_order), for
+# SQLite SQLAlchemy would fall back to one INSERT per row
+INSERT_BUSINESSES = insert(Business).returning(Business)
+INSERT_BUSINESSES_IN_ORDER = insert(Business).returning(Business, sort_by_parameter_order=True)
+INSERT_ASSIGNMENTS = insert(BusinessUser)
+
+ASSIGNMENT_BY_BUSINESS_AND_USER = select(BusinessUser).where(
+    BusinessUser.business_id == bindparam("business_id"),
+    BusinessUser.admin_user_id == bindparam("admin_user_id"),
+)
+
+
+async def get_business(db: AsyncSession, business_id: int, organization_id: int,
+                       with_users: bool = False) -> Optional[Business]:
+    statement = BUSINESS_WITH_USERS_BY_ID if with_users else BUSINESS_BY_ID
+    result = await db.execute(statement, {"business_id": business_id, "organization_id": organization_id})
+    return result.scalars().first()
+
+
+async def get_assignment(db: AsyncSession, assignment_id: int, organization_id: int) -> Optional[BusinessUser]:
+    result = await db.execute(ASSIGNMENT_BY_ID, {"assignment_id": assignment_id, "organization_id": organization_id})
+    return result.scalars().first()
+
+
+async def find_assignment(db: AsyncSession, business_id: int, admin_user_id: int) -> Optional[BusinessUser]:
+    result = await db.execute(ASSIGNMENT_BY_BUSINESS_AND_USER,
+                              {"business_id": business_id, "admin_user_id": admin_user_id})
+    return result.scalars().first()
+
+
+async def get_business_roles(db: AsyncSession, admin_user_id: int, organization_id: int,
+                             organization_role: str) -> dict:
+    """Business id -> the user's role in it"""
+    if organization_role == "owner":
+        result = await db.execute(BUSINESS_IDS_OF_ORGANIZATION, {"organization_id": organization_id})
+        return {business_id: "owner" for business_id in result.scalars()}
+    result = await db.execute(BUSINESS_ROLES_OF_USER,
+                              {"admin_user_id": admin_user_id, "organization_id": organization_id})
+    return dict(result.tuples().all())
+
+
+async def get_assignments(db: AsyncSession, business_id: int) -> list:
+    result = await db.execute(ASSIGNMENTS_OF_BUSINESS, {"business_id": business_id})
+    return list(result.scalars())
+
+
+async def get_org_business_ids(db: AsyncSession, business_ids: Iterable[int], organization_id: int) -> set:
+    """Those of ``business_ids`` that belong to the organization, in one query"""
+    result = await db.execute(ORG_BUSINESS_IDS, {"business_ids": list(business_ids), "organization_id": organization_id})
+    return set(result.scalars())
+
+
+async def get_assignment_roles(db: AsyncSession, business_ids: Iterable[int], admin_user_ids: Iterable[int]) -> dict:
+    """(business id, user id) -> role, for the assignments among those ids"""
+    result = await db.execute(ASSIGNMENT_ROLES, {"business_ids": list(business_ids),
+                                                 "admin_user_ids": list(admin_user_ids)})
+    return {(business_id, user_id): role for business_id, user_id, role in result}
+
+
+async def insert_businesses(db: AsyncSession, rows: list) -> list:
+    """Insert ``rows`` (column dicts) into businesses, returns the new ``Business`` objects in order"""
+    if db.get_bind().dialect.name == "postgresql":
+        return list(await db.scalars(INSERT_BUSINESSES_IN_ORDER, rows))
+    # SQLite hands out rowids in insertion order, and one writer at a time
+    result = await db.scalars(INSERT_BUSINESSES, rows)
+    return sorted(result, key=lambda business: business.id)
+
+
+async def insert_assignments(db: AsyncSession, rows: list):
+    """Insert ``rows`` (business_id, admin_user_id, role dicts) into business_users, no conflict handling"""
+    await db.execute(INSERT_ASSIGNMENTS, rows)
+
+
+async def upsert_assignments(db: AsyncSession, rows: list):
+    """
+    Insert ``rows`` (business_id, admin_user_id, role dicts) into
+    business_users, updating the role where the pair is already assigned.
+    One INSERT ... ON CONFLICT, sent as multi-row VALUES batches.
+    """
+    dialect = db.get_bind().dialect.name
+    dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    statement = dialect_insert(BusinessUser)
+    statement = statement.on_conflict_do_update(
+        index_elements=[BusinessUser.business_id, BusinessUser.admin_user_id],
+        set_={"role": statement.excluded.role, "updated_at": func.now()},
+    )
+    await db.execute(statement, rows)
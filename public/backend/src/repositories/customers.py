@@ -0,0 +1,42 @@
+"""
+Tenant-scoped customer lookups.
+
+The statements below are built once, with bound parameters for every value,
+so each call reuses the same ``Select`` object: its cache key is memoized,
+the engine's compiled cache always hits, and the driver receives identical
+SQL text for its prepared-statement cache.
+
+Customers of a soft-deleted business are hidden, and so not writable either,
+until src/utils/purge.py removes them.
+"""
+from typing import Optional
+
+from sqlalchemy import bindparam, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.models.database import Business, Customer
+
+# Customers without a business have no row to join, their deleted_at is NULL too
+LIVE_CUSTOMERS = select(Customer).outerjoin(Business, Business.id == Customer.business_id).where(
+    Business.deleted_at.is_(None),
+)
+
+CUSTOMER_BY_ID = LIVE_CUSTOMERS.where(
+    Customer.id == bindparam("customer_id"),
+    Customer.organization_id == bindparam("organization_id"),
+)
+
+# Ordered by id so offset pages are stable; (organization_id, id) serves it without a sort
+CUSTOMERS_BY_ORG = LIVE_CUSTOMERS.where(
+    Customer.organization_id == bindparam("organization_id"),
+).order_by(Customer.id).offset(bindparam("offset")).limit(bindparam("limit"))
+
+
+async def get_customer(db: AsyncSession, customer_id: int, organization_id: int) -> Optional[Customer]:
+    result = await db.execute(CUSTOMER_BY_ID, {"customer_id": customer_id, "organization_id": organization_id})
+    return result.scalars().first()
+
+
+async def list_customers(db: AsyncSession, organization_id: int, limit: int, offset: int) -> list:
+    result = await db.execute(CUSTOMERS_BY_ORG, {"organization_id": organization_id, "limit": limit, "offset": offset})
+    return result.scalars().all()
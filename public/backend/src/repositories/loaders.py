@@ -0,0 +1,92 @@
+"""
+Request-scoped batch loaders, in the style of DataLoader.
+
+A route that needs one row per item of a list (the user of every
+assignment, say) calls ``load`` for each key instead of querying in a loop.
+The keys requested in the same event-loop tick are resolved together with
+one ``IN (...)`` query per entity type, and each key is fetched at most once
+per request:
+
+    loaders = Loaders(db, current_user.organization_id)
+    users = await loaders.users.load_many([a.admin_user_id for a in assignments])
+
+Rows are scoped to the organization and come back with ``raiseload("*")``,
+so touching a relationship that was not loaded fails loudly rather than
+issuing a hidden query.
+"""
+import asyncio
+from typing import Awaitable, Callable, Hashable, Iterable
+
+from sqlalchemy import bindparam, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload
+
+from src.models.database import AdminUser
+
+
+def _by_ids(model):
+    return select(model).where(
+        model.id.in_(bindparam("ids", expanding=True)),
+        model.organization_id == bindparam("organization_id"),
+    ).options(raiseload("*"))
+
+
+USERS_BY_IDS = _by_ids(AdminUser)
+
+
+class BatchLoader:
+    """Collects keys until the event loop yields, then resolves them with one ``batch`` call"""
+
+    def __init__(self, batch: Callable[[list], Awaitable[dict]]):
+        self._batch = batch
+        self._futures = {}  # key -> future, kept for the request so repeats are free
+        self._pending = []
+        self._tasks = set()
+        self.batches = 0
+
+    def load(self, key: Hashable) -> "asyncio.Future":
+        future = self._futures.get(key)
+        if future is not None:
+            return future
+        loop = asyncio.get_running_loop()
+        future = self._futures[key] = loop.create_future()
+        self._pending.append(key)
+        if len(self._pending) == 1:
+            loop.call_soon(self._schedule)
+        return future
+
+    async def load_many(self, keys: Iterable[Hashable]) -> list:
+        """Values in the order of ``keys``, None where there is no row"""
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def _schedule(self):
+        task = asyncio.ensure_future(self._dispatch())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self):
+        keys, self._pending = self._pending, []
+        self.batches += 1
+        try:
+            values = await self._batch(keys)
+        except Exception as exc:
+            for key in keys:
+                self._futures.pop(key).set_exception(exc)
+            return
+        for key in keys:
+            self._futures[key].set_result(values.get(key))
+
+
+class Loaders:
+    """One ``BatchLoader`` per entity type, for a single request's session and tenant"""
+
+    def __init__(self, db: AsyncSession, organization_id: int):
+        self.db = db
+        self.organization_id = organization_id
+        self.users = BatchLoader(self._batch(USERS_BY_IDS))
+
+    def _batch(self, statement):
+        async def batch(ids: list) -> dict:
+            result = await self.db.execute(statement, {"ids": ids, "organization_id": self.organization_id})
+            return {row.id: row for row in result.scalars()}
+        return batch
@@ -0,0 +1,36 @@
+"""Admin user lookups, prebuilt like ``repositories.customers``"""
+from typing import Iterable, Optional
+
+from sqlalchemy import bindparam, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.models.database import AdminUser
+
+# Runs on every authenticated request via get_current_user
+USER_BY_ID = select(AdminUser).where(AdminUser.id == bindparam("user_id"))
+
+ORG_USER_BY_ID = select(AdminUser).where(
+    AdminUser.id == bindparam("user_id"),
+    AdminUser.organization_id == bindparam("organization_id"),
+)
+
+ORG_USER_IDS = select(AdminUser.id).where(
+    AdminUser.id.in_(bindparam("user_ids", expanding=True)),
+    AdminUser.organization_id == bindparam("organization_id"),
+)
+
+
+async def get_user(db: AsyncSession, user_id: int) -> Optional[AdminUser]:
+    result = await db.execute(USER_BY_ID, {"user_id": user_id})
+    return result.scalars().first()
+
+
+async def get_org_user(db: AsyncSession, user_id: int, organization_id: int) -> Optional[AdminUser]:
+    result = await db.execute(ORG_USER_BY_ID, {"user_id": user_id, "organization_id": organization_id})
+    return result.scalars().first()
+
+
+async def get_org_user_ids(db: AsyncSession, user_ids: Iterable[int], organization_id: int) -> set:
+    """Those of ``user_ids`` that belong to the organization, in one query"""
+    result = await db.execute(ORG_USER_IDS, {"user_ids": list(user_ids), "organization_id": organization_id})
+    return set(result.scalars())
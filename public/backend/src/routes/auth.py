@@ -1,15 +1,25 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from src.config.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.config import sharding
 from src.models.database import AdminUser, Organization
 from src.schemas.auth import LoginRequest, RegisterRequest, TokenResponse, UserResponse
-from src.utils.auth import verify_password, get_password_hash, create_access_token, get_current_active_user
+from src.repositories import users as user_repository
+from src.utils.auth import check_password, hash_password, create_access_token, get_current_active_user, tenant_shard_for
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
 @router.post("/login", response_model=TokenResponse)
-async def login(credentials: LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(AdminUser).filter(AdminUser.email == credentials.email).first()
+async def login(credentials: LoginRequest, catalog_db: AsyncSession = Depends(sharding.get_catalog_db)):
+    # The catalog's login directory says which tenant database holds the user
+    user = None
+    entry = await sharding.find_login(catalog_db, credentials.email)
+    # Hand the connection back before the password check, which can wait in
+    # the password pool's queue for a while during a burst of sign-ins
+    await catalog_db.commit()
+    if entry:
+        shard = await sharding.shard_for(entry.organization_id)
+        async with shard.session() as db:
+            user = await user_repository.get_user(db, entry.admin_user_id)
     
     if not user:
         raise HTTPException(
@@ -23,14 +33,15 @@ async def login(credentials: LoginRequest, db: Session = Depends(get_db)):
             detail="Account is inactive"
         )
     
-    if not verify_password(credentials.password, user.password_hash):
+    if not await check_password(credentials.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
         )
     
     access_token = create_access_token(
-        data={"userId": user.id, "organizationId": user.organization_id, "role": user.role}
+        data={"userId": user.id, "organizationId": user.organization_id, "role": user.role,
+              "tokenVersion": user.token_version}
     )
     
     return TokenResponse(
@@ -44,48 +55,51 @@ async def login(credentials: LoginRequest, db: Session = Depends(get_db)):
     )
 
 @router.post("/register", response_model=TokenResponse, status_code=status.HTTP_201_CREATED)
-async def register(user_data: RegisterRequest, db: Session = Depends(get_db)):
+async def register(user_data: RegisterRequest, catalog_db: AsyncSession = Depends(sharding.get_catalog_db)):
     # Check if email already exists
-    existing_user = db.query(AdminUser).filter(AdminUser.email == user_data.email).first()
-    if existing_user:
+    if await sharding.email_registered(catalog_db, user_data.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
+    # Hash before anything else is done, with no connection checked out (see login)
+    await catalog_db.commit()
+    password_hash = await hash_password(user_data.password)
     
     # Create organization if needed
     if user_data.organization_id:
-        organization = db.query(Organization).filter(Organization.id == user_data.organization_id).first()
-        if not organization:
+        organization = await catalog_db.get(Organization, user_data.organization_id)
+        if not organization or organization.deleted_at is not None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Organization not found"
             )
         org_id = user_data.organization_id
     else:
-        # Auto-create organization for new user
-        new_org = Organization(
+        # Auto-create organization (and its tenant database) for new user
+        new_org = await sharding.create_organization(
             name=user_data.organization_name or f"{user_data.email.split('@')[0]}'s Organization"
         )
-        db.add(new_org)
-        db.flush()
         org_id = new_org.id
     
-    # Create new user
-    hashed_password = get_password_hash(user_data.password)
-    new_user = AdminUser(
+    # Create new user in the organization's tenant database
+    shard = await tenant_shard_for(org_id, write=True)
+    new_user = await sharding.create_user(
+        shard,
         organization_id=org_id,
         email=user_data.email,
-        password_hash=hashed_password,
+        password_hash=password_hash,
         role=user_data.role or "manager"
     )
-    
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    if new_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
     
     access_token = create_access_token(
-        data={"userId": new_user.id, "organizationId": new_user.organization_id, "role": new_user.role}
+        data={"userId": new_user.id, "organizationId": new_user.organization_id, "role": new_user.role,
+              "tokenVersion": new_user.token_version}
     )
     
     return TokenResponse(
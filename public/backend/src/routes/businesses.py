@@ -1,51 +1,83 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from src.config.database import get_db
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from src.models.database import Business, BusinessUser, AdminUser
 from src.schemas.business import (
-    BusinessCreate, BusinessUpdate, BusinessResponse, BusinessDetailResponse,
-    BusinessUserCreate, BusinessUserUpdate, BusinessUserResponse
+    BusinessCreate, BusinessUpdate, BusinessResponse, BusinessDetailResponse, BusinessWithUsersResponse,
+    BusinessUserCreate, BusinessUserUpdate, BusinessUserResponse,
+    BulkAssignmentRequest, BulkAssignmentResponse, BranchCloneRequest, BranchCloneResponse,
 )
-from src.utils.auth import get_current_active_user
+from src.repositories import businesses as business_repository
+from src.repositories.loaders import Loaders
+from src.utils.permission_index import BUSINESS_ROLE_ACTIONS
+from src.repositories import users as user_repository
+from src.config.sharding import Shard
+from src.utils.auth import (
+    get_current_active_user, get_tenant_read_db, get_tenant_shard, forget_user, revoke_tokens,
+    get_user_permissions, permission_index, require_business_action,
+)
+from src.utils.purge import purger
 
 router = APIRouter(prefix="/api/businesses", tags=["businesses"])
 
+# Writes run as jobs on the tenant database's write queue, like the customer
+# routes; each job does its lookups and checks itself, since it may be run
+# again from the start when the database is busy. Caches are updated once
+# the job has committed.
+
+
+def _team_member(assignment: BusinessUser, user: AdminUser) -> dict:
+    return {
+        "id": user.id,
+        "assignment_id": assignment.id,
+        "email": user.email,
+        "full_name": user.email.split("@")[0],
+        "role": assignment.role,
+    }
+
 
 # Business CRUD Endpoints
 @router.post("/", response_model=BusinessResponse, status_code=status.HTTP_201_CREATED)
 async def create_business(
     business_data: BusinessCreate,
-    db: Session = Depends(get_db),
+    shard: Shard = Depends(get_tenant_shard),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
     """Create a new business for the current user's organization"""
     
-    # Create business
-    new_business = Business(
-        organization_id=current_user.organization_id,
-        **business_data.model_dump()
-    )
-    
-    db.add(new_business)
-    db.flush()  # Get the ID before committing
-    
-    # Automatically assign creator as owner of the business
-    owner_assignment = BusinessUser(
-        business_id=new_business.id,
-        admin_user_id=current_user.id,
-        role='owner'
-    )
+    async def create(db: AsyncSession):
+        # Create business
+        new_business = Business(
+            organization_id=current_user.organization_id,
+            **business_data.model_dump()
+        )
+        
+        db.add(new_business)
+        await db.flush()  # Get the ID before committing
+        
+        # Automatically assign creator as owner of the business
+        owner_assignment = BusinessUser(
+            business_id=new_business.id,
+            admin_user_id=current_user.id,
+            role='owner'
+        )
+        
+        db.add(owner_assignment)
+        await db.commit()
+        await db.refresh(new_business)
+        return new_business
     
-    db.add(owner_assignment)
-    db.commit()
-    db.refresh(new_business)
+    new_business = await shard.write_queue.submit(create)
+    permission_index.add_business(current_user.organization_id, new_business.id, current_user.id)
     
     return new_business
 
 
-@router.get("/", response_model=list[BusinessResponse])
+@router.get("/", response_model=list[BusinessWithUsersResponse], response_model_exclude_unset=True)
 async def list_businesses(
-    db: Session = Depends(get_db),
+    include: Optional[Literal["users"]] = Query(None, description="users: embed each business's team members"),
+    db: AsyncSession = Depends(get_tenant_read_db),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
     """
@@ -67,50 +99,60 @@ async def list_businesses(
     Sue (Org Staff) → Sees only 1 business she's assigned to
     
     NOTE: After fetching, permissions WITHIN each business are checked
-          separately using BUSINESS-LEVEL roles (BusinessUser.role)
+          separately using BUSINESS-LEVEL roles (BusinessUser.role), see
+          require_business_action and GET /api/me/permissions
+
+    ?include=users adds each business's team members (as returned by
+    GET /{business_id}/users) with two more queries in total, instead of
+    one request per business.
     """
     
-    print(f"\n{'='*80}")
-    print(f"🚀 GET /api/businesses/ ENDPOINT CALLED!")
-    print(f"🔍 DEBUG: User={current_user.email}, ORG Role={current_user.role}, OrgID={current_user.organization_id}")
-    print(f"{'='*80}\n")
+    if include == "users":
+        options = business_repository.LIST_WITH_TEAM_OPTIONS
+    else:
+        options = business_repository.LIST_OPTIONS
     
     # ORGANIZATION OWNER? → See all businesses
     if current_user.role == 'owner':
-        businesses = db.query(Business).filter(
-            Business.organization_id == current_user.organization_id
-        ).all()
-        print(f"✅ Org Owner {current_user.email} sees all {len(businesses)} businesses")
-    else:
-        # NOT ORG OWNER? → See only assigned businesses
-        # Query: Find businesses where this user is explicitly assigned
-        print(f"🔒 Filtering for non-owner {current_user.email}...")
-        businesses = db.query(Business).join(
-            BusinessUser,
-            Business.id == BusinessUser.business_id
-        ).filter(
+        result = await db.execute(select(Business).where(
             Business.organization_id == current_user.organization_id,
-            BusinessUser.admin_user_id == current_user.id
-        ).distinct().all()
-        print(f"🔒 User {current_user.email} (ORG role={current_user.role}) sees {len(businesses)} assigned businesses:")
-        for biz in businesses:
-            print(f"   - {biz.name} (ID={biz.id})")
-    
+            Business.deleted_at.is_(None)
+        ).options(*options))
+        businesses = result.scalars().all()
+    else:
+        # NOT ORG OWNER? → See only assigned businesses, as listed by the permission index
+        permissions = await get_user_permissions(db, current_user)
+        businesses = []
+        if permissions.businesses:
+            result = await db.execute(select(Business).where(
+                Business.organization_id == current_user.organization_id,
+                Business.id.in_(permissions.businesses),
+                Business.deleted_at.is_(None)
+            ).options(*options))
+            businesses = result.scalars().all()
+    
+    if include == "users":
+        return [
+            {
+                **BusinessResponse.model_validate(business).model_dump(),
+                "users": [_team_member(assignment, assignment.admin_user) for assignment in business.business_users],
+            }
+            for business in businesses
+        ]
     return businesses
 
 
 @router.get("/{business_id}", response_model=BusinessDetailResponse)
 async def get_business(
     business_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_tenant_read_db),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
     """Get a specific business with all its users"""
     
-    business = db.query(Business).filter(
-        Business.id == business_id,
-        Business.organization_id == current_user.organization_id
-    ).first()
+    business = await business_repository.get_business(
+        db, business_id, current_user.organization_id, with_users=True
+    )
     
     if not business:
         raise HTTPException(
@@ -118,6 +160,8 @@ async def get_business(
             detail="Business not found"
         )
     
+    await require_business_action(db, current_user, business_id, "view")
+    
     return business
 
 
@@ -125,56 +169,127 @@ async def get_business(
 async def update_business(
     business_id: int,
     business_data: BusinessUpdate,
-    db: Session = Depends(get_db),
+    shard: Shard = Depends(get_tenant_shard),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
     """Update a business"""
     
-    business = db.query(Business).filter(
-        Business.id == business_id,
-        Business.organization_id == current_user.organization_id
-    ).first()
-    
-    if not business:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Business not found"
-        )
-    
-    # Update only provided fields
-    update_data = business_data.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(business, field, value)
-    
-    db.commit()
-    db.refresh(business)
-    
-    return business
+    async def update(db: AsyncSession):
+        business = await business_repository.get_business(db, business_id, current_user.organization_id)
+        
+        if not business:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Business not found"
+            )
+        
+        await require_business_action(db, current_user, business_id, "edit")
+        
+        # Update only provided fields
+        update_data = business_data.model_dump(exclude_unset=True)
+        for field, value in update_data.items():
+            setattr(business, field, value)
+        
+        await db.commit()
+        await db.refresh(business)
+        return business
+    
+    return await shard.write_queue.submit(update)
 
 
-@router.delete("/{business_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete("/{business_id}", status_code=status.HTTP_202_ACCEPTED)
 async def delete_business(
     business_id: int,
-    db: Session = Depends(get_db),
+    shard: Shard = Depends(get_tenant_shard),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
-    """Delete a business"""
-    
-    business = db.query(Business).filter(
-        Business.id == business_id,
-        Business.organization_id == current_user.organization_id
-    ).first()
-    
-    if not business:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Business not found"
-        )
+    """
+    Delete a business. It disappears at once; its customers and assignments
+    are removed in the background in batches (src/utils/purge.py), the
+    returned purge job shows the progress.
+    """
     
-    db.delete(business)
-    db.commit()
+    async def delete(db: AsyncSession):
+        business = await business_repository.get_business(db, business_id, current_user.organization_id)
+        
+        if not business:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Business not found"
+            )
+        
+        await require_business_action(db, current_user, business_id, "delete")
+        
+        business.deleted_at = func.now()
+        await db.commit()
+    
+    await shard.write_queue.submit(delete)
+    permission_index.drop_business(current_user.organization_id, business_id)
+    job = purger.purge_business(shard, current_user.organization_id, business_id)
+    
+    return {"id": business_id, "status": "deleting", "purge": job.summary()}
+
+
+@router.post("/{business_id}/clone", response_model=BranchCloneResponse, status_code=status.HTTP_201_CREATED)
+async def clone_business(
+    business_id: int,
+    request: BranchCloneRequest,
+    shard: Shard = Depends(get_tenant_shard),
+    current_user: AdminUser = Depends(get_current_active_user)
+):
+    """
+    Open new branches of a business: each copies its industry type, logo,
+    address (unless given) and, with copy_team, its team assignments.
+
+    The branches go in with multi-row INSERT ... RETURNING and their
+    assignments with multi-row INSERTs, all in one transaction, so the
+    number of statements does not grow with the number of branches. As with
+    POST /, the caller becomes owner of every new branch.
+    """
     
-    return None
+    async def clone(db: AsyncSession):
+        source = await business_repository.get_business(db, business_id, current_user.organization_id)
+        
+        if not source:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Business not found"
+            )
+        
+        await require_business_action(db, current_user, business_id, "manage_team" if request.copy_team else "view")
+        
+        team = await business_repository.get_assignments(db, business_id) if request.copy_team else []
+        team = [(assignment.admin_user_id, assignment.role) for assignment in team
+                if assignment.admin_user_id != current_user.id]
+        
+        branches = await business_repository.insert_businesses(db, [
+            {
+                "organization_id": current_user.organization_id,
+                "name": branch.name,
+                "address": branch.address if "address" in branch.model_fields_set else source.address,
+                "industry_type": source.industry_type,
+                "logo_url": source.logo_url,
+            }
+            for branch in request.branches
+        ])
+        assignments = [
+            {"business_id": branch.id, "admin_user_id": user_id, "role": role}
+            for branch in branches
+            for user_id, role in [(current_user.id, "owner"), *team]
+        ]
+        await business_repository.insert_assignments(db, assignments)
+        await db.commit()
+        return branches, team
+    
+    branches, team = await shard.write_queue.submit(clone)
+    
+    branch_ids = [branch.id for branch in branches]
+    permission_index.add_businesses(current_user.organization_id, branch_ids, current_user.id)
+    for user_id, role in team:
+        for branch_id in branch_ids:
+            permission_index.grant(current_user.organization_id, user_id, branch_id, role)
+    
+    return {"source_id": business_id, "assignments_copied": len(team) * len(branches), "businesses": branches}
 
 
 # Business User Assignment Endpoints
@@ -182,76 +297,152 @@ async def delete_business(
 async def assign_user_to_business(
     business_id: int,
     user_data: BusinessUserCreate,
-    db: Session = Depends(get_db),
+    shard: Shard = Depends(get_tenant_shard),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
     """Assign a user to a business with a specific role"""
     
-    # Check if business exists and belongs to current user's organization
-    business = db.query(Business).filter(
-        Business.id == business_id,
-        Business.organization_id == current_user.organization_id
-    ).first()
-    
-    if not business:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Business not found"
+    async def assign(db: AsyncSession):
+        # Check if business exists and belongs to current user's organization
+        business = await business_repository.get_business(db, business_id, current_user.organization_id)
+        
+        if not business:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Business not found"
+            )
+        
+        await require_business_action(db, current_user, business_id, "manage_team")
+        
+        # Check if user exists and belongs to the same organization
+        user = await user_repository.get_org_user(db, user_data.admin_user_id, current_user.organization_id)
+        
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found in your organization"
+            )
+        
+        # Check if user is already assigned to this business
+        existing = await business_repository.find_assignment(db, business_id, user_data.admin_user_id)
+        
+        if existing:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="User is already assigned to this business"
+            )
+        
+        # Update user's organization role to match the business role
+        if user.role != user_data.role:
+            revoke_tokens(user)
+        user.role = user_data.role
+        
+        # Create assignment
+        assignment = BusinessUser(
+            business_id=business_id,
+            admin_user_id=user_data.admin_user_id,
+            role=user_data.role
         )
+        
+        db.add(assignment)
+        await db.commit()
+        await db.refresh(assignment)
+        return assignment
     
-    # Check if user exists and belongs to the same organization
-    user = db.query(AdminUser).filter(
-        AdminUser.id == user_data.admin_user_id,
-        AdminUser.organization_id == current_user.organization_id
-    ).first()
+    assignment = await shard.write_queue.submit(assign)
+    forget_user(current_user.organization_id, assignment.admin_user_id)
+    permission_index.grant(current_user.organization_id, assignment.admin_user_id, business_id, user_data.role)
     
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found in your organization"
-        )
-    
-    # Check if user is already assigned to this business
-    existing = db.query(BusinessUser).filter(
-        BusinessUser.business_id == business_id,
-        BusinessUser.admin_user_id == user_data.admin_user_id
-    ).first()
+    return assignment
+
+
+@router.post("/assignments", response_model=BulkAssignmentResponse)
+async def bulk_assign_users(
+    request: BulkAssignmentRequest,
+    shard: Shard = Depends(get_tenant_shard),
+    current_user: AdminUser = Depends(get_current_active_user)
+):
+    """
+    Assign many (user, business, role) triples in one transaction.
+
+    Users and businesses are checked against the organization with one query
+    each, and valid rows are inserted, or have their role updated, by one
+    INSERT ... ON CONFLICT. Each row gets a status: created, updated,
+    unchanged or rejected (with the reason); rejected rows do not stop the
+    others. Unlike assign-user this leaves the users' organization roles as
+    they are, a user may get different roles in different businesses here.
+    """
+    rows = request.assignments
     
-    if existing:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="User is already assigned to this business"
+    async def assign(db: AsyncSession):
+        business_ids = await business_repository.get_org_business_ids(
+            db, {row.business_id for row in rows}, current_user.organization_id
         )
-    
-    # Update user's organization role to match the business role
-    user.role = user_data.role
-    
-    # Create assignment
-    assignment = BusinessUser(
-        business_id=business_id,
-        admin_user_id=user_data.admin_user_id,
-        role=user_data.role
-    )
-    
-    db.add(assignment)
-    db.commit()
-    db.refresh(assignment)
-    
-    return assignment
+        user_ids = await user_repository.get_org_user_ids(
+            db, {row.admin_user_id for row in rows}, current_user.organization_id
+        )
+        existing = {}
+        if business_ids and user_ids:
+            existing = await business_repository.get_assignment_roles(db, business_ids, user_ids)
+        permissions = None if current_user.role == "owner" else await get_user_permissions(db, current_user)
+        
+        def allowed(business_id: int, action: str) -> bool:
+            if permissions is None:
+                return True
+            permission = permissions.businesses.get(business_id)
+            return permission is not None and action in permission.actions
+        
+        results, changes, seen = [], [], {}
+        for index, row in enumerate(rows):
+            key = (row.business_id, row.admin_user_id)
+            result = {"admin_user_id": row.admin_user_id, "business_id": row.business_id, "role": row.role}
+            results.append(result)
+            if row.role not in BUSINESS_ROLE_ACTIONS:
+                result.update(status="rejected", detail=f"Unknown role {row.role!r}")
+            elif row.business_id not in business_ids or not allowed(row.business_id, "view"):
+                result.update(status="rejected", detail="Business not found")
+            elif row.admin_user_id not in user_ids:
+                result.update(status="rejected", detail="User not found in your organization")
+            elif key in seen:
+                result.update(status="rejected", detail=f"Same user and business as row {seen[key]}")
+            elif not allowed(row.business_id, "manage_team"):
+                result.update(status="rejected", detail="Your role in this business does not allow manage_team")
+            elif key in existing and existing[key] != row.role and not allowed(row.business_id, "change_team_roles"):
+                result.update(status="rejected", detail="Your role in this business does not allow change_team_roles")
+            elif existing.get(key) == row.role:
+                result.update(status="unchanged")
+            else:
+                result.update(status="updated" if key in existing else "created")
+                changes.append({"business_id": row.business_id, "admin_user_id": row.admin_user_id, "role": row.role})
+            if result["status"] != "rejected":
+                seen[key] = index
+        
+        if changes:
+            await business_repository.upsert_assignments(db, changes)
+        await db.commit()
+        return results, changes
+    
+    results, changes = await shard.write_queue.submit(assign)
+    for change in changes:
+        permission_index.grant(current_user.organization_id, change["admin_user_id"],
+                               change["business_id"], change["role"])
+    
+    counts = dict.fromkeys(("created", "updated", "unchanged", "rejected"), 0)
+    for result in results:
+        counts[result["status"]] += 1
+    
+    return {**counts, "results": results}
 
 
 @router.get("/{business_id}/users", response_model=list[dict])
 async def get_business_users(
     business_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_tenant_read_db),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
     """Get all users assigned to a business"""
     
-    business = db.query(Business).filter(
-        Business.id == business_id,
-        Business.organization_id == current_user.organization_id
-    ).first()
+    business = await business_repository.get_business(db, business_id, current_user.organization_id)
     
     if not business:
         raise HTTPException(
@@ -259,22 +450,18 @@ async def get_business_users(
             detail="Business not found"
         )
     
-    assignments = db.query(BusinessUser).filter(
-        BusinessUser.business_id == business_id
-    ).all()
-    
-    # Return user info with their assignment role
-    result = []
-    for assignment in assignments:
-        user = db.query(AdminUser).filter(AdminUser.id == assignment.admin_user_id).first()
-        if user:
-            result.append({
-                "id": user.id,
-                "assignment_id": assignment.id,
-                "email": user.email,
-                "full_name": user.email.split("@")[0],
-                "role": assignment.role,
-            })
+    await require_business_action(db, current_user, business_id, "view")
+    
+    assignments = await business_repository.get_assignments(db, business_id)
+    
+    # Return user info with their assignment role; one query for all the users
+    loaders = Loaders(db, current_user.organization_id)
+    users = await loaders.users.load_many([assignment.admin_user_id for assignment in assignments])
+    result = [
+        _team_member(assignment, user)
+        for assignment, user in zip(assignments, users)
+        if user
+    ]
     
     return result
 
@@ -283,31 +470,40 @@ async def get_business_users(
 async def update_business_user_role(
     assignment_id: int,
     user_data: BusinessUserUpdate,
-    db: Session = Depends(get_db),
+    shard: Shard = Depends(get_tenant_shard),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
     """Update a user's role in a business"""
     
-    assignment = db.query(BusinessUser).join(Business).filter(
-        BusinessUser.id == assignment_id,
-        Business.organization_id == current_user.organization_id
-    ).first()
-    
-    if not assignment:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Assignment not found"
-        )
-    
+    async def update(db: AsyncSession):
+        assignment = await business_repository.get_assignment(db, assignment_id, current_user.organization_id)
+        
+        if not assignment:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Assignment not found"
+            )
+        
+        await require_business_action(db, current_user, assignment.business_id, "change_team_roles")
+        
+        if user_data.role:
+            assignment.role = user_data.role
+            # Update user's organization role to match
+            user = await user_repository.get_user(db, assignment.admin_user_id)
+            if user:
+                if user.role != user_data.role:
+                    revoke_tokens(user)
+                user.role = user_data.role
+        
+        await db.commit()
+        await db.refresh(assignment)
+        return assignment
+    
+    assignment = await shard.write_queue.submit(update)
     if user_data.role:
-        assignment.role = user_data.role
-        # Update user's organization role to match
-        user = db.query(AdminUser).filter(AdminUser.id == assignment.admin_user_id).first()
-        if user:
-            user.role = user_data.role
-    
-    db.commit()
-    db.refresh(assignment)
+        forget_user(current_user.organization_id, assignment.admin_user_id)
+        permission_index.grant(current_user.organization_id, assignment.admin_user_id,
+                               assignment.business_id, user_data.role)
     
     return assignment
 
@@ -315,23 +511,27 @@ async def update_business_user_role(
 @router.delete("/users/{assignment_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def remove_user_from_business(
     assignment_id: int,
-    db: Session = Depends(get_db),
+    shard: Shard = Depends(get_tenant_shard),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
     """Remove a user from a business"""
     
-    assignment = db.query(BusinessUser).join(Business).filter(
-        BusinessUser.id == assignment_id,
-        Business.organization_id == current_user.organization_id
-    ).first()
-    
-    if not assignment:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Assignment not found"
-        )
-    
-    db.delete(assignment)
-    db.commit()
+    async def remove(db: AsyncSession):
+        assignment = await business_repository.get_assignment(db, assignment_id, current_user.organization_id)
+        
+        if not assignment:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Assignment not found"
+            )
+        
+        await require_business_action(db, current_user, assignment.business_id, "manage_team")
+        
+        await db.delete(assignment)
+        await db.commit()
+        return assignment
+    
+    assignment = await shard.write_queue.submit(remove)
+    permission_index.revoke(current_user.organization_id, assignment.admin_user_id, assignment.business_id)
     
     return None
@@ -1,20 +1,35 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from src.config.database import get_db
+from src.config.sharding import Shard
 from src.models.database import Customer, AdminUser
+from src.repositories import customers as customer_repository
 from src.schemas.customer import (
     CustomerCreate, CustomerUpdate, CustomerResponse,
     AddPointsRequest
 )
-from src.utils.auth import get_current_active_user
+from src.utils.auth import get_current_active_user, get_tenant_read_db, get_tenant_shard
 
 router = APIRouter(prefix="/api/customers", tags=["customers"])
 
+# Customer writes are the kiosk check-in hot path, so they run as jobs on the
+# tenant database's single-writer queue rather than committing from the
+# request's own session.
+
+async def _get_org_customer(db: AsyncSession, customer_id: int, organization_id: int) -> Customer:
+    customer = await customer_repository.get_customer(db, customer_id, organization_id)
+
+    if not customer:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Customer not found"
+        )
+    return customer
+
 @router.post("/", response_model=CustomerResponse, status_code=status.HTTP_201_CREATED)
 async def create_customer(
     customer_data: CustomerCreate,
-    db: Session = Depends(get_db),
+    shard: Shard = Depends(get_tenant_shard),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
     if not customer_data.phone_number and not customer_data.email:
@@ -22,78 +37,62 @@ async def create_customer(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Phone number or email is required"
         )
-    
-    new_customer = Customer(
-        organization_id=current_user.organization_id,
-        **customer_data.model_dump()
-    )
-    
-    db.add(new_customer)
-    db.commit()
-    db.refresh(new_customer)
-    return new_customer
+
+    async def create(db: AsyncSession):
+        new_customer = Customer(
+            organization_id=current_user.organization_id,
+            **customer_data.model_dump()
+        )
+
+        db.add(new_customer)
+        await db.commit()
+        await db.refresh(new_customer)
+        return new_customer
+
+    return await shard.write_queue.submit(create)
 
 @router.get("/", response_model=List[CustomerResponse])
 async def get_all_customers(
     limit: int = Query(100, ge=1, le=1000),
     offset: int = Query(0, ge=0),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_tenant_read_db),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
-    customers = db.query(Customer).filter(
-        Customer.organization_id == current_user.organization_id
-    ).offset(offset).limit(limit).all()
-    return customers
+    return await customer_repository.list_customers(db, current_user.organization_id, limit, offset)
 
 @router.get("/{customer_id}", response_model=CustomerResponse)
 async def get_customer(
     customer_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_tenant_read_db),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
-    customer = db.query(Customer).filter(
-        Customer.id == customer_id,
-        Customer.organization_id == current_user.organization_id
-    ).first()
-    
-    if not customer:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Customer not found"
-        )
-    return customer
+    return await _get_org_customer(db, customer_id, current_user.organization_id)
 
 @router.put("/{customer_id}", response_model=CustomerResponse)
 async def update_customer(
     customer_id: int,
     customer_data: CustomerUpdate,
-    db: Session = Depends(get_db),
+    shard: Shard = Depends(get_tenant_shard),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
-    customer = db.query(Customer).filter(
-        Customer.id == customer_id,
-        Customer.organization_id == current_user.organization_id
-    ).first()
-    
-    if not customer:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Customer not found"
-        )
-    
-    update_data = customer_data.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(customer, field, value)
-    
-    db.commit()
-    db.refresh(customer)
-    return customer
+    async def update(db: AsyncSession):
+        customer = await _get_org_customer(db, customer_id, current_user.organization_id)
+
+        update_data = customer_data.model_dump(exclude_unset=True)
+        for field, value in update_data.items():
+            setattr(customer, field, value)
+
+        await db.commit()
+        await db.refresh(customer)
+        return customer
+
+    return await shard.write_queue.submit(update)
 
 @router.post("/{customer_id}/points", response_model=CustomerResponse)
 async def add_points(
     customer_id: int,
     points_data: AddPointsRequest,
-    db: Session = Depends(get_db),
+    shard: Shard = Depends(get_tenant_shard),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
     if points_data.points <= 0:
@@ -101,63 +100,42 @@ async def add_points(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Points must be greater than 0"
         )
-    
-    customer = db.query(Customer).filter(
-        Customer.id == customer_id,
-        Customer.organization_id == current_user.organization_id
-    ).first()
-    
-    if not customer:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Customer not found"
-        )
-    
-    customer.points += points_data.points
-    db.commit()
-    db.refresh(customer)
-    return customer
+
+    async def add(db: AsyncSession):
+        customer = await _get_org_customer(db, customer_id, current_user.organization_id)
+        customer.points += points_data.points
+        await db.commit()
+        await db.refresh(customer)
+        return customer
+
+    return await shard.write_queue.submit(add)
 
 @router.post("/{customer_id}/visits", response_model=CustomerResponse)
 async def increment_visits(
     customer_id: int,
-    db: Session = Depends(get_db),
+    shard: Shard = Depends(get_tenant_shard),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
-    customer = db.query(Customer).filter(
-        Customer.id == customer_id,
-        Customer.organization_id == current_user.organization_id
-    ).first()
-    
-    if not customer:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Customer not found"
-        )
-    
-    customer.visits += 1
-    db.commit()
-    db.refresh(customer)
-    return customer
+    async def increment(db: AsyncSession):
+        customer = await _get_org_customer(db, customer_id, current_user.organization_id)
+        customer.visits += 1
+        await db.commit()
+        await db.refresh(customer)
+        return customer
+
+    return await shard.write_queue.submit(increment)
 
 @router.delete("/{customer_id}", status_code=status.HTTP_200_OK)
 async def delete_customer(
     customer_id: int,
-    db: Session = Depends(get_db),
+    shard: Shard = Depends(get_tenant_shard),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
-    customer = db.query(Customer).filter(
-        Customer.id == customer_id,
-        Customer.organization_id == current_user.organization_id
-    ).first()
-    
-    if not customer:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Customer not found"
-        )
-    
-    db.delete(customer)
-    db.commit()
-    return {"message": "Customer deleted successfully", "customer": customer}
+    async def delete(db: AsyncSession):
+        customer = await _get_org_customer(db, customer_id, current_user.organization_id)
+        await db.delete(customer)
+        await db.commit()
+        return customer
 
+    customer = await shard.write_queue.submit(delete)
+    return {"message": "Customer deleted successfully", "customer": customer}
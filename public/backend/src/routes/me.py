@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.models.database import AdminUser
+from src.schemas.business import PermissionsResponse
+from src.utils.auth import get_current_active_user, get_tenant_read_db, get_user_permissions
+
+router = APIRouter(prefix="/api/me", tags=["me"])
+
+
+@router.get("/permissions", response_model=PermissionsResponse)
+async def my_permissions(
+    db: AsyncSession = Depends(get_tenant_read_db),
+    current_user: AdminUser = Depends(get_current_active_user)
+):
+    """The current user's role and allowed actions in every business they can see"""
+    permissions = await get_user_permissions(db, current_user)
+    return {
+        "user_id": current_user.id,
+        "organization_id": current_user.organization_id,
+        "organization_role": current_user.role,
+        "businesses": [
+            {"business_id": business_id, "role": permission.role, "actions": sorted(permission.actions)}
+            for business_id, permission in sorted(permissions.businesses.items())
+        ],
+    }
@@ -0,0 +1,95 @@
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from src.config.database import get_pool_stats, write_queue, read_routing_stats, slow_query_log, maintenance_scheduler
+from src.config.sharding import shard_stats
+from src.models.database import AdminUser
+from src.utils.auth import get_current_active_user, password_pool, permission_index, principal_cache, token_cache
+from src.utils.purge import purger
+from src.utils.sql_metrics import N_PLUS_ONE_THRESHOLD, route_sql_totals
+
+router = APIRouter(prefix="/api/metrics", tags=["metrics"])
+
+
+# Operators allowed to read the process-wide metrics, which cover every
+# tenant (statements, routes, engine URLs and database files)
+METRICS_ADMIN_EMAILS = {
+    email.strip().lower() for email in os.getenv("METRICS_ADMIN_EMAILS", "").split(",") if email.strip()
+}
+
+
+async def require_owner(current_user: AdminUser = Depends(get_current_active_user)):
+    """Tenant-scoped metrics are only visible to organization owners"""
+    if current_user.role != "owner":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only organization owners can view metrics"
+        )
+    return current_user
+
+
+async def require_operator(current_user: AdminUser = Depends(get_current_active_user)):
+    """Process-wide metrics are only visible to the operators in METRICS_ADMIN_EMAILS"""
+    if current_user.email.lower() not in METRICS_ADMIN_EMAILS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only operators can view these metrics"
+        )
+    return current_user
+
+
+@router.get("/database")
+async def database_metrics(current_user: AdminUser = Depends(require_operator)):
+    """Connection pool usage per engine, write queue depth/wait times, read routing and auth cache hits"""
+    return {
+        "pools": get_pool_stats(),
+        "write_queue": write_queue.stats(),
+        "read_routing": dict(read_routing_stats),
+        "shards": shard_stats(),
+        # Each miss is a user lookup in get_current_user
+        "principal_cache": principal_cache.stats(),
+        # Each miss is a full JWT signature check
+        "token_cache": token_cache.stats(),
+        # Each miss is a business roles lookup for an authorization check
+        "permission_index": permission_index.stats(),
+    }
+
+
+@router.get("/sql")
+async def sql_metrics(current_user: AdminUser = Depends(require_operator)):
+    """Per-route statement counts and DB time, and where likely N+1 queries were seen"""
+    return {
+        "n_plus_one_threshold": N_PLUS_ONE_THRESHOLD,
+        "routes": route_sql_totals.snapshot(),
+    }
+
+
+@router.get("/slow-queries")
+async def slow_queries(
+    limit: int = Query(20, ge=1, le=200),
+    current_user: AdminUser = Depends(require_operator)
+):
+    """Statement shapes ranked by total time, and the most recent slow statements"""
+    return {
+        **slow_query_log.stats(),
+        "top_by_total_time": slow_query_log.top(limit),
+        "recent": list(slow_query_log.recent)[-limit:],
+    }
+
+
+@router.get("/maintenance")
+async def maintenance_metrics(current_user: AdminUser = Depends(require_operator)):
+    """Last run time, duration and outcome of each SQLite maintenance task, per database file"""
+    return maintenance_scheduler.stats()
+
+
+@router.get("/passwords")
+async def password_metrics(current_user: AdminUser = Depends(require_operator)):
+    """bcrypt worker pool: calls in flight and queued, rejections, wait and hash/verify latency"""
+    return password_pool.stats()
+
+
+@router.get("/purges")
+async def purge_metrics(current_user: AdminUser = Depends(require_owner)):
+    """Progress of the organization's recent business/organization purges (src/utils/purge.py)"""
+    return purger.stats(current_user.organization_id)
@@ -1,42 +1,49 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from src.config.database import get_db
+from src.config import sharding
 from src.models.database import Organization
 from src.schemas.organization import OrganizationCreate, OrganizationUpdate, OrganizationResponse
-from src.utils.auth import get_current_active_user
+from src.utils.auth import get_current_active_user, tenant_shard_for, forget_organization
+from src.utils.purge import purger
 from src.models.database import AdminUser
 
+# Organizations are global, so these routes read and write the tenant catalog
 router = APIRouter(prefix="/api/organizations", tags=["organizations"])
 
 @router.post("/", response_model=OrganizationResponse, status_code=status.HTTP_201_CREATED)
-async def create_organization(org_data: OrganizationCreate, db: Session = Depends(get_db)):
-    new_org = Organization(**org_data.model_dump())
-    db.add(new_org)
-    db.commit()
-    db.refresh(new_org)
-    return new_org
+async def create_organization(org_data: OrganizationCreate):
+    # Organizations are allocated in the catalog, which also sets up the
+    # tenant database their data will live in
+    return await sharding.create_organization(**org_data.model_dump())
 
 @router.get("/", response_model=List[OrganizationResponse])
 async def get_all_organizations(
     limit: int = Query(100, ge=1, le=1000),
     offset: int = Query(0, ge=0),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(sharding.get_catalog_db),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
     # Return only current user's organization for security
-    organizations = db.query(Organization).filter(
-        Organization.id == current_user.organization_id
-    ).all()
+    result = await db.execute(select(Organization).where(
+        Organization.id == current_user.organization_id,
+        Organization.deleted_at.is_(None)
+    ))
+    organizations = result.scalars().all()
     return organizations
 
 @router.get("/{org_id}", response_model=OrganizationResponse)
 async def get_organization(
     org_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(sharding.get_catalog_db),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
-    organization = db.query(Organization).filter(Organization.id == org_id).first()
+    result = await db.execute(select(Organization).where(
+        Organization.id == org_id,
+        Organization.deleted_at.is_(None)
+    ))
+    organization = result.scalars().first()
     if not organization:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -48,21 +55,61 @@ async def get_organization(
 async def update_organization(
     org_id: int,
     org_data: OrganizationUpdate,
-    db: Session = Depends(get_db),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
-    organization = db.query(Organization).filter(Organization.id == org_id).first()
+    if org_id != current_user.organization_id or current_user.role != "owner":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only an owner of the organization can update it"
+        )
+    
+    # The tenant database keeps a copy of the row, so this is a tenant write
+    await tenant_shard_for(org_id, write=True)
+    
+    organization = await sharding.update_organization(org_id, **org_data.model_dump(exclude_unset=True))
     if not organization:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Organization not found"
         )
-    
-    update_data = org_data.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(organization, field, value)
-    
-    db.commit()
-    db.refresh(organization)
+    await sharding.sync_organization(organization)
     return organization
 
+
+@router.delete("/{org_id}", status_code=status.HTTP_202_ACCEPTED)
+async def delete_organization(
+    org_id: int,
+    current_user: AdminUser = Depends(get_current_active_user)
+):
+    """
+    Delete the current user's organization. Its users are signed out and
+    deactivated at once; its data is removed in the background in batches
+    (src/utils/purge.py), the returned purge job shows the progress.
+    """
+    if org_id != current_user.organization_id or current_user.role != "owner":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only an owner of the organization can delete it"
+        )
+    shard = await tenant_shard_for(org_id, write=True)
+    
+    organization = await sharding.update_organization(org_id, deleted_at=func.now())
+    if not organization:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Organization not found"
+        )
+    await sharding.sync_organization(organization)
+    
+    # Nobody signs in again, and every token issued so far stops working
+    async def deactivate(tenant_db: AsyncSession):
+        await tenant_db.execute(update(AdminUser).where(AdminUser.organization_id == org_id).values(
+            is_active=False, token_version=AdminUser.token_version + 1
+        ))
+        await tenant_db.commit()
+    
+    await shard.write_queue.submit(deactivate)
+    forget_organization(org_id)
+    job = purger.purge_organization(org_id)
+    
+    return {"id": org_id, "status": "deleting", "purge": job.summary()}
@@ -1,23 +1,30 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from src.config.database import get_db
+from src.config import sharding
+from src.config.sharding import Shard
 from src.models.database import AdminUser
 from src.schemas.auth import RegisterRequest
-from src.utils.auth import get_current_active_user, get_password_hash, create_access_token
+from src.repositories import users as user_repository
+from src.utils.auth import (
+    get_current_active_user, hash_password, create_access_token, get_tenant_read_db, get_tenant_shard,
+    forget_user, revoke_tokens, permission_index,
+)
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 
 
 @router.get("/", response_model=List[dict])
 async def list_organization_users(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_tenant_read_db),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
     """List all users in current user's organization"""
-    users = db.query(AdminUser).filter(
+    result = await db.execute(select(AdminUser).where(
         AdminUser.organization_id == current_user.organization_id
-    ).all()
+    ))
+    users = result.scalars().all()
     
     return [
         {
@@ -35,36 +42,31 @@ async def list_organization_users(
 @router.post("/", status_code=status.HTTP_201_CREATED)
 async def create_organization_user(
     user_data: RegisterRequest,
-    db: Session = Depends(get_db),
+    shard: Shard = Depends(get_tenant_shard),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
     """Create a new user in current user's organization"""
     
-    # Check if email already exists
-    existing_user = db.query(AdminUser).filter(AdminUser.email == user_data.email).first()
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
-        )
-    
-    # Create new user in same organization
-    new_user = AdminUser(
+    # Emails are unique across tenants, so check the catalog's login directory
+    password_hash = await hash_password(user_data.password)
+    new_user = await sharding.create_user(
+        shard,
         email=user_data.email,
-        password_hash=get_password_hash(user_data.password),
+        password_hash=password_hash,
         organization_id=current_user.organization_id,
         role="staff",  # Default role
         is_active=True
     )
-    
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    if new_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
     
     return {
         "id": new_user.id,
         "email": new_user.email,
-        "full_name": new_user.full_name,
+        "full_name": new_user.email.split("@")[0],
         "role": new_user.role,
         "is_active": new_user.is_active,
         "message": "User created successfully"
@@ -75,32 +77,38 @@ async def create_organization_user(
 async def update_user_role(
     user_id: int,
     role_data: dict,
-    db: Session = Depends(get_db),
+    shard: Shard = Depends(get_tenant_shard),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
     """Update user role (only for users in same organization)"""
     
-    user = db.query(AdminUser).filter(
-        AdminUser.id == user_id,
-        AdminUser.organization_id == current_user.organization_id
-    ).first()
-    
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
     new_role = role_data.get("role")
-    if new_role not in ["owner", "manager", "staff"]:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid role. Must be owner, manager, or staff"
-        )
     
-    user.role = new_role
-    db.commit()
-    db.refresh(user)
+    async def update(db: AsyncSession):
+        user = await user_repository.get_org_user(db, user_id, current_user.organization_id)
+        
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
+        
+        if new_role not in ["owner", "manager", "staff"]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid role. Must be owner, manager, or staff"
+            )
+        
+        if user.role != new_role:
+            # Tokens carry the role; make the user sign in again
+            revoke_tokens(user)
+        user.role = new_role
+        await db.commit()
+        await db.refresh(user)
+        return user
+    
+    user = await shard.write_queue.submit(update)
+    forget_user(user.organization_id, user.id)
     
     return {
         "id": user.id,
@@ -113,35 +121,39 @@ async def update_user_role(
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_user(
     user_id: int,
-    db: Session = Depends(get_db),
+    shard: Shard = Depends(get_tenant_shard),
     current_user: AdminUser = Depends(get_current_active_user)
 ):
     """Delete a user (only for users in same organization)"""
     
-    user = db.query(AdminUser).filter(
-        AdminUser.id == user_id,
-        AdminUser.organization_id == current_user.organization_id
-    ).first()
-    
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
-    # Prevent deleting the last owner
-    owner_count = db.query(AdminUser).filter(
-        AdminUser.organization_id == current_user.organization_id,
-        AdminUser.role == "owner"
-    ).count()
-    
-    if user.role == "owner" and owner_count <= 1:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Cannot delete the last owner in organization"
-        )
-    
-    db.delete(user)
-    db.commit()
+    async def delete(db: AsyncSession):
+        user = await user_repository.get_org_user(db, user_id, current_user.organization_id)
+        
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
+        
+        # Prevent deleting the last owner
+        owner_count = await db.scalar(select(func.count()).select_from(AdminUser).where(
+            AdminUser.organization_id == current_user.organization_id,
+            AdminUser.role == "owner"
+        ))
+        
+        if user.role == "owner" and owner_count <= 1:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cannot delete the last owner in organization"
+            )
+        
+        await db.delete(user)
+        await db.commit()
+        return user
+    
+    user = await shard.write_queue.submit(delete)
+    forget_user(user.organization_id, user.id)
+    permission_index.invalidate(user.organization_id, user.id)
+    await sharding.remove_user(user.email)
     
     return None
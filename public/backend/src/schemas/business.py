@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 from typing import Optional, List
 
@@ -31,11 +31,66 @@ class BusinessResponse(BaseModel):
         from_attributes = True
 
 
+class BusinessTeamMemberResponse(BaseModel):
+    id: int
+    assignment_id: int
+    email: str
+    full_name: str
+    role: str
+
+
+class BusinessWithUsersResponse(BusinessResponse):
+    # Only present with GET /api/businesses/?include=users
+    users: Optional[List[BusinessTeamMemberResponse]] = None
+
+
 class BusinessUserCreate(BaseModel):
     admin_user_id: int
     role: str = 'staff'
 
 
+class BulkAssignmentItem(BaseModel):
+    admin_user_id: int
+    business_id: int
+    role: str = 'staff'
+
+
+class BulkAssignmentRequest(BaseModel):
+    assignments: List[BulkAssignmentItem] = Field(min_length=1, max_length=5000)
+
+
+class BulkAssignmentResult(BaseModel):
+    admin_user_id: int
+    business_id: int
+    role: str
+    status: str  # created, updated, unchanged or rejected
+    detail: Optional[str] = None
+
+
+class BulkAssignmentResponse(BaseModel):
+    created: int
+    updated: int
+    unchanged: int
+    rejected: int
+    results: List[BulkAssignmentResult]
+
+
+class BranchItem(BaseModel):
+    name: str
+    address: Optional[str] = None  # defaults to the source business's
+
+
+class BranchCloneRequest(BaseModel):
+    branches: List[BranchItem] = Field(min_length=1, max_length=1000)
+    copy_team: bool = True
+
+
+class BranchCloneResponse(BaseModel):
+    source_id: int
+    assignments_copied: int
+    businesses: List[BusinessResponse]
+
+
 class BusinessUserUpdate(BaseModel):
     role: Optional[str] = None
 
@@ -54,3 +109,16 @@ class BusinessUserResponse(BaseModel):
 
 class BusinessDetailResponse(BusinessResponse):
     business_users: List[BusinessUserResponse] = []
+
+
+class BusinessPermissionResponse(BaseModel):
+    business_id: int
+    role: str
+    actions: List[str]
+
+
+class PermissionsResponse(BaseModel):
+    user_id: int
+    organization_id: int
+    organization_role: str
+    businesses: List[BusinessPermissionResponse] = []
@@ -0,0 +1,96 @@
+"""
+Snapshots of the SQLite databases, see ``src/utils/backups.py``.
+
+    python -m src.tools.backup snapshot [--all] [--no-compress]
+    python -m src.tools.backup list
+    python -m src.tools.backup restore backups/test/test-20260101T000000000000Z.db.gz --to ./test.db
+    python -m src.tools.backup reporting-url
+
+Without ``--database`` the commands work on DATABASE_URL; ``snapshot --all``
+also covers the tenant catalog and every tenant shard it lists. Restore
+with the app stopped.
+"""
+import argparse
+import json
+import os
+import sys
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.pool import NullPool
+
+from src.config.database import DATABASE_URL
+from src.config.sharding import TENANT_CATALOG_URL
+from src.models.database import TenantShard
+from src.utils import backups
+from src.utils.db_maintenance import sqlite_path
+
+
+def all_databases() -> list:
+    urls = {DATABASE_URL, TENANT_CATALOG_URL}
+    catalog = create_engine(TENANT_CATALOG_URL, poolclass=NullPool)
+    try:
+        with catalog.connect() as connection:
+            urls.update(connection.execute(select(TenantShard.shard_url).distinct()).scalars())
+    finally:
+        catalog.dispose()
+    return sorted(url for url in urls if sqlite_path(url))
+
+
+def _path(url: str) -> str:
+    path = sqlite_path(url)
+    if path is None:
+        raise SystemExit(f"{url} is not a SQLite database file")
+    return path
+
+
+def _manifest(snapshot: str) -> dict:
+    manifest_path = snapshot.rsplit(".db", 1)[0] + backups.MANIFEST_SUFFIX
+    if not os.path.exists(manifest_path):
+        raise SystemExit(f"No manifest next to {snapshot}")
+    with open(manifest_path) as manifest:
+        return json.load(manifest)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.tools.backup", description="SQLite snapshots")
+    parser.add_argument("--database", help="database URL (default: DATABASE_URL)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    snapshot_parser = commands.add_parser("snapshot", help="take a snapshot now and rotate old ones")
+    snapshot_parser.add_argument("--all", action="store_true", help="the catalog and every tenant shard too")
+    snapshot_parser.add_argument("--no-compress", action="store_true")
+    commands.add_parser("list", help="list snapshots, newest first")
+    restore_parser = commands.add_parser("restore", help="overwrite a database with a snapshot")
+    restore_parser.add_argument("snapshot", help="snapshot file (.db or .db.gz)")
+    restore_parser.add_argument("--to", help="database file to overwrite (default: the one it was taken of)")
+    commands.add_parser("reporting-url", help="print a read-only URL for the newest snapshot")
+    args = parser.parse_args(argv)
+
+    database = args.database or DATABASE_URL
+    if args.command == "snapshot":
+        urls = all_databases() if args.all else [database]
+        compress = backups.BACKUP_COMPRESS and not args.no_compress
+        for url in urls:
+            path = _path(url)
+            manifest = backups.snapshot_file(path, compress=compress)
+            removed = backups.rotate(path)
+            print(f"{manifest['snapshot']}  {manifest['pages']} pages, {manifest['bytes']} bytes, "
+                  f"{manifest['duration_ms']:.0f} ms, {len(removed)} old file(s) removed")
+    elif args.command == "list":
+        for manifest in backups.list_snapshots(_path(database)):
+            print(f"{manifest['created_at']}  {manifest['bytes']:>12}  {manifest['snapshot']}")
+    elif args.command == "restore":
+        manifest = _manifest(args.snapshot)
+        target = args.to or manifest["database"]
+        backups.restore(manifest, target)
+        print(f"Restored {target} from {manifest['snapshot']} ({manifest['created_at']})")
+    elif args.command == "reporting-url":
+        url = backups.reporting_url(_path(database))
+        if url is None:
+            print("No snapshots yet")
+            return 1
+        print(url)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
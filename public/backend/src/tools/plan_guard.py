@@ -0,0 +1,397 @@
+"""
+Query-plan regression guard.
+
+Builds a throwaway database, migrates and seeds it with ~20k customers
+rows spread over several organizations, then calls every route in
+``src/routes`` through the ASGI app. Each statement a route runs is
+explained on the connection that ran it (``EXPLAIN QUERY PLAN`` on SQLite,
+``EXPLAIN`` elsewhere) and the plans are compared with the stored
+baselines:
+
+    python -m src.tools.plan_guard record     # write src/tools/plan_baselines.json
+    python -m src.tools.plan_guard check      # exit 1 on a regression
+    python -m src.tools.plan_guard show       # print the current plans
+
+A regression is a statement whose baseline plan did not scan a table in
+full (or did not sort through a temp B-tree) and now does. Routes without
+a scenario below also fail the check, so new routes get covered.
+Pass ``--database-url`` to run against a scratch Postgres database instead;
+it must be empty, the guard migrates and seeds it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import tempfile
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plan_baselines.json")
+SEED_PASSWORD = "plan-guard-password"
+
+
+@dataclass
+class Scenario:
+    """One call of a route; ``{name}`` placeholders in the path come from the seed ids"""
+    method: str
+    path: str
+    user: Optional[str] = "owner"  # "owner", "staff", "doomed_owner" or None for anonymous calls
+    json: Optional[Callable[[dict], dict]] = None
+
+    @property
+    def key(self) -> str:
+        suffix = f" [{self.user}]" if self.user not in ("owner", None) else ""
+        return f"{self.method} {self.path}{suffix}"
+
+
+# Reads first, then writes, then deletes of rows seeded for that purpose
+SCENARIOS = [
+    Scenario("POST", "/api/auth/login", None, lambda ids: {"email": ids["owner_email"], "password": SEED_PASSWORD}),
+    Scenario("GET", "/api/auth/profile"),
+    Scenario("GET", "/api/organizations/"),
+    Scenario("GET", "/api/organizations/{org_id}"),
+    Scenario("GET", "/api/users/"),
+    Scenario("GET", "/api/businesses/"),
+    Scenario("GET", "/api/businesses/", "staff"),
+    Scenario("GET", "/api/businesses/?include=users"),
+    Scenario("GET", "/api/businesses/?include=users", "staff"),
+    Scenario("GET", "/api/businesses/{business_id}"),
+    Scenario("GET", "/api/businesses/{business_id}/users"),
+    Scenario("GET", "/api/customers/"),
+    Scenario("GET", "/api/customers/{customer_id}"),
+    Scenario("GET", "/api/metrics/database"),
+    Scenario("GET", "/api/metrics/sql"),
+    Scenario("GET", "/api/metrics/slow-queries"),
+    Scenario("GET", "/api/metrics/maintenance"),
+    Scenario("GET", "/api/metrics/passwords"),
+    Scenario("GET", "/api/metrics/purges"),
+    Scenario("GET", "/api/me/permissions"),
+    Scenario("GET", "/api/me/permissions", "staff"),
+    Scenario("POST", "/api/auth/register", None, lambda ids: {
+        "email": "plan-guard-new@example.com", "password": SEED_PASSWORD, "organization_id": ids["org_id"],
+    }),
+    Scenario("POST", "/api/organizations/", None, lambda ids: {"name": "Plan Guard Org"}),
+    Scenario("PUT", "/api/organizations/{org_id}", json=lambda ids: {"billing_plan": "pro"}),
+    Scenario("POST", "/api/users/", json=lambda ids: {"email": "plan-guard-user@example.com", "password": SEED_PASSWORD}),
+    Scenario("PUT", "/api/users/{staff_id}/role", json=lambda ids: {"role": "manager"}),
+    Scenario("POST", "/api/businesses/", json=lambda ids: {"name": "Plan Guard Branch"}),
+    Scenario("PUT", "/api/businesses/{business_id}", json=lambda ids: {"address": "1 Plan St"}),
+    Scenario("POST", "/api/businesses/{business_id}/assign-user",
+             json=lambda ids: {"admin_user_id": ids["unassigned_user_id"], "role": "staff"}),
+    Scenario("PUT", "/api/businesses/users/{assignment_id}", json=lambda ids: {"role": "manager"}),
+    Scenario("POST", "/api/businesses/assignments", json=lambda ids: {"assignments": [
+        {"admin_user_id": ids["unassigned_user_id"], "business_id": ids["other_business_id"], "role": "staff"},
+        {"admin_user_id": ids["staff_id"], "business_id": ids["business_id"], "role": "owner"},
+    ]}),
+    Scenario("POST", "/api/businesses/{business_id}/clone", json=lambda ids: {"branches": [
+        {"name": "Plan Guard North"}, {"name": "Plan Guard South", "address": "2 Plan St"},
+    ]}),
+    Scenario("POST", "/api/customers/", json=lambda ids: {"phone_number": "5550009999", "name": "Plan Guard"}),
+    Scenario("PUT", "/api/customers/{customer_id}", json=lambda ids: {"name": "Plan Guard"}),
+    Scenario("POST", "/api/customers/{customer_id}/points", json=lambda ids: {"points": 5}),
+    Scenario("POST", "/api/customers/{customer_id}/visits"),
+    Scenario("DELETE", "/api/customers/{doomed_customer_id}"),
+    Scenario("DELETE", "/api/businesses/users/{doomed_assignment_id}"),
+    Scenario("DELETE", "/api/users/{doomed_user_id}"),
+    Scenario("DELETE", "/api/businesses/{doomed_business_id}"),
+    Scenario("DELETE", "/api/organizations/{doomed_org_id}", "doomed_owner"),
+]
+
+
+def seed(engine, organizations: int, customers: int) -> dict:
+    """Fill the database and return the ids the scenarios refer to"""
+    from sqlalchemy import insert, select, text
+    from sqlalchemy.orm import Session
+
+    from src.models.database import AdminUser, Business, BusinessUser, Customer, Organization, UserDirectory
+    from src.utils.auth import get_password_hash
+
+    password_hash = get_password_hash(SEED_PASSWORD)
+    with Session(engine) as session:
+        session.execute(insert(Organization), [{"name": f"Org {i}"} for i in range(organizations)])
+        org_ids = list(session.scalars(select(Organization.id).order_by(Organization.id)))
+
+        session.execute(insert(AdminUser), [
+            {"organization_id": org_id, "email": f"{role}{n}-org{org_id}@example.com",
+             "password_hash": password_hash, "role": role, "is_active": True}
+            for org_id in org_ids
+            for role, count in (("owner", 1), ("manager", 3), ("staff", 8))
+            for n in range(count)
+        ])
+        session.execute(insert(Business), [
+            {"organization_id": org_id, "name": f"Branch {n}"} for org_id in org_ids for n in range(10)
+        ])
+        businesses = {org_id: [] for org_id in org_ids}
+        for business_id, org_id in session.execute(select(Business.id, Business.organization_id)):
+            businesses[org_id].append(business_id)
+        users = {org_id: [] for org_id in org_ids}
+        for user_id, org_id, role in session.execute(
+                select(AdminUser.id, AdminUser.organization_id, AdminUser.role).order_by(AdminUser.id)):
+            users[org_id].append((user_id, role))
+        # Login looks users up in the catalog's directory first
+        session.execute(insert(UserDirectory).from_select(
+            ["email", "organization_id", "admin_user_id"],
+            select(AdminUser.email, AdminUser.organization_id, AdminUser.id),
+        ))
+
+        # Every non-owner works at three branches, the last user of each org at none
+        session.execute(insert(BusinessUser), [
+            {"business_id": businesses[org_id][(index + offset) % len(businesses[org_id])],
+             "admin_user_id": user_id, "role": role}
+            for org_id in org_ids
+            for index, (user_id, role) in enumerate(users[org_id][1:-1])
+            for offset in range(3)
+        ])
+        session.execute(insert(Customer), [
+            {"organization_id": org_ids[n % len(org_ids)],
+             "business_id": businesses[org_ids[n % len(org_ids)]][n % 10],
+             "phone_number": f"555{n:07d}", "name": f"Customer {n}", "points": n % 100, "visits": n % 7}
+            for n in range(customers)
+        ])
+        session.commit()
+
+        org_id = org_ids[0]
+        owner_id = users[org_id][0][0]
+        staff = [user_id for user_id, role in users[org_id] if role == "staff"]
+        org_businesses = businesses[org_id]
+        assignments = list(session.scalars(
+            select(BusinessUser.id).join(Business).where(Business.organization_id == org_id).order_by(BusinessUser.id)
+        ))
+        org_customers = list(session.scalars(
+            select(Customer.id).where(Customer.organization_id == org_id).order_by(Customer.id)
+        ))
+        ids = {
+            "org_id": org_id,
+            "owner_email": session.get(AdminUser, owner_id).email,
+            "staff_email": session.get(AdminUser, staff[0]).email,
+            "doomed_org_id": org_ids[-1],
+            "doomed_owner_email": session.get(AdminUser, users[org_ids[-1]][0][0]).email,
+            "staff_id": staff[1],
+            "doomed_user_id": staff[2],
+            "unassigned_user_id": users[org_id][-1][0],
+            "business_id": org_businesses[0],
+            "other_business_id": org_businesses[1],
+            "doomed_business_id": org_businesses[-1],
+            "assignment_id": assignments[0],
+            "doomed_assignment_id": assignments[1],
+            "customer_id": org_customers[0],
+            "doomed_customer_id": org_customers[-1],
+        }
+
+    # Planner statistics, so the plans are the ones a production-sized table gets
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+    return ids
+
+
+class PlanRecorder:
+    """Engine hook that explains every statement run while a scenario is active"""
+
+    def __init__(self):
+        self.scenario = None
+        self.plans = {}
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.scenario is None or executemany:
+            return
+        sql = " ".join(statement.split())
+        if not re.match(r"(SELECT|UPDATE|DELETE|WITH)\b", sql, re.IGNORECASE):
+            return
+        route_plans = self.plans.setdefault(self.scenario.key, {})
+        if sql in route_plans:
+            return
+        prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+        # A separate DBAPI cursor, so the statement's own results stay unread
+        explain_cursor = conn.connection.cursor()
+        try:
+            explain_cursor.execute(prefix + statement, parameters)
+            rows = explain_cursor.fetchall()
+        finally:
+            explain_cursor.close()
+        route_plans[sql] = [str(row[-1]) if conn.dialect.name == "sqlite" else str(row[0]) for row in rows]
+
+
+def plan_features(plan: list) -> dict:
+    """Tables read in full and whether a temp sort is used, for either dialect"""
+    full_scans = set()
+    temp_sort = False
+    for line in plan:
+        line = line.strip().lstrip("->").strip()
+        sqlite_scan = re.match(r"SCAN (?:TABLE )?(\w+)(.*)", line)
+        if sqlite_scan and "USING" not in sqlite_scan.group(2) and sqlite_scan.group(1) != "CONSTANT":
+            full_scans.add(sqlite_scan.group(1))
+        postgres_scan = re.match(r"(?:Parallel )?Seq Scan on (\w+)", line)
+        if postgres_scan:
+            full_scans.add(postgres_scan.group(1))
+        if "USE TEMP B-TREE" in line or re.match(r"(?:Incremental )?Sort\b", line):
+            temp_sort = True
+    return {"full_scans": full_scans, "temp_sort": temp_sort}
+
+
+def compare(baseline: dict, current: dict) -> tuple:
+    """Returns (regressions, notes) between two {route: {sql: plan}} maps"""
+    regressions, notes = [], []
+    for route, statements in sorted(current.items()):
+        before_route = baseline.get(route)
+        if before_route is None:
+            notes.append(f"new route {route}, record a baseline")
+            continue
+        for sql, plan in statements.items():
+            if sql not in before_route:
+                after = plan_features(plan)
+                if after["full_scans"] or after["temp_sort"]:
+                    notes.append(f"{route}: new statement without a baseline scans/sorts: {sql}\n      " + "\n      ".join(plan))
+                continue
+            before = plan_features(before_route[sql])
+            after = plan_features(plan)
+            new_scans = after["full_scans"] - before["full_scans"]
+            if new_scans:
+                regressions.append(f"{route}: full scan of {', '.join(sorted(new_scans))} (was indexed): {sql}\n      " + "\n      ".join(plan))
+            if after["temp_sort"] and not before["temp_sort"]:
+                regressions.append(f"{route}: now sorts with a temp B-tree: {sql}\n      " + "\n      ".join(plan))
+    return regressions, notes
+
+
+async def run_scenarios(app, recorder: PlanRecorder, ids: dict) -> list:
+    import httpx
+
+    from src.routes import metrics
+    from src.utils.auth import permission_index, principal_cache
+    from src.utils.purge import purger
+
+    # The seeded owner reads the operator-only metrics too
+    metrics.METRICS_ADMIN_EMAILS.add(ids["owner_email"].lower())
+    problems = []
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://plan-guard") as client:
+        tokens = {}
+        for user, email in (("owner", ids["owner_email"]), ("staff", ids["staff_email"]),
+                            ("doomed_owner", ids["doomed_owner_email"])):
+            response = await client.post("/api/auth/login", json={"email": email, "password": SEED_PASSWORD})
+            response.raise_for_status()
+            tokens[user] = response.json()["token"]
+
+        for scenario in SCENARIOS:
+            headers = {"Authorization": f"Bearer {tokens[scenario.user]}"} if scenario.user else {}
+            body = scenario.json(ids) if scenario.json else None
+            # Every route keeps guarding the lookups a cache miss falls back on
+            principal_cache.clear()
+            permission_index.clear()
+            recorder.scenario = scenario
+            try:
+                response = await client.request(scenario.method, scenario.path.format(**ids), headers=headers, json=body)
+                # Background purges a delete started count as that route's statements
+                await purger.idle()
+            finally:
+                recorder.scenario = None
+            if response.status_code >= 400:
+                problems.append(f"{scenario.key} returned {response.status_code}, its plans may be incomplete")
+    return problems
+
+
+def uncovered_routes(app) -> list:
+    from fastapi.routing import APIRoute
+
+    missing = []
+    for route in app.routes:
+        if not isinstance(route, APIRoute) or not route.endpoint.__module__.startswith("src.routes."):
+            continue
+        for method in route.methods:
+            templated = any(
+                scenario.method == method and re.sub(r"\{\w+\}", "{}", scenario.path) == re.sub(r"\{\w+\}", "{}", route.path)
+                for scenario in SCENARIOS
+            )
+            if not templated:
+                missing.append(f"{method} {route.path}")
+    return sorted(missing)
+
+
+async def collect(organizations: int, customers: int) -> tuple:
+    from sqlalchemy import event
+
+    from src.config.database import dispose_engines, engine
+    from src.config import database
+    from src.main import app
+    from src.migrations import runner
+
+    runner.upgrade(engine)
+    ids = seed(engine, organizations, customers)
+
+    recorder = PlanRecorder()
+    sync_engines = {engine, database.async_engine.sync_engine, database.read_engine.sync_engine,
+                    database.writer_engine.sync_engine}
+    for sync_engine in sync_engines:
+        event.listen(sync_engine, "after_cursor_execute", recorder.after_cursor_execute)
+    try:
+        problems = await run_scenarios(app, recorder, ids)
+    finally:
+        await dispose_engines()
+    return engine.dialect.name, recorder.plans, problems + [f"no scenario for {route}" for route in uncovered_routes(app)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.tools.plan_guard", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["record", "check", "show"])
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--database-url", help="scratch database to seed (default: a temporary SQLite file)")
+    parser.add_argument("--organizations", type=int, default=20)
+    parser.add_argument("--customers", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    # The engines are built when src.config.database is imported, so point
+    # them at the scratch database before importing anything from src
+    scratch_dir = None
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        scratch_dir = tempfile.TemporaryDirectory(prefix="plan-guard-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(scratch_dir.name, 'plan_guard.db')}"
+    os.environ["DATABASE_REPLICA_URLS"] = ""
+
+    try:
+        dialect, plans, problems = asyncio.run(collect(args.organizations, args.customers))
+    finally:
+        if scratch_dir is not None:
+            scratch_dir.cleanup()
+
+    for problem in problems:
+        print(f"WARN {problem}")
+
+    if args.command == "show":
+        for route, statements in sorted(plans.items()):
+            print(route)
+            for sql, plan in statements.items():
+                print(f"  {sql}")
+                for line in plan:
+                    print(f"      {line}")
+        return 0
+
+    if args.command == "record":
+        with open(args.baseline, "w") as baseline_file:
+            json.dump({"dialect": dialect, "routes": plans}, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write("\n")
+        print(f"Recorded plans for {len(plans)} routes to {args.baseline}")
+        return 0
+
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline["dialect"] != dialect:
+        print(f"Baseline was recorded on {baseline['dialect']}, not {dialect}; record one for this backend")
+        return 1
+    regressions, notes = compare(baseline["routes"], plans)
+    for note in notes:
+        print(f"NOTE {note}")
+    for regression in regressions:
+        print(f"FAIL {regression}")
+    uncovered = [problem for problem in problems if problem.startswith("no scenario")]
+    if regressions or uncovered:
+        return 1
+    print(f"No plan regressions across {len(plans)} routes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
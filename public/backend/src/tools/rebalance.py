@@ -0,0 +1,367 @@
+"""
+Online tenant rebalancing.
+
+Moves one organization's rows (organizations, admin_users, businesses,
+business_users, customers) to another tenant database while it stays live:
+
+    python -m src.tools.rebalance move 42 sqlite:///./shards/org_42.db
+
+1. Triggers on the source shard log the id of every row of the tenant that
+   changes from then on to ``tenant_changelog``.
+2. The rows are copied in id order, ``--chunk-size`` per transaction, so
+   the app's writers are never blocked for long.
+3. The changelog is replayed until it is nearly empty: each logged row is
+   re-read from the source and upserted into, or deleted from, the target.
+4. Writes are fenced: ``tenant_shards.write_fenced`` is set and the tool
+   waits until every process has re-read the placement
+   (TENANT_PLACEMENT_TTL) plus ``--grace`` for writes already in flight.
+   Fenced writes get a 503 with Retry-After; reads keep being served.
+5. The last changes are replayed, then row counts and checksums are
+   compared table by table. If they match, the placement flips to the
+   target and the fence is lifted in one catalog transaction. If not,
+   the fence is lifted, the copy removed and the tenant stays put.
+6. After another TTL, when no process can route to it any more, the
+   source copy is deleted (unless ``--keep-source``).
+
+Row ids are kept, tokens and clients hold them. If the target already has
+rows with those ids belonging to another organization the move aborts.
+Change capture uses SQLite triggers, so the source must be a SQLite shard.
+"""
+import argparse
+import hashlib
+import sys
+import time
+
+from sqlalchemy import bindparam, delete, func, insert, not_, select, text, update
+from sqlalchemy.engine import make_url
+
+from src.config.database import DATABASE_URL, create_db_engine
+from src.config.sharding import TENANT_CATALOG_URL, TENANT_PLACEMENT_TTL, migrate_shard
+from src.models.database import AdminUser, Business, BusinessUser, Customer, Organization, TenantShard
+
+CHANGELOG_TABLE = "tenant_changelog"
+# Parents before children: the order rows are copied and upserted in
+TABLES = [Organization.__table__, AdminUser.__table__, Business.__table__, BusinessUser.__table__, Customer.__table__]
+
+
+class RebalanceError(Exception):
+    pass
+
+
+def _owned(table, organization_id: int):
+    """WHERE clause selecting the tenant's rows of ``table``"""
+    if table is Organization.__table__:
+        return table.c.id == organization_id
+    if table is BusinessUser.__table__:
+        businesses = Business.__table__
+        return table.c.business_id.in_(
+            select(businesses.c.id).where(businesses.c.organization_id == organization_id)
+        )
+    return table.c.organization_id == organization_id
+
+
+def _trigger_condition(table, organization_id: int, row: str) -> str:
+    if table is Organization.__table__:
+        return f"{row}.id = {organization_id}"
+    if table is BusinessUser.__table__:
+        return f"(SELECT organization_id FROM businesses WHERE id = {row}.business_id) = {organization_id}"
+    return f"{row}.organization_id = {organization_id}"
+
+
+def _trigger_names(organization_id: int) -> list:
+    return [
+        f"tenant_move_{organization_id}_{table.name}_{operation.lower()}"
+        for table in TABLES for operation in ("INSERT", "UPDATE", "DELETE")
+    ]
+
+
+def start_capture(engine, organization_id: int):
+    """Create the changelog and the triggers that fill it"""
+    with engine.begin() as connection:
+        existing = set(connection.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE :prefix"),
+            {"prefix": f"tenant_move_{organization_id}_%"},
+        ).scalars())
+        if existing:
+            raise RebalanceError(f"a move of organization {organization_id} is already in progress")
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {CHANGELOG_TABLE} ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " organization_id INTEGER NOT NULL,"
+            " table_name VARCHAR(64) NOT NULL,"
+            " row_id INTEGER NOT NULL)"
+        ))
+        names = iter(_trigger_names(organization_id))
+        for table in TABLES:
+            for operation in ("INSERT", "UPDATE", "DELETE"):
+                row = "OLD" if operation == "DELETE" else "NEW"
+                connection.execute(text(
+                    f"CREATE TRIGGER {next(names)} AFTER {operation} ON {table.name}"
+                    f" WHEN {_trigger_condition(table, organization_id, row)}"
+                    f" BEGIN INSERT INTO {CHANGELOG_TABLE} (organization_id, table_name, row_id)"
+                    f" VALUES ({organization_id}, '{table.name}', {row}.id); END"
+                ))
+
+
+def stop_capture(engine, organization_id: int):
+    """Drop the triggers and the tenant's changelog rows (and the table once unused)"""
+    with engine.begin() as connection:
+        for name in _trigger_names(organization_id):
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+        connection.execute(
+            text(f"DELETE FROM {CHANGELOG_TABLE} WHERE organization_id = :organization_id"),
+            {"organization_id": organization_id},
+        )
+        other_moves = connection.execute(text(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'tenant_move_%'"
+        )).scalar()
+        if not other_moves:
+            connection.execute(text(f"DROP TABLE IF EXISTS {CHANGELOG_TABLE}"))
+
+
+def check_collisions(target, organization_id: int, table, ids: list):
+    """Fail if ``ids`` are taken in the target by another organization's rows"""
+    with target.connect() as connection:
+        taken = connection.execute(
+            select(table.c.id).where(table.c.id.in_(ids), not_(_owned(table, organization_id))).limit(5)
+        ).scalars().all()
+    if taken:
+        raise RebalanceError(f"{table.name} ids {taken} already belong to another organization in the target")
+
+
+def upsert_rows(target, organization_id: int, table, rows: list):
+    if not rows:
+        return
+    ids = [row["id"] for row in rows]
+    check_collisions(target, organization_id, table, ids)
+    with target.begin() as connection:
+        existing = set(connection.execute(select(table.c.id).where(table.c.id.in_(ids))).scalars())
+        new_rows = [row for row in rows if row["id"] not in existing]
+        changed_rows = [{**row, "_id": row["id"]} for row in rows if row["id"] in existing]
+        if new_rows:
+            connection.execute(insert(table), new_rows)
+        if changed_rows:
+            connection.execute(
+                update(table).where(table.c.id == bindparam("_id")),
+                changed_rows,
+            )
+
+
+def copy_table(source, target, organization_id: int, table, chunk_size: int) -> int:
+    """Copy the tenant's rows of ``table`` in id order, one chunk per transaction"""
+    copied, last_id = 0, 0
+    while True:
+        with source.connect() as connection:
+            rows = [dict(row) for row in connection.execute(
+                select(table).where(_owned(table, organization_id), table.c.id > last_id)
+                .order_by(table.c.id).limit(chunk_size)
+            ).mappings()]
+        if not rows:
+            return copied
+        upsert_rows(target, organization_id, table, rows)
+        copied += len(rows)
+        last_id = rows[-1]["id"]
+
+
+def replay_changes(source, target, organization_id: int, chunk_size: int) -> int:
+    """Apply one batch of logged changes to the target; returns how many were logged"""
+    with source.connect() as connection:
+        logged = connection.execute(text(
+            f"SELECT seq, table_name, row_id FROM {CHANGELOG_TABLE}"
+            " WHERE organization_id = :organization_id ORDER BY seq LIMIT :limit"
+        ), {"organization_id": organization_id, "limit": chunk_size}).all()
+        if not logged:
+            return 0
+        changed = {table.name: set() for table in TABLES}
+        for _, table_name, row_id in logged:
+            changed[table_name].add(row_id)
+        current = {}
+        for table in TABLES:
+            ids = changed[table.name]
+            current[table.name] = [dict(row) for row in connection.execute(
+                select(table).where(table.c.id.in_(ids), _owned(table, organization_id)).order_by(table.c.id)
+            ).mappings()] if ids else []
+
+    # Rows the source no longer has (deleted, or moved to another tenant)
+    gone = {
+        table.name: changed[table.name] - {row["id"] for row in current[table.name]}
+        for table in TABLES
+    }
+    with target.begin() as connection:
+        assignments = BusinessUser.__table__
+        # SQLite shards do not enforce foreign keys, so the cascades are done here
+        if gone[Business.__tablename__]:
+            connection.execute(delete(assignments).where(assignments.c.business_id.in_(gone[Business.__tablename__])))
+        if gone[AdminUser.__tablename__]:
+            connection.execute(delete(assignments).where(assignments.c.admin_user_id.in_(gone[AdminUser.__tablename__])))
+        for table in reversed(TABLES):
+            if gone[table.name]:
+                connection.execute(delete(table).where(table.c.id.in_(gone[table.name]), _owned(table, organization_id)))
+    for table in TABLES:
+        upsert_rows(target, organization_id, table, current[table.name])
+
+    with source.begin() as connection:
+        connection.execute(text(
+            f"DELETE FROM {CHANGELOG_TABLE} WHERE organization_id = :organization_id AND seq <= :seq"
+        ), {"organization_id": organization_id, "seq": logged[-1][0]})
+    return len(logged)
+
+
+def checksums(engine, organization_id: int) -> dict:
+    """Row count and SHA-256 over the tenant's rows, per table"""
+    result = {}
+    with engine.connect() as connection:
+        for table in TABLES:
+            digest, count = hashlib.sha256(), 0
+            for row in connection.execute(select(table).where(_owned(table, organization_id)).order_by(table.c.id)):
+                digest.update(repr(tuple(row)).encode())
+                count += 1
+            result[table.name] = (count, digest.hexdigest())
+    return result
+
+
+def purge_tenant(engine, organization_id: int, keep_organization: bool, chunk_size: int):
+    """Delete the tenant's rows, children first, a chunk per transaction"""
+    for table in reversed(TABLES):
+        if keep_organization and table is Organization.__table__:
+            continue
+        while True:
+            with engine.begin() as connection:
+                ids = connection.execute(
+                    select(table.c.id).where(_owned(table, organization_id)).limit(chunk_size)
+                ).scalars().all()
+                if not ids:
+                    break
+                connection.execute(delete(table).where(table.c.id.in_(ids)))
+
+
+def bump_sequences(engine):
+    """Postgres sequences do not move on explicit ids; keep them past the copied rows"""
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as connection:
+        for table in TABLES:
+            connection.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'),"
+                f" GREATEST((SELECT MAX(id) FROM {table.name}), 1))"
+            ))
+
+
+def set_placement(catalog, organization_id: int, url: str, fenced: bool):
+    shards = TenantShard.__table__
+    with catalog.begin() as connection:
+        values = {"shard_url": url, "write_fenced": fenced, "updated_at": func.now()}
+        updated = connection.execute(
+            update(shards).where(shards.c.organization_id == organization_id).values(**values)
+        ).rowcount
+        if not updated:
+            connection.execute(insert(shards).values(organization_id=organization_id, **values))
+
+
+def _display(url: str) -> str:
+    return make_url(url).render_as_string(hide_password=True)
+
+
+def move(organization_id: int, target_url: str, chunk_size: int = 1000, grace: float = 5.0,
+         max_lag: int = 100, max_rounds: int = 50, keep_source: bool = False):
+    catalog = create_db_engine(TENANT_CATALOG_URL, name="rebalance-catalog")
+    try:
+        with catalog.connect() as connection:
+            if connection.execute(select(Organization.id).where(Organization.id == organization_id)).first() is None:
+                raise RebalanceError(f"organization {organization_id} does not exist")
+            source_url = connection.execute(
+                select(TenantShard.shard_url).where(TenantShard.organization_id == organization_id)
+            ).scalar() or DATABASE_URL
+        if make_url(source_url) == make_url(target_url):
+            raise RebalanceError(f"organization {organization_id} already lives in {_display(target_url)}")
+        if make_url(source_url).get_backend_name() != "sqlite":
+            raise RebalanceError("change capture needs a SQLite source shard")
+        migrate_shard(target_url)
+        source = create_db_engine(source_url, name="rebalance-source")
+        target = create_db_engine(target_url, name="rebalance-target")
+        try:
+            _move(catalog, source, target, organization_id, source_url, target_url,
+                  chunk_size, grace, max_lag, max_rounds, keep_source)
+        finally:
+            source.dispose()
+            target.dispose()
+    finally:
+        catalog.dispose()
+
+
+def _move(catalog, source, target, organization_id, source_url, target_url,
+          chunk_size, grace, max_lag, max_rounds, keep_source):
+    print(f"Moving organization {organization_id}: {_display(source_url)} -> {_display(target_url)}")
+    start_capture(source, organization_id)
+    fenced = False
+    try:
+        for table in TABLES:
+            copied = copy_table(source, target, organization_id, table, chunk_size)
+            print(f"  copied {copied} {table.name} rows")
+
+        for _ in range(max_rounds):
+            applied = replay_changes(source, target, organization_id, chunk_size)
+            if applied <= max_lag:
+                break
+        print("  caught up with live changes, fencing writes")
+
+        set_placement(catalog, organization_id, source_url, fenced=True)
+        fenced = True
+        time.sleep(TENANT_PLACEMENT_TTL + grace)
+        while replay_changes(source, target, organization_id, chunk_size):
+            pass
+
+        expected, actual = checksums(source, organization_id), checksums(target, organization_id)
+        for table in TABLES:
+            (source_rows, source_sum), (target_rows, target_sum) = expected[table.name], actual[table.name]
+            state = "ok" if (source_rows, source_sum) == (target_rows, target_sum) else "MISMATCH"
+            print(f"  {table.name}: {source_rows} / {target_rows} rows, checksum {state}")
+        if expected != actual:
+            raise RebalanceError("source and target differ after the final replay")
+
+        bump_sequences(target)
+        set_placement(catalog, organization_id, target_url, fenced=False)
+        fenced = False
+        print(f"  organization {organization_id} now lives in {_display(target_url)}")
+    except BaseException:
+        if fenced:
+            set_placement(catalog, organization_id, source_url, fenced=False)
+        stop_capture(source, organization_id)
+        purge_tenant(target, organization_id, keep_organization=target_url == TENANT_CATALOG_URL, chunk_size=chunk_size)
+        raise
+
+    stop_capture(source, organization_id)
+    if keep_source:
+        return
+    # Processes that cached the old (fenced) placement may still read from it
+    time.sleep(TENANT_PLACEMENT_TTL + grace)
+    purge_tenant(source, organization_id, keep_organization=source_url == TENANT_CATALOG_URL, chunk_size=chunk_size)
+    print("  removed the source copy")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.tools.rebalance", description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    move_parser = commands.add_parser("move", help="move an organization to another tenant database")
+    move_parser.add_argument("organization_id", type=int)
+    move_parser.add_argument("target_url", help="SQLAlchemy URL of the tenant database to move to")
+    move_parser.add_argument("--chunk-size", type=int, default=1000, help="rows per copy transaction")
+    move_parser.add_argument("--grace", type=float, default=5.0,
+                             help="seconds to wait, on top of TENANT_PLACEMENT_TTL, for in-flight writes")
+    move_parser.add_argument("--max-lag", type=int, default=100,
+                             help="fence writes once a replay round applies at most this many changes")
+    move_parser.add_argument("--keep-source", action="store_true", help="leave the rows in the old database")
+    args = parser.parse_args(argv)
+
+    if args.command == "move":
+        try:
+            move(args.organization_id, args.target_url, chunk_size=args.chunk_size, grace=args.grace,
+                 max_lag=args.max_lag, keep_source=args.keep_source)
+        except RebalanceError as exc:
+            print(f"Move aborted: {exc}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
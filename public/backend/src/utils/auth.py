@@ -1,15 +1,22 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
 from dotenv import load_dotenv
 
-from src.config.database import get_db
+from src.config.sharding import TENANT_PLACEMENT_TTL, Shard, TenantMoving, shard_for
 from src.models.database import AdminUser
+from src.utils.consistency import CONSISTENCY_HEADER
+from src.utils.permission_index import BusinessPermission, PermissionIndex, UserPermissions
+from src.utils.password_pool import PasswordPool, PasswordPoolFull, password_context
+from src.utils.principal_cache import Principal, PrincipalCache
+from src.utils.token_cache import TokenCache
+from src.repositories import businesses as business_repository
+from src.repositories import users as user_repository
+from src.utils.sql_metrics import set_request_tenant
 
 load_dotenv()
 
@@ -17,14 +24,74 @@ SECRET_KEY = os.getenv("JWT_SECRET", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = int(os.getenv("JWT_EXPIRES_IN", "7").replace("d", "")) if "d" in os.getenv("JWT_EXPIRES_IN", "7d") else 7
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# Authenticated users by (organization, id); size or TTL 0 turns it off.
+# Token revocation (token_version) takes effect at once in the process that
+# made the change; other workers keep accepting the old tokens until their
+# entry expires, so the TTL is that window
+principal_cache = PrincipalCache(
+    max_size=int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("PRINCIPAL_CACHE_TTL", "5")),
+)
+# Effective permissions per business by (organization, user); size or TTL 0 turns it off
+permission_index = PermissionIndex(
+    max_size=int(os.getenv("PERMISSION_INDEX_SIZE", "10000")),
+    ttl=float(os.getenv("PERMISSION_INDEX_TTL", "30")),
+)
+# Validated JWT claims by token digest; size 0 turns it off
+token_cache = TokenCache(max_size=int(os.getenv("TOKEN_CACHE_SIZE", "10000")))
+
+def revoke_tokens(user: AdminUser):
+    """
+    Invalidate every token issued to ``user`` so far; commit, then call
+    ``forget_user``. Other worker processes notice within PRINCIPAL_CACHE_TTL.
+    """
+    user.token_version = (user.token_version or 0) + 1
+
+def forget_user(organization_id: int, user_id: int):
+    """Drop what this process cached about a user; call after committing a change to them"""
+    principal_cache.invalidate(organization_id, user_id)
+    token_cache.revoke_user(organization_id, user_id)
+
+def forget_organization(organization_id: int):
+    """Drop everything this process cached about users; for an organization-wide change, rare enough"""
+    principal_cache.clear()
+    token_cache.clear()
+    permission_index.clear()
+
+# bcrypt for request handlers, in worker processes; see src/utils/password_pool.py
+password_pool = PasswordPool(
+    workers=int(os.getenv("PASSWORD_WORKERS", "0")) or os.cpu_count() or 1,
+    queue_limit=int(os.getenv("PASSWORD_QUEUE_LIMIT", "32")),
+)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    """Blocking; scripts only, request handlers use ``check_password``"""
+    return password_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    """Blocking; scripts only, request handlers use ``hash_password``"""
+    return password_context().hash(password)
+
+def _password_pool_full() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-ins in progress, retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
+async def check_password(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return await password_pool.verify(plain_password, hashed_password)
+    except PasswordPoolFull:
+        raise _password_pool_full()
+
+async def hash_password(password: str) -> str:
+    try:
+        return await password_pool.hash(password)
+    except PasswordPoolFull:
+        raise _password_pool_full()
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -36,27 +103,111 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def decode_access_token(token: str) -> dict:
+    digest = token_cache.digest(token)
+    payload = token_cache.get(digest)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: int = payload.get("userId")
-        if user_id is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
-    
-    user = db.query(AdminUser).filter(AdminUser.id == user_id).first()
+        raise _credentials_exception()
+    if payload.get("userId") is None or payload.get("organizationId") is None:
+        raise _credentials_exception()
+    token_cache.put(digest, payload)
+    return payload
+
+# Tenant databases. The JWT's organizationId claim picks the shard before
+# the user is loaded, so get_current_user and the route share one session.
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+async def tenant_shard_for(organization_id: int, write: bool = False) -> Shard:
+    """``shard_for`` with a fenced tenant (being rebalanced) turned into a 503"""
+    try:
+        return await shard_for(organization_id, write=write)
+    except TenantMoving:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Organization is being moved to another database, retry shortly",
+            headers={"Retry-After": str(max(1, round(TENANT_PLACEMENT_TTL)))},
+        )
+
+async def get_tenant_shard(request: Request, token: str = Depends(oauth2_scheme)) -> Shard:
+    return await tenant_shard_for(
+        decode_access_token(token)["organizationId"], write=request.method not in SAFE_METHODS
+    )
+
+async def get_tenant_db(shard: Shard = Depends(get_tenant_shard)):
+    async with shard.session() as db:
+        yield db
+
+async def get_tenant_read_db(request: Request, shard: Shard = Depends(get_tenant_shard)):
+    async with shard.read_session(request.headers.get(CONSISTENCY_HEADER)) as db:
+        yield db
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_tenant_db)) -> Principal:
+    payload = decode_access_token(token)
+    user = principal_cache.get(payload["organizationId"], payload["userId"])
     if user is None:
-        raise credentials_exception
+        generation = principal_cache.generation()
+        row = await user_repository.get_user(db, payload["userId"])
+        # End the read transaction so the connection goes back to the pool while
+        # the handler runs (e.g. waiting on the write queue); the session
+        # checks one out again if the handler uses it
+        await db.commit()
+        if row is None or row.organization_id != payload["organizationId"]:
+            raise _credentials_exception()
+        user = Principal.from_user(row)
+        principal_cache.put(user, generation)
+    # Everything a handler reads now matches the claims the token was issued
+    # with, unless the user changed since, which bumped token_version (tokens
+    # from before this column count as version 0)
+    if payload.get("tokenVersion", 0) != user.token_version:
+        raise _credentials_exception()
+    set_request_tenant(user.organization_id)
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return user
 
-async def get_current_active_user(current_user: AdminUser = Depends(get_current_user)):
+async def get_current_active_user(current_user: Principal = Depends(get_current_user)):
     return current_user
 
+
+async def get_user_permissions(db: AsyncSession, user: Principal) -> UserPermissions:
+    """``user``'s entry in the permission index, loaded with one query on a miss"""
+    permissions = permission_index.get(user.organization_id, user.id, user.role)
+    if permissions is None:
+        generation = permission_index.generation()
+        roles = await business_repository.get_business_roles(db, user.id, user.organization_id, user.role)
+        permissions = UserPermissions(
+            organization_role=user.role,
+            businesses={business_id: BusinessPermission.for_role(role) for business_id, role in roles.items()},
+        )
+        permission_index.put(user.organization_id, user.id, permissions, generation)
+    return permissions
+
+async def require_business_action(db: AsyncSession, user: Principal, business_id: int, action: str):
+    """404 unless ``user`` can see the business, 403 unless they may do ``action`` in it.
+
+    Organization owners may do everything in their organization's businesses,
+    so callers check the business belongs to it; that needs no index lookup.
+    """
+    if user.role == "owner":
+        return
+    permissions = await get_user_permissions(db, user)
+    permission = permissions.businesses.get(business_id)
+    if permission is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Business not found")
+    if action not in permission.actions:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Your role in this business ({permission.role}) does not allow {action}",
+        )
@@ -0,0 +1,218 @@
+"""
+Online snapshots of SQLite databases.
+
+``take_snapshot`` copies a live database with SQLite's backup API, a few
+pages per step and a short pause between steps, so the copy never holds a
+lock long enough to stall the app's writers. A write from another
+connection makes SQLite restart the copy; after BACKUP_MAX_RESTARTS
+restarts the remaining copy is done in one step, which in WAL mode only
+holds a read snapshot and still does not block writers.
+
+Each snapshot is checked with ``PRAGMA quick_check``, optionally gzipped,
+and written next to a JSON manifest (source, time, pages, SHA-256):
+
+    BACKUP_DIR/<database name>/<database name>-<UTC timestamp>.db[.gz]
+
+``rotate`` keeps the newest BACKUP_KEEP snapshots of each database. The
+maintenance scheduler takes one every BACKUP_INTERVAL seconds (0 turns it
+off); ``python -m src.tools.backup`` takes, lists and restores them by hand.
+
+Snapshots never change once written, so they double as read-only sources
+for reporting jobs that should not load the live database, see
+``reporting_url``.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", "./backups")
+BACKUP_INTERVAL = float(os.getenv("BACKUP_INTERVAL", "0"))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+BACKUP_COMPRESS = os.getenv("BACKUP_COMPRESS", "True").strip().lower() in ("1", "true", "yes", "on")
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))
+BACKUP_STEP_SLEEP_MS = float(os.getenv("BACKUP_STEP_SLEEP_MS", "5"))
+BACKUP_MAX_RESTARTS = int(os.getenv("BACKUP_MAX_RESTARTS", "3"))
+
+MANIFEST_SUFFIX = ".json"
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def _name(database_path: str) -> str:
+    return os.path.splitext(os.path.basename(database_path))[0]
+
+
+def snapshot_dir(database_path: str) -> str:
+    return os.path.join(BACKUP_DIR, _name(database_path))
+
+
+def list_snapshots(database_path: str) -> list:
+    """Manifests of ``database_path``'s snapshots, newest first"""
+    directory = snapshot_dir(database_path)
+    if not os.path.isdir(directory):
+        return []
+    manifests = []
+    for entry in sorted(os.listdir(directory), reverse=True):
+        if entry.endswith(MANIFEST_SUFFIX):
+            with open(os.path.join(directory, entry)) as manifest:
+                manifests.append(json.load(manifest))
+    return manifests
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as snapshot:
+        for block in iter(lambda: snapshot.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _copy(source: sqlite3.Connection, target: sqlite3.Connection, pages_per_step: int, step_sleep: float) -> int:
+    """Back ``source`` up into ``target``; returns how many times the copy restarted"""
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > BACKUP_MAX_RESTARTS:
+                raise _TooManyRestarts()
+        last_remaining = remaining
+        if remaining and step_sleep:
+            time.sleep(step_sleep)  # let writers have the file between steps
+
+    try:
+        source.backup(target, pages=pages_per_step, progress=progress)
+    except _TooManyRestarts:
+        source.backup(target)
+    return restarts
+
+
+def take_snapshot(
+    source: sqlite3.Connection,
+    database_path: str,
+    compress: bool = BACKUP_COMPRESS,
+    pages_per_step: int = BACKUP_PAGES_PER_STEP,
+    step_sleep_ms: float = BACKUP_STEP_SLEEP_MS,
+) -> dict:
+    """Snapshot the database ``source`` is connected to; returns its manifest"""
+    directory = snapshot_dir(database_path)
+    os.makedirs(directory, exist_ok=True)
+    created = datetime.now(timezone.utc)
+    base = os.path.join(directory, f"{_name(database_path)}-{created:%Y%m%dT%H%M%S%fZ}")
+    partial = f"{base}.db.partial"
+
+    start = time.perf_counter()
+    target = sqlite3.connect(partial)
+    try:
+        restarts = _copy(source, target, pages_per_step, step_sleep_ms / 1000)
+        pages = target.execute("PRAGMA page_count").fetchone()[0]
+        check = target.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        target.close()
+    if check != "ok":
+        os.remove(partial)
+        raise RuntimeError(f"snapshot of {database_path} failed quick_check: {check}")
+
+    if compress:
+        path = f"{base}.db.gz"
+        with open(partial, "rb") as raw, gzip.open(path, "wb", compresslevel=6) as packed:
+            shutil.copyfileobj(raw, packed, 1024 * 1024)
+        os.remove(partial)
+    else:
+        path = f"{base}.db"
+        os.replace(partial, path)
+
+    manifest = {
+        "database": os.path.abspath(database_path),
+        "snapshot": os.path.abspath(path),
+        "created_at": created.isoformat(),
+        "compressed": compress,
+        "pages": pages,
+        "bytes": os.path.getsize(path),
+        "sha256": _sha256(path),
+        "restarts": restarts,
+        "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+    }
+    with open(base + MANIFEST_SUFFIX, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    return manifest
+
+
+def snapshot_file(database_path: str, **options) -> dict:
+    source = sqlite3.connect(database_path)
+    try:
+        return take_snapshot(source, database_path, **options)
+    finally:
+        source.close()
+
+
+def rotate(database_path: str, keep: int = BACKUP_KEEP) -> list:
+    """Delete all but the newest ``keep`` snapshots; returns the removed files"""
+    removed = []
+    for manifest in list_snapshots(database_path)[keep:]:
+        base = manifest["snapshot"].rsplit(".db", 1)[0]
+        for path in (manifest["snapshot"], base + MANIFEST_SUFFIX, base + ".db.reporting"):
+            if os.path.exists(path):
+                os.remove(path)
+                removed.append(path)
+    return removed
+
+
+def _verified(manifest: dict) -> str:
+    path = manifest["snapshot"]
+    if _sha256(path) != manifest["sha256"]:
+        raise RuntimeError(f"{path} does not match the checksum in its manifest")
+    return path
+
+
+def materialize(manifest: dict) -> str:
+    """Path of an uncompressed copy of the snapshot, unpacking it once if needed"""
+    path = _verified(manifest)
+    if not manifest["compressed"]:
+        return path
+    unpacked = path.rsplit(".db", 1)[0] + ".db.reporting"
+    if not os.path.exists(unpacked):
+        with gzip.open(path, "rb") as packed, open(unpacked + ".partial", "wb") as raw:
+            shutil.copyfileobj(packed, raw, 1024 * 1024)
+        os.replace(unpacked + ".partial", unpacked)
+    return unpacked
+
+
+def restore(manifest: dict, target_path: str):
+    """
+    Overwrite ``target_path`` with the snapshot, through the backup API so
+    the target's WAL is handled. Stop the app (or everything using the
+    target) first; open connections would keep serving the old pages.
+    """
+    source = sqlite3.connect(f"file:{materialize(manifest)}?mode=ro", uri=True)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+        check = target.execute("PRAGMA quick_check").fetchone()[0]
+        if check != "ok":
+            raise RuntimeError(f"restored database failed quick_check: {check}")
+    finally:
+        target.close()
+        source.close()
+
+
+def reporting_url(database_path: str) -> Optional[str]:
+    """
+    Read-only SQLAlchemy URL of the newest snapshot of ``database_path``,
+    e.g. ``create_db_engine(reporting_url(path), name="reporting", read_only=True)``.
+    The file never changes, so SQLite opens it immutable: no locks, no WAL.
+    """
+    snapshots = list_snapshots(database_path)
+    if not snapshots:
+        return None
+    return f"sqlite:///file:{os.path.abspath(materialize(snapshots[0]))}?mode=ro&immutable=1&uri=true"
@@ -0,0 +1,52 @@
+import time
+from typing import Optional
+
+# Read-your-writes tokens.
+#
+# A successful write response carries X-Consistency-Token, the commit time in
+# milliseconds. A client that wants to see its own write echoes the token back
+# on its next reads; while the write is younger than the replicas' maximum lag
+# those reads are served by the primary instead of a replica that may not
+# have caught up yet. Clients that never send the header read from replicas.
+
+CONSISTENCY_HEADER = "X-Consistency-Token"
+
+_SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+def issue_token() -> str:
+    return str(int(time.time() * 1000))
+
+
+def requires_primary(token: Optional[str], max_lag: float) -> bool:
+    """True while a write identified by ``token`` may not be on the replicas yet"""
+    if not token:
+        return False
+    try:
+        written_at = int(token) / 1000
+    except ValueError:
+        return False
+    now = time.time()
+    # A token from the future cannot pin a client for longer than max_lag
+    return now - min(written_at, now) < max_lag
+
+
+class ConsistencyTokenMiddleware:
+    """Stamps successful write responses with a fresh consistency token"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in _SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_token(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                headers = list(message.get("headers", []))
+                headers.append((CONSISTENCY_HEADER.lower().encode(), issue_token().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_token)
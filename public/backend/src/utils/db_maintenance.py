@@ -0,0 +1,284 @@
+"""
+Background SQLite maintenance.
+
+SQLite leaves upkeep to the application: query planner statistics go stale
+as tables grow, a long-lived WAL file is only reset by a checkpoint nobody
+is reading through, and pages freed by deletes are only returned to the
+filesystem by a vacuum. ``MaintenanceScheduler`` runs that upkeep from the
+app process for every SQLite file the app has engines for (the main
+database, the catalog and open tenant shards):
+
+- ``wal_checkpoint``: ``PRAGMA wal_checkpoint(PASSIVE)``, escalated to
+  TRUNCATE once the WAL file is larger than MAINTENANCE_WAL_TRUNCATE_MB
+- ``optimize``: ``PRAGMA optimize``, which re-analyzes tables whose
+  statistics look stale
+- ``analyze``: a full ``ANALYZE``
+- ``incremental_vacuum``: frees pages in small steps; needs the database to
+  be in ``auto_vacuum=INCREMENTAL`` mode (new databases are, see
+  SQLITE_AUTO_VACUUM; an existing one converts on its next full VACUUM)
+- ``snapshot``: an online backup (``src/utils/backups.py``) every
+  BACKUP_INTERVAL seconds, if set
+
+Files the app only opens read-only (replicas) are left alone. Apart from
+snapshots, which copy a few pages at a time whatever the load, a task only
+starts once no connection to the file has been checked out of any app
+pool for MAINTENANCE_IDLE_SECONDS. It runs in a worker thread on
+a connection of its own with a short busy timeout, so it gives way to a
+request that grabs the lock instead of holding the request up. ANALYZE
+is bounded by ``analysis_limit``.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+
+from src.utils import backups
+
+logger = logging.getLogger(__name__)
+
+
+def sqlite_path(url) -> Optional[str]:
+    """Absolute path of a SQLite database file, None for other backends and :memory:"""
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return None
+    return os.path.abspath(url.database)
+
+
+class DatabaseActivity:
+    """Connections checked out of the app's pools, and when the last one came back, per SQLite file"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._files = {}  # path -> [checked out, last checkin]
+        self._writable = set()
+
+    def attach(self, sync_engine, read_only: bool = False):
+        path = sqlite_path(sync_engine.url)
+        if path is None:
+            return
+        with self._lock:
+            self._files.setdefault(path, [0, time.monotonic()])
+            if not read_only:
+                self._writable.add(path)
+
+        def checkout(dbapi_connection, connection_record, connection_proxy):
+            with self._lock:
+                self._files[path][0] += 1
+
+        def checkin(dbapi_connection, connection_record):
+            with self._lock:
+                state = self._files[path]
+                state[0] = max(0, state[0] - 1)
+                state[1] = time.monotonic()
+
+        event.listen(sync_engine, "checkout", checkout)
+        event.listen(sync_engine, "checkin", checkin)
+
+    def paths(self) -> list:
+        """Files the app writes to"""
+        with self._lock:
+            return [path for path in self._files if path in self._writable]
+
+    def idle_for(self, path: str) -> float:
+        """Seconds since the file was last used, 0 while a connection is checked out"""
+        with self._lock:
+            checked_out, last_checkin = self._files.get(path, (0, time.monotonic()))
+        return 0.0 if checked_out else time.monotonic() - last_checkin
+
+
+@dataclass
+class MaintenanceTask:
+    name: str
+    interval: float  # seconds between runs, per database
+    run: Callable  # (connection, scheduler, path) -> dict of details
+    requires_idle: bool = True
+
+
+def _wal_checkpoint(connection, scheduler, path) -> dict:
+    busy, log_pages, checkpointed = connection.exec_driver_sql("PRAGMA wal_checkpoint(PASSIVE)").one()
+    details = {"mode": "PASSIVE", "busy": bool(busy), "wal_pages": log_pages, "checkpointed": checkpointed}
+    wal = f"{path}-wal"
+    wal_size = os.path.getsize(wal) if os.path.exists(wal) else 0
+    details["wal_bytes"] = wal_size
+    if wal_size > scheduler.wal_truncate_bytes and log_pages == checkpointed:
+        # Everything is in the database file; TRUNCATE resets the WAL to zero
+        # bytes, waiting at most the busy timeout for readers to move on
+        busy, _, _ = connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)").one()
+        details.update(mode="TRUNCATE", busy=bool(busy))
+        details["wal_bytes"] = os.path.getsize(wal) if os.path.exists(wal) else 0
+    return details
+
+
+def _optimize(connection, scheduler, path) -> dict:
+    connection.exec_driver_sql(f"PRAGMA analysis_limit={scheduler.analysis_limit}")
+    connection.exec_driver_sql("PRAGMA optimize")
+    return {}
+
+
+def _analyze(connection, scheduler, path) -> dict:
+    connection.exec_driver_sql(f"PRAGMA analysis_limit={scheduler.analysis_limit}")
+    connection.exec_driver_sql("ANALYZE")
+    return {}
+
+
+def _incremental_vacuum(connection, scheduler, path) -> dict:
+    mode = connection.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+    free = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+    if mode != 2:
+        return {"skipped": "auto_vacuum is not INCREMENTAL", "free_pages": free}
+    freed = 0
+    # Small steps, each its own write transaction, stopping as soon as the
+    # app touches the database again
+    while free > 0 and scheduler.activity.idle_for(path) >= scheduler.idle_seconds:
+        connection.exec_driver_sql(f"PRAGMA incremental_vacuum({scheduler.vacuum_step_pages})")
+        connection.commit()
+        remaining = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+        freed += free - remaining
+        if remaining >= free:
+            break
+        free = remaining
+    return {"freed_pages": freed, "free_pages": free}
+
+
+def _snapshot(connection, scheduler, path) -> dict:
+    manifest = backups.take_snapshot(connection.connection.driver_connection, path)
+    return {**manifest, "rotated_out": len(backups.rotate(path))}
+
+
+def default_tasks() -> list:
+    tasks = [
+        MaintenanceTask("wal_checkpoint", float(os.getenv("MAINTENANCE_CHECKPOINT_INTERVAL", "60")), _wal_checkpoint),
+        MaintenanceTask("optimize", float(os.getenv("MAINTENANCE_OPTIMIZE_INTERVAL", "3600")), _optimize),
+        MaintenanceTask("analyze", float(os.getenv("MAINTENANCE_ANALYZE_INTERVAL", "86400")), _analyze),
+        MaintenanceTask("incremental_vacuum", float(os.getenv("MAINTENANCE_VACUUM_INTERVAL", "600")), _incremental_vacuum),
+    ]
+    if backups.BACKUP_INTERVAL > 0:
+        tasks.append(MaintenanceTask("snapshot", backups.BACKUP_INTERVAL, _snapshot, requires_idle=False))
+    return tasks
+
+
+class MaintenanceScheduler:
+    """Runs ``tasks`` against every SQLite file ``activity`` knows of, see the module docstring"""
+
+    def __init__(
+        self,
+        activity: DatabaseActivity,
+        tasks: Optional[list] = None,
+        idle_seconds: float = 2.0,
+        poll_seconds: float = 5.0,
+        busy_timeout_ms: int = 100,
+        analysis_limit: int = 1000,
+        wal_truncate_mb: float = 64,
+        vacuum_step_pages: int = 256,
+    ):
+        self.activity = activity
+        self.tasks = tasks if tasks is not None else default_tasks()
+        self.idle_seconds = idle_seconds
+        self.poll_seconds = poll_seconds
+        self.busy_timeout_ms = busy_timeout_ms
+        self.analysis_limit = analysis_limit
+        self.wal_truncate_bytes = wal_truncate_mb * 1024 * 1024
+        self.vacuum_step_pages = vacuum_step_pages
+        self._runs = {}  # (path, task name) -> last run
+        self._started = {}  # path -> when the scheduler first saw it
+        self._deferred = {}  # path -> polls a due task waited for the database to go idle
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                await self.run_due()
+            except Exception:
+                logger.exception("database maintenance pass failed")
+
+    def _due(self, path: str, task: MaintenanceTask, now: float) -> bool:
+        last = self._runs.get((path, task.name))
+        # The first run of each task waits one interval, a restart loop
+        # should not ANALYZE on every boot
+        since = last["finished"] if last else self._started.setdefault(path, now)
+        return now - since >= task.interval
+
+    async def run_due(self, force: bool = False) -> list:
+        """Run the due tasks of every idle database; returns (path, task) pairs that ran"""
+        ran = []
+        async with self._lock:
+            await self._run_due(force, ran)
+        return ran
+
+    async def _run_due(self, force: bool, ran: list):
+        for path in self.activity.paths():
+            for task in self.tasks:
+                if not force and not self._due(path, task, time.monotonic()):
+                    continue
+                if task.requires_idle and self.activity.idle_for(path) < self.idle_seconds:
+                    self._deferred[path] = self._deferred.get(path, 0) + 1
+                    continue  # busy; try again next poll
+                await asyncio.to_thread(self._run, path, task)
+                ran.append((path, task.name))
+
+    def _run(self, path: str, task: MaintenanceTask):
+        previous = self._runs.get((path, task.name), {"runs": 0, "failures": 0})
+        record = {"runs": previous["runs"] + 1, "failures": previous["failures"], "error": None, "details": None}
+        started_at, start = time.time(), time.perf_counter()
+        engine = create_engine(f"sqlite:///{path}", poolclass=NullPool)
+        try:
+            with engine.connect() as connection:
+                connection.exec_driver_sql(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+                record["details"] = task.run(connection, self, path)
+                connection.commit()
+        except Exception as exc:
+            # Usually SQLITE_BUSY: a request won the lock, try again next interval
+            record["failures"] += 1
+            record["error"] = str(exc).splitlines()[0]
+            logger.info("maintenance task %s on %s did not complete: %s", task.name, path, exc)
+        finally:
+            engine.dispose()
+        record.update(
+            last_run_at=started_at,
+            duration_ms=round((time.perf_counter() - start) * 1000, 3),
+            finished=time.monotonic(),
+        )
+        self._runs[(path, task.name)] = record
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        databases = {}
+        for path in self.activity.paths():
+            tasks = {}
+            for task in self.tasks:
+                record = self._runs.get((path, task.name))
+                since = record["finished"] if record else self._started.get(path, now)
+                tasks[task.name] = {
+                    "interval_s": task.interval,
+                    "due_in_s": round(max(0.0, task.interval - (now - since)), 1),
+                    **({key: value for key, value in record.items() if key != "finished"} if record else {"runs": 0}),
+                }
+            databases[path] = {
+                "idle_for_s": round(self.activity.idle_for(path), 1),
+                "deferred_polls": self._deferred.get(path, 0),
+                "tasks": tasks,
+            }
+        return {"running": self._task is not None, "idle_seconds": self.idle_seconds, "databases": databases}
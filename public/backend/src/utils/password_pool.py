@@ -0,0 +1,163 @@
+"""
+bcrypt off the event loop.
+
+A bcrypt hash or check costs a few hundred milliseconds of CPU by design.
+Run inline in ``async def login`` that time blocks every other request the
+process is serving. ``PasswordPool`` sends the work to a process pool
+sized to the cores instead, and caps how much may wait for it: beyond
+``workers + queue_limit`` calls in flight, ``hash`` and ``verify`` raise
+``PasswordPoolFull`` right away (a 503 at the API) rather than letting a
+login flood queue up seconds of work in front of everyone else.
+
+Workers are started with ``spawn``: it works the same on every platform
+and does not copy the app's engines and threads into the child. They
+import only this module and passlib, so keep it free of app imports.
+"""
+import asyncio
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+_context = None
+
+
+def password_context():
+    """passlib and its bcrypt backend load on first use, not on import"""
+    global _context
+    if _context is None:
+        from passlib.context import CryptContext
+        _context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _context
+
+
+def _timed(operation: str, *args):
+    # Runs in a worker process; returns the result and the CPU-side duration
+    start = time.perf_counter()
+    result = getattr(password_context(), operation)(*args)
+    return result, time.perf_counter() - start
+
+
+def _load_backend():
+    password_context().handler("bcrypt").get_backend()
+
+
+class PasswordPoolFull(Exception):
+    pass
+
+
+def _percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))] if ordered else 0.0
+
+
+class PasswordPool:
+    """Process pool for ``hash``/``verify`` with a cap on calls in flight, see the module docstring"""
+
+    def __init__(self, workers: int, queue_limit: int, sample_size: int = 1000):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._samples = {"hash": deque(maxlen=sample_size), "verify": deque(maxlen=sample_size)}
+        self._waits = deque(maxlen=sample_size)
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def _submit(self, *args):
+        try:
+            return self._pool().submit(*args)
+        except BrokenProcessPool:
+            # A worker died (killed, out of memory); start a fresh pool
+            self._executor = None
+            return self._pool().submit(*args)
+
+    def _admit(self):
+        with self._lock:
+            if self.in_flight >= self.workers + self.queue_limit:
+                self.rejected += 1
+                raise PasswordPoolFull(f"{self.in_flight} password operations already in flight")
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.submitted += 1
+
+    def _release(self, future):
+        # Called when the worker is done, even if the request awaiting it was
+        # cancelled: the CPU was busy until then
+        with self._lock:
+            self.in_flight -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def _release_unsubmitted(self):
+        with self._lock:
+            self.in_flight -= 1
+            self.failed += 1
+
+    async def _run(self, operation: str, *args):
+        self._admit()
+        start = time.perf_counter()
+        try:
+            future = self._submit(_timed, operation, *args)
+        except Exception:
+            self._release_unsubmitted()
+            raise
+        future.add_done_callback(self._release)
+        result, seconds = await asyncio.wrap_future(future)
+        self._samples[operation].append(seconds)
+        self._waits.append(max(0.0, time.perf_counter() - start - seconds))
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", password)
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        return await self._run("verify", password, password_hash)
+
+    async def start(self):
+        """Spawn every worker and load bcrypt in it, instead of on the first logins"""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._pool(), _load_backend) for _ in range(self.workers)))
+
+    async def shutdown(self):
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, True, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = self.in_flight
+            counters = {
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "max_in_flight": self.max_in_flight,
+            }
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "in_flight": in_flight,
+            "queued": max(0, in_flight - self.workers),
+            **counters,
+            "wait_p50_ms": round(_percentile(self._waits, 0.5) * 1000, 3),
+            "wait_p95_ms": round(_percentile(self._waits, 0.95) * 1000, 3),
+            **{
+                f"{operation}_{name}_ms": round(_percentile(samples, pct) * 1000, 3)
+                for operation, samples in self._samples.items()
+                for name, pct in (("p50", 0.5), ("p95", 0.95))
+            },
+        }
@@ -0,0 +1,161 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+# What each business role (BusinessUser.role) may do in its business; the
+# frontend's src/utils/permissions.js follows the same hierarchy
+BUSINESS_ROLE_ACTIONS = {
+    "staff": frozenset({"view"}),
+    "manager": frozenset({"view", "edit", "manage_team"}),
+    "owner": frozenset({"view", "edit", "manage_team", "change_team_roles", "delete"}),
+}
+
+
+@dataclass(frozen=True, slots=True)
+class BusinessPermission:
+    role: str
+    actions: frozenset
+
+    @classmethod
+    def for_role(cls, role: str) -> "BusinessPermission":
+        return cls(role=role, actions=BUSINESS_ROLE_ACTIONS.get(role, frozenset()))
+
+
+@dataclass(slots=True)
+class UserPermissions:
+    """A user's effective permissions: business id -> BusinessPermission"""
+    organization_role: str
+    businesses: dict = field(default_factory=dict)
+
+
+class PermissionIndex:
+    """
+    Bounded LRU of each user's effective permissions per business, combining
+    ``AdminUser.role`` (organization owners act as owner of every business
+    of their organization) with their ``BusinessUser`` rows.
+
+    Entries are built from one query on a miss and then maintained in place
+    by the routes that change assignments or businesses (``grant``,
+    ``revoke``, ``add_business``, ``drop_business``), after their commit.
+    An entry remembers the organization role it was built for and is rebuilt
+    when the principal's role differs. Like the principal cache, changes only
+    reach this process; ``ttl`` bounds how long other workers keep theirs.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (organization_id, user_id) -> (UserPermissions, expires at)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.updates = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl > 0
+
+    def generation(self) -> int:
+        """Pass to ``put``; changes whenever an entry is updated or dropped"""
+        return self._generation
+
+    def get(self, organization_id: int, user_id: int, organization_role: str) -> Optional[UserPermissions]:
+        key = (organization_id, user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            permissions, expires = entry
+            if expires <= time.monotonic() or permissions.organization_role != organization_role:
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return permissions
+
+    def put(self, organization_id: int, user_id: int, permissions: UserPermissions, generation: int):
+        if not self.enabled:
+            return
+        key = (organization_id, user_id)
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = (permissions, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def grant(self, organization_id: int, user_id: int, business_id: int, role: str):
+        """``user_id`` now has ``role`` in ``business_id``"""
+        with self._lock:
+            self._generation += 1
+            self.updates += 1
+            entry = self._entries.get((organization_id, user_id))
+            if entry is not None and entry[0].organization_role != "owner":
+                entry[0].businesses[business_id] = BusinessPermission.for_role(role)
+
+    def revoke(self, organization_id: int, user_id: int, business_id: int):
+        """``user_id`` was removed from ``business_id``"""
+        with self._lock:
+            self._generation += 1
+            self.updates += 1
+            entry = self._entries.get((organization_id, user_id))
+            if entry is not None and entry[0].organization_role != "owner":
+                entry[0].businesses.pop(business_id, None)
+
+    def add_business(self, organization_id: int, business_id: int, creator_id: int):
+        """A new business, owned by its creator and by the organization's owners"""
+        self.add_businesses(organization_id, [business_id], creator_id)
+
+    def add_businesses(self, organization_id: int, business_ids: list, creator_id: int):
+        """Several new businesses at once, one pass over the entries"""
+        owner = BusinessPermission.for_role("owner")
+        with self._lock:
+            self._generation += 1
+            self.updates += 1
+            for (org_id, user_id), (permissions, _) in self._entries.items():
+                if org_id == organization_id and (user_id == creator_id or permissions.organization_role == "owner"):
+                    permissions.businesses.update(dict.fromkeys(business_ids, owner))
+
+    def drop_business(self, organization_id: int, business_id: int):
+        with self._lock:
+            self._generation += 1
+            self.updates += 1
+            for (org_id, _), (permissions, _) in self._entries.items():
+                if org_id == organization_id:
+                    permissions.businesses.pop(business_id, None)
+
+    def invalidate(self, organization_id: int, user_id: int):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop((organization_id, user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "updates": self.updates,
+            }
@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+
+@dataclass(frozen=True, slots=True)
+class Principal:
+    """The AdminUser fields request handlers read, detached from any session"""
+    id: int
+    organization_id: int
+    email: str
+    role: str
+    is_active: bool
+    token_version: int = 0
+    created_at: Optional[datetime] = None
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(
+            id=user.id,
+            organization_id=user.organization_id,
+            email=user.email,
+            role=user.role,
+            is_active=user.is_active,
+            token_version=user.token_version or 0,
+            created_at=user.created_at,
+        )
+
+
+class PrincipalCache:
+    """
+    Bounded LRU of authenticated principals with a TTL, so ``get_current_user``
+    does not load the user row on every request.
+
+    Keys are (organization_id, user_id): user ids are only unique within a
+    tenant shard. Routes that change a user call ``invalidate`` once their
+    commit succeeded. That only reaches this process; other workers see the
+    change once their entry expires, so ``ttl`` bounds how long a demoted or
+    deleted user keeps its old rights there.
+
+    A lookup that missed and raced an invalidation of the same user (the row
+    was read before the change committed) is not stored, see ``generation``.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (principal, expires at)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl > 0
+
+    def generation(self) -> int:
+        """Pass to ``put``; changes whenever an entry is invalidated"""
+        return self._generation
+
+    def get(self, organization_id: int, user_id: int) -> Optional[Principal]:
+        key = (organization_id, user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            principal, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return principal
+
+    def put(self, principal: Principal, generation: int):
+        if not self.enabled:
+            return
+        key = (principal.organization_id, principal.id)
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = (principal, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, organization_id: int, user_id: int):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            self._entries.pop((organization_id, user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
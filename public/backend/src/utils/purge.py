@@ -0,0 +1,248 @@
+"""
+Background purge of soft-deleted businesses and organizations.
+
+Deleting a business used to go through the ORM cascade inside the request:
+every customer and assignment of the business loaded into memory, then one
+DELETE per row. DELETE /api/businesses/{id} (and /api/organizations/{id})
+now only sets ``deleted_at``, which every lookup skips, and answers 202.
+``Purger`` then removes the rows in the background:
+
+- children in batches of PURGE_BATCH_SIZE rows, ``DELETE ... WHERE id IN
+  (SELECT id ... LIMIT n)``, each batch a short transaction of its own
+  through the shard's write queue, with PURGE_PAUSE_SECONDS between
+  batches so requests get the database in between
+- the parent row last, in one transaction with whatever children were
+  added meanwhile. The relationships are ``passive_deletes``, the ORM never
+  loads them; on PostgreSQL the ON DELETE CASCADE foreign keys would catch
+  anything left, SQLite runs without foreign key enforcement so nothing
+  is left to them
+
+An organization goes table by table in its tenant database, then its login
+directory entries, placement and row in the catalog. Its tenant database
+file, if it has one of its own, is left in place.
+
+Purges interrupted by a restart are picked up by ``resume`` from the app's
+lifespan: deleted organizations, and deleted businesses in DATABASE_URL. In
+other tenant shards the next business purge of the organization sweeps up
+its leftovers. Recent jobs and their progress are listed at
+/api/metrics/purges.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from sqlalchemy import select
+
+from src.config import sharding
+from src.models.database import AdminUser, Business, BusinessUser, Customer, Organization, TenantShard, UserDirectory
+
+logger = logging.getLogger(__name__)
+
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "1000"))
+PURGE_PAUSE_SECONDS = float(os.getenv("PURGE_PAUSE_SECONDS", "0.05"))
+
+
+@dataclass
+class PurgeJob:
+    kind: str  # "business" or "organization"
+    organization_id: int
+    target_id: int
+    state: str = "queued"  # queued, running, done, failed or interrupted (resumed on restart)
+    deleted: dict = field(default_factory=dict)  # table -> rows deleted so far
+    batches: int = 0
+    error: Optional[str] = None
+    queued_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    def count(self, table: str, rows: int):
+        self.deleted[table] = self.deleted.get(table, 0) + rows
+
+    def summary(self) -> dict:
+        return {
+            "kind": self.kind,
+            "id": self.target_id,
+            "organization_id": self.organization_id,
+            "state": self.state,
+            "deleted": dict(self.deleted),
+            "batches": self.batches,
+            "error": self.error,
+            "queued_at": self.queued_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def _limited_delete(table, condition, limit: int):
+    """Delete at most ``limit`` rows of ``table`` matching ``condition``"""
+    key = next(iter(table.primary_key.columns))
+    return table.delete().where(key.in_(select(key).where(condition).limit(limit)))
+
+
+def _on_shard(shard) -> Callable:
+    """Runs a list of statements in one transaction on the shard's writer, returns their row counts"""
+    async def run(statements: list) -> list:
+        async def job(db):
+            counts = [(await db.execute(statement)).rowcount for statement in statements]
+            await db.commit()
+            return counts
+        return await shard.write_queue.submit(job)
+    return run
+
+
+async def _on_catalog(statements: list) -> list:
+    """``_on_shard`` for the catalog's writer"""
+    async def job(db):
+        counts = [(await db.execute(statement)).rowcount for statement in statements]
+        await db.commit()
+        return counts
+    return await sharding.catalog_write_queue.submit(job)
+
+
+class Purger:
+    """Runs purge jobs as background tasks and keeps the most recent ``history`` for progress reports"""
+
+    def __init__(self, batch_size: int = 1000, pause: float = 0.05, history: int = 100):
+        self.batch_size = batch_size
+        self.pause = pause
+        self._jobs = deque(maxlen=history)
+        self._running = {}  # (kind, target id) -> (job, task)
+
+    def purge_business(self, shard, organization_id: int, business_id: int) -> PurgeJob:
+        job = PurgeJob("business", organization_id, business_id)
+        return self._start(job, lambda: self._purge_business(job, shard))
+
+    def purge_organization(self, organization_id: int) -> PurgeJob:
+        job = PurgeJob("organization", organization_id, organization_id)
+        return self._start(job, lambda: self._purge_organization(job))
+
+    def _start(self, job: PurgeJob, work: Callable) -> PurgeJob:
+        key = (job.kind, job.target_id)
+        if key in self._running:
+            return self._running[key][0]
+        self._jobs.append(job)
+        # In a fresh context: the purge outlives the request that started it,
+        # its statements are not that request's
+        task = contextvars.Context().run(asyncio.get_running_loop().create_task, self._run(job, work))
+        self._running[key] = (job, task)
+        task.add_done_callback(lambda _: self._running.pop(key, None))
+        return job
+
+    async def _run(self, job: PurgeJob, work: Callable):
+        job.state = "running"
+        try:
+            await work()
+            job.state = "done"
+        except asyncio.CancelledError:
+            job.state = "interrupted"
+            raise
+        except Exception as exc:
+            job.state = "failed"
+            job.error = str(exc).splitlines()[0]
+            logger.exception("purge of %s %s failed", job.kind, job.target_id)
+        finally:
+            job.finished_at = time.time()
+
+    async def _batches(self, job: PurgeJob, run: Callable, table, condition):
+        statement = _limited_delete(table, condition, self.batch_size)
+        while True:
+            [deleted] = await run([statement])
+            job.count(table.name, deleted)
+            job.batches += 1
+            if deleted < self.batch_size:
+                return
+            await asyncio.sleep(self.pause)
+
+    async def _purge_business(self, job: PurgeJob, shard):
+        run = _on_shard(shard)
+        customers, assignments, businesses = Customer.__table__, BusinessUser.__table__, Business.__table__
+        async with shard.session() as db:
+            result = await db.execute(select(Business.id).where(
+                Business.organization_id == job.organization_id,
+                Business.deleted_at.is_not(None),
+            ))
+            # Leftovers of interrupted purges in the organization go too
+            doomed = [business_id for business_id in result.scalars()
+                      if business_id == job.target_id or ("business", business_id) not in self._running]
+        for business_id in doomed:
+            await self._batches(job, run, customers, customers.c.business_id == business_id)
+            await self._batches(job, run, assignments, assignments.c.business_id == business_id)
+            counts = await run([
+                customers.delete().where(customers.c.business_id == business_id),
+                assignments.delete().where(assignments.c.business_id == business_id),
+                businesses.delete().where(businesses.c.id == business_id, businesses.c.deleted_at.is_not(None)),
+            ])
+            for table, deleted in zip((customers, assignments, businesses), counts):
+                job.count(table.name, deleted)
+
+    async def _purge_organization(self, job: PurgeJob):
+        organization_id = job.organization_id
+        shard = await sharding.shard_for(organization_id, write=True)
+        run = _on_shard(shard)
+        customers, assignments, businesses = Customer.__table__, BusinessUser.__table__, Business.__table__
+        users, organizations, directory = AdminUser.__table__, Organization.__table__, UserDirectory.__table__
+        organization_businesses = select(businesses.c.id).where(businesses.c.organization_id == organization_id)
+        await self._batches(job, run, customers, customers.c.organization_id == organization_id)
+        await self._batches(job, run, assignments, assignments.c.business_id.in_(organization_businesses))
+        await self._batches(job, run, businesses, businesses.c.organization_id == organization_id)
+        await self._batches(job, run, users, users.c.organization_id == organization_id)
+        if shard.url != sharding.TENANT_CATALOG_URL:
+            [deleted] = await run([organizations.delete().where(organizations.c.id == organization_id)])
+            job.count(organizations.name, deleted)
+
+        await self._batches(job, _on_catalog, directory, directory.c.organization_id == organization_id)
+        placements = TenantShard.__table__
+        counts = await _on_catalog([
+            placements.delete().where(placements.c.organization_id == organization_id),
+            organizations.delete().where(organizations.c.id == organization_id, organizations.c.deleted_at.is_not(None)),
+        ])
+        job.count(organizations.name, counts[1])
+        sharding.forget_placement(organization_id)
+
+    async def resume(self):
+        """Restart purges a previous process did not finish; failures are logged, not raised"""
+        try:
+            async with sharding.CatalogSessionLocal() as db:
+                result = await db.execute(select(Organization.id).where(Organization.deleted_at.is_not(None)))
+                organization_ids = set(result.scalars())
+            async with sharding.default_shard.session() as db:
+                result = await db.execute(select(Business.organization_id, Business.id).where(
+                    Business.deleted_at.is_not(None)
+                ))
+                businesses = result.all()
+        except Exception as exc:
+            logger.warning("could not look for unfinished purges: %s", exc)
+            return
+        for organization_id in organization_ids:
+            self.purge_organization(organization_id)
+        for organization_id, business_id in businesses:
+            if organization_id not in organization_ids:
+                self.purge_business(sharding.default_shard, organization_id, business_id)
+
+    async def idle(self):
+        """Wait for the running purges"""
+        while self._running:
+            await asyncio.gather(*(task for _, task in list(self._running.values())), return_exceptions=True)
+
+    async def shutdown(self):
+        """Stop the running purges; their rows are still marked, ``resume`` finishes them"""
+        tasks = [task for _, task in self._running.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self, organization_id: Optional[int] = None) -> dict:
+        jobs = [job.summary() for job in reversed(self._jobs)
+                if organization_id is None or job.organization_id == organization_id]
+        return {
+            "batch_size": self.batch_size,
+            "pause_s": self.pause,
+            "running": sum(1 for job in jobs if job["state"] in ("queued", "running")),
+            "jobs": jobs,
+        }
+
+
+purger = Purger(batch_size=PURGE_BATCH_SIZE, pause=PURGE_PAUSE_SECONDS)
@@ -0,0 +1,179 @@
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event
+
+from src.utils.sql_metrics import call_site, current_stats
+
+logger = logging.getLogger(__name__)
+
+# Expanded IN lists and multi-row VALUES differ only in their length
+_IN_LIST = re.compile(r"\((?:\s*(?:\?|%s|%\(\w+\)s|\$\d+|:\w+)\s*,)+\s*(?:\?|%s|%\(\w+\)s|\$\d+|:\w+)\s*\)")
+_VALUES_ROWS = re.compile(r"(VALUES\s*\([^()]*\))(?:\s*,\s*\([^()]*\))+", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+OTHER_SHAPE = "<other statements>"
+
+
+def normalize_sql(statement: str) -> str:
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    statement = _VALUES_ROWS.sub(r"\1, ...", statement)
+    return _IN_LIST.sub("(?, ...)", statement)
+
+
+def _value_shape(value) -> str:
+    if isinstance(value, (list, tuple, set)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def parameter_shape(parameters, executemany: bool):
+    """Types (never values) of the bound parameters, so the log holds no customer data"""
+    if executemany:
+        rows = list(parameters or [])
+        return {"rows": len(rows), "first": parameter_shape(rows[0], False) if rows else None}
+    if isinstance(parameters, dict):
+        return {name: _value_shape(value) for name, value in parameters.items()}
+    return [_value_shape(value) for value in parameters or ()]
+
+
+def _rows_returned(cursor):
+    # The DBAPI rowcount: rows changed for writes, and for SELECTs whatever
+    # the driver reports (-1 on most, it does not know until fetched)
+    rowcount = getattr(cursor, "rowcount", None)
+    return rowcount if rowcount is not None and rowcount >= 0 else "unknown"
+
+
+class SlowQueryLog:
+    """
+    Engine hook that logs statements slower than ``threshold_ms`` and keeps
+    per-statement-shape totals.
+
+    Timing every statement is cheap; normalizing and aggregating is not, so
+    only a ``stats_sample_rate`` fraction of statements feed the totals
+    (scaled back up, so counts and total times are estimates) and only a
+    ``log_sample_rate`` fraction of slow ones are written to the log. Slow
+    statements are always counted. Each written entry carries the normalized
+    SQL, parameter types, duration, rows, route, calling source line and the
+    request's organization.
+    """
+
+    def __init__(
+        self,
+        threshold_ms: float = 100,
+        log_sample_rate: float = 1.0,
+        stats_sample_rate: float = 1.0,
+        max_shapes: int = 500,
+        recent_size: int = 100,
+    ):
+        self.threshold = threshold_ms / 1000
+        self.log_sample_rate = log_sample_rate
+        self.stats_sample_rate = stats_sample_rate
+        self.max_shapes = max_shapes
+        self._lock = threading.Lock()
+        self._shapes = {}
+        self._normalized = {}
+        self.recent = deque(maxlen=recent_size)
+        self.slow_statements = 0
+        self.logged_statements = 0
+
+    def attach(self, sync_engine):
+        event.listen(sync_engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._slow_query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_slow_query_started", None)
+        if started is None:
+            return
+        duration = time.perf_counter() - started
+        slow = duration >= self.threshold
+        sampled = self.stats_sample_rate >= 1 or random.random() < self.stats_sample_rate
+        if not slow and not sampled:
+            return
+
+        shape = self._normalize(statement)
+        with self._lock:
+            totals = self._totals_for(shape)
+            if sampled:
+                weight = 1 / self.stats_sample_rate
+                totals["calls"] += weight
+                totals["total_time"] += duration * weight
+            totals["max_time"] = max(totals["max_time"], duration)
+            if slow:
+                totals["slow_calls"] += 1
+                self.slow_statements += 1
+
+        if slow and (self.log_sample_rate >= 1 or random.random() < self.log_sample_rate):
+            self._write(shape, statement, parameters, executemany, duration, cursor)
+
+    def _normalize(self, statement: str) -> str:
+        shape = self._normalized.get(statement)
+        if shape is None:
+            shape = normalize_sql(statement)
+            if len(self._normalized) < self.max_shapes * 4:
+                self._normalized[statement] = shape
+        return shape
+
+    def _totals_for(self, shape: str) -> dict:
+        totals = self._shapes.get(shape)
+        if totals is None:
+            # Bound the table; generated SQL that never repeats lands in one bucket
+            if len(self._shapes) >= self.max_shapes:
+                shape = OTHER_SHAPE
+                totals = self._shapes.get(shape)
+            if totals is None:
+                totals = self._shapes[shape] = {"calls": 0.0, "total_time": 0.0, "max_time": 0.0, "slow_calls": 0}
+        return totals
+
+    def _write(self, shape, statement, parameters, executemany, duration, cursor):
+        stats = current_stats()
+        entry = {
+            "sql": shape,
+            "parameters": parameter_shape(parameters, executemany),
+            "duration_ms": round(duration * 1000, 3),
+            "rows": _rows_returned(cursor),
+            "route": stats.route if stats is not None else None,
+            "source": call_site(skip=(__file__,)),
+            "organization_id": stats.organization_id if stats is not None else None,
+            "at": time.time(),
+        }
+        with self._lock:
+            self.logged_statements += 1
+            self.recent.append(entry)
+        logger.warning("slow query %s", json.dumps(entry, default=str))
+
+    def top(self, limit: int = 20) -> list:
+        """Statement shapes with the highest (estimated) total time"""
+        with self._lock:
+            ranked = sorted(self._shapes.items(), key=lambda item: item[1]["total_time"], reverse=True)[:limit]
+            return [
+                {
+                    "sql": shape,
+                    "calls": round(totals["calls"]),
+                    "total_ms": round(totals["total_time"] * 1000, 3),
+                    "avg_ms": round(totals["total_time"] / totals["calls"] * 1000, 3) if totals["calls"] else None,
+                    "max_ms": round(totals["max_time"] * 1000, 3),
+                    "slow_calls": totals["slow_calls"],
+                }
+                for shape, totals in ranked
+            ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "threshold_ms": self.threshold * 1000,
+                "log_sample_rate": self.log_sample_rate,
+                "stats_sample_rate": self.stats_sample_rate,
+                "slow_statements": self.slow_statements,
+                "logged_statements": self.logged_statements,
+                "shapes_tracked": len(self._shapes),
+            }
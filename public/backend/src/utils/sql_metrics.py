@@ -0,0 +1,239 @@
+"""
+Per-request SQL instrumentation.
+
+``SqlMetricsMiddleware`` opens a ``RequestSqlStats`` for every HTTP request
+and the engine hooks installed by ``instrument_engine`` add each statement
+the request runs to it: how many ran, total time spent in the database and
+the slowest one. With DEBUG on the numbers are returned as X-DB-* response
+headers; they always feed the per-route totals shown by
+``GET /api/metrics/sql``.
+
+A statement shape (its SQL text, which is the same for every set of bound
+parameters) that runs more than ``SQL_N_PLUS_ONE_THRESHOLD`` times in one
+request is logged as a likely N+1 together with the route and the line of
+application code that issued it.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from dotenv import load_dotenv
+from greenlet import getcurrent
+from sqlalchemy import event
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DEBUG = os.getenv("DEBUG", "False").strip().lower() in ("1", "true", "yes", "on")
+N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "5"))
+
+STATEMENTS_HEADER = "X-DB-Statements"
+TIME_HEADER = "X-DB-Time-Ms"
+SLOWEST_HEADER = "X-DB-Slowest-Ms"
+N_PLUS_ONE_HEADER = "X-DB-N-Plus-One"
+SQL_HEADERS = [STATEMENTS_HEADER, TIME_HEADER, SLOWEST_HEADER, N_PLUS_ONE_HEADER]
+
+_SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_ROUTES_DIR = os.path.join(_SRC_DIR, "routes")
+
+
+def call_site(skip: tuple = ()) -> Optional[str]:
+    """
+    ``file:line in function`` of the application code that ran the statement.
+
+    Async sessions run their sync core in a greenlet; once its frames are
+    exhausted the walk continues in the awaiting coroutine's greenlet. A frame
+    in ``src/routes`` wins, otherwise the innermost frame under ``src``.
+    Frames from the files in ``skip`` (other instrumentation) are ignored.
+    """
+    fallback = None
+    glet = getcurrent()
+    frame = sys._getframe(1)
+    while glet is not None:
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(_SRC_DIR) and filename != __file__ and filename not in skip:
+                site = f"{os.path.relpath(filename, os.path.dirname(_SRC_DIR))}:{frame.f_lineno} in {frame.f_code.co_name}"
+                if filename.startswith(_ROUTES_DIR):
+                    return site
+                fallback = fallback or site
+            frame = frame.f_back
+        glet = glet.parent
+        frame = glet.gr_frame if glet is not None else None
+    return fallback
+
+
+class RequestSqlStats:
+    """Statements run while serving one request"""
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.statements = 0
+        self.total_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_sql = None
+        self.shapes = Counter()
+        self.n_plus_one = []
+        self.organization_id = None  # set once the request is authenticated
+
+    @property
+    def route(self) -> str:
+        # Starlette stores the matched route in the scope once routing is done
+        # (unmatched paths are grouped so scanners cannot grow the totals)
+        route = self.scope.get("route")
+        path = getattr(route, "path", None) or "<unmatched>"
+        return f"{self.scope.get('method', '')} {path}"
+
+    def record(self, statement: str, seconds: float):
+        self.statements += 1
+        self.total_time += seconds
+        if seconds > self.slowest_time:
+            self.slowest_time = seconds
+            self.slowest_sql = statement
+        self.shapes[statement] += 1
+        if self.shapes[statement] == N_PLUS_ONE_THRESHOLD + 1:
+            site = call_site()
+            self.n_plus_one.append({"sql": statement, "call_site": site})
+            logger.warning(
+                "Possible N+1: statement ran more than %d times in %s (at %s): %s",
+                N_PLUS_ONE_THRESHOLD, self.route, site, " ".join(statement.split())[:300],
+            )
+
+    def headers(self) -> list:
+        return [
+            (STATEMENTS_HEADER, str(self.statements)),
+            (TIME_HEADER, f"{self.total_time * 1000:.3f}"),
+            (SLOWEST_HEADER, f"{self.slowest_time * 1000:.3f}"),
+            (N_PLUS_ONE_HEADER, str(len(self.n_plus_one))),
+        ]
+
+
+_current_stats: ContextVar[Optional[RequestSqlStats]] = ContextVar("sql_request_stats", default=None)
+
+
+def current_stats() -> Optional[RequestSqlStats]:
+    return _current_stats.get()
+
+
+def set_request_tenant(organization_id: int):
+    """Tag the current request's statements with the caller's organization"""
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.organization_id = organization_id
+
+
+def carry_request_stats(job):
+    """
+    Wrap a write-queue job so its statements count towards the request that
+    submitted it; the queue worker runs jobs outside that request's context.
+    """
+    stats = _current_stats.get()
+    if stats is None:
+        return job
+
+    async def run(session):
+        token = _current_stats.set(stats)
+        try:
+            return await job(session)
+        finally:
+            _current_stats.reset(token)
+
+    return run
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current_stats.get() is not None:
+        context._sql_metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats.get()
+    started = getattr(context, "_sql_metrics_started", None)
+    if stats is not None and started is not None:
+        stats.record(statement, time.perf_counter() - started)
+
+
+def instrument_engine(sync_engine):
+    """Count ``sync_engine``'s statements towards the current request"""
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class RouteSqlTotals:
+    """Aggregated per-route numbers for production, where headers are off"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def add(self, stats: RequestSqlStats):
+        with self._lock:
+            totals = self._routes.setdefault(stats.route, {
+                "requests": 0, "statements": 0, "max_statements": 0,
+                "db_time": 0.0, "slowest_time": 0.0, "slowest_sql": None,
+                "n_plus_one_requests": 0, "n_plus_one_sites": set(),
+            })
+            totals["requests"] += 1
+            totals["statements"] += stats.statements
+            totals["max_statements"] = max(totals["max_statements"], stats.statements)
+            totals["db_time"] += stats.total_time
+            if stats.slowest_time > totals["slowest_time"]:
+                totals["slowest_time"] = stats.slowest_time
+                totals["slowest_sql"] = stats.slowest_sql
+            if stats.n_plus_one:
+                totals["n_plus_one_requests"] += 1
+                totals["n_plus_one_sites"].update(item["call_site"] for item in stats.n_plus_one)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                route: {
+                    "requests": totals["requests"],
+                    "statements_avg": round(totals["statements"] / totals["requests"], 2),
+                    "statements_max": totals["max_statements"],
+                    "db_time_avg_ms": round(totals["db_time"] / totals["requests"] * 1000, 3),
+                    "slowest_ms": round(totals["slowest_time"] * 1000, 3),
+                    "slowest_sql": totals["slowest_sql"],
+                    "n_plus_one_requests": totals["n_plus_one_requests"],
+                    "n_plus_one_sites": sorted(site for site in totals["n_plus_one_sites"] if site),
+                }
+                for route, totals in self._routes.items()
+            }
+
+
+route_sql_totals = RouteSqlTotals()
+
+
+class SqlMetricsMiddleware:
+    """Collects each request's SQL statistics, see the module docstring"""
+
+    def __init__(self, app, headers: bool = DEBUG):
+        self.app = app
+        self.headers = headers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestSqlStats(scope)
+        token = _current_stats.set(stats)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start" and self.headers:
+                headers = list(message.get("headers", []))
+                headers.extend((name.lower().encode(), value.encode()) for name, value in stats.headers())
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _current_stats.reset(token)
+            route_sql_totals.add(stats)
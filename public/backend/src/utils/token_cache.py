@@ -0,0 +1,91 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class TokenCache:
+    """
+    Bounded LRU from a JWT's SHA-256 digest to its already validated claims.
+
+    Verifying a token means base64 decoding it, checking the HMAC and parsing
+    the JSON, and a browser session sends the same token with every request.
+    Only tokens that passed ``jwt.decode`` are stored, each until its own
+    ``exp``, so a hit is exactly what decoding again would have returned.
+    A token that differs in any byte, e.g. a forged signature, has another
+    digest and goes through the full check.
+
+    ``revoke_user`` drops every cached token of a user, for routes that
+    delete or change one (see ``forget_user`` in src/utils/auth.py).
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # digest -> (claims, exp as a unix timestamp)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.revoked = 0
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, digest: bytes) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.misses += 1
+                return None
+            claims, expires = entry
+            if expires <= time.time():
+                del self._entries[digest]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return claims
+
+    def put(self, digest: bytes, claims: dict):
+        expires = claims.get("exp")
+        if self.max_size <= 0 or not isinstance(expires, (int, float)):
+            return
+        with self._lock:
+            self._entries[digest] = (claims, expires)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def revoke_user(self, organization_id: int, user_id: int):
+        with self._lock:
+            doomed = [
+                digest for digest, (claims, _) in self._entries.items()
+                if claims.get("userId") == user_id and claims.get("organizationId") == organization_id
+            ]
+            for digest in doomed:
+                del self._entries[digest]
+            self.revoked += len(doomed)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.max_size > 0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "revoked": self.revoked,
+            }
@@ -0,0 +1,58 @@
+"""
+Startup warm-up, run by the app's lifespan before the first request.
+
+Importing ``src.main`` only defines things: it opens no connections and
+leaves the schema to ``python -m src.migrations upgrade``, so a worker
+starts (and imports cleanly) even while the database is unreachable. What
+that defers would otherwise land on the first requests: configuring the
+ORM mappers, opening a pooled connection per engine and applying the
+SQLite pragmas, starting the bcrypt worker processes and building the
+OpenAPI schema (which also generates the JSON schema of every pydantic
+model).
+``warm_up`` does it up front and returns the milliseconds each step took.
+
+A step that fails, e.g. a database that is not up yet, is logged and
+skipped: the app still starts and the first request that needs it pays
+for it, or fails, as it would have without the warm-up.
+"""
+import asyncio
+import logging
+import os
+import time
+
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+
+from src.config.database import async_engine, read_engine, replica_engines, writer_engine
+from src.config.sharding import catalog_engine
+from src.utils.auth import password_pool
+
+logger = logging.getLogger(__name__)
+
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "True").strip().lower() in ("1", "true", "yes", "on")
+
+
+async def _connect_pools():
+    for engine in {async_engine, read_engine, writer_engine, catalog_engine, *replica_engines}:
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+
+async def warm_up(app) -> dict:
+    steps = [
+        ("mappers", lambda: asyncio.to_thread(configure_mappers)),
+        ("database", _connect_pools),
+        ("passwords", password_pool.start),
+        ("openapi", lambda: asyncio.to_thread(app.openapi)),
+    ]
+    timings = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            await step()
+        except Exception as exc:
+            logger.warning("startup warm-up step %s failed: %s", name, exc)
+            timings[name] = None
+            continue
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+    return timings
@@ -0,0 +1,160 @@
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable
+
+from fastapi import HTTPException
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.utils.sql_metrics import carry_request_stats
+
+# A write job gets a fresh session, does its work and commits it itself, so
+# a job that hit a busy database can simply be run again from the start
+WriteJob = Callable[[AsyncSession], Awaitable[Any]]
+
+
+def is_busy_error(exc: Exception) -> bool:
+    """True for SQLite's transient lock errors ("database is locked"/"busy")"""
+    if not isinstance(exc, OperationalError):
+        return False
+    message = str(exc.orig).lower()
+    return "database is locked" in message or "database is busy" in message
+
+
+class WriteQueue:
+    """
+    Runs write jobs one at a time on a dedicated writer session.
+
+    SQLite allows a single writer, so concurrent commits from the request pool
+    end up fighting over the database lock. Routing them through this queue
+    means only one connection ever writes; jobs that still hit a busy database
+    (another process, a checkpoint) are retried with jittered backoff.
+
+    With ``serialize=False`` jobs run directly on their own session with the
+    same retry policy, for backends that handle concurrent writers themselves.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        serialize: bool = True,
+        max_retries: int = 5,
+        base_delay: float = 0.01,
+        max_delay: float = 0.5,
+    ):
+        self.session_factory = session_factory
+        self.serialize = serialize
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._queue = None
+        self._worker = None
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0  # jobs that answered with an HTTPException (404, 403, ...), not failures
+        self.retries = 0
+        self.max_depth = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+
+    async def submit(self, job: WriteJob) -> Any:
+        """Run ``job`` on the writer and return its result (or raise its error)"""
+        self.submitted += 1
+        job = carry_request_stats(job)
+        if not self.serialize:
+            return await self._run(job, time.perf_counter())
+
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((job, future, time.perf_counter()))
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return await future
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            if self._queue is None:
+                self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._drain())
+
+    async def _drain(self):
+        while True:
+            job, future, enqueued_at = await self._queue.get()
+            try:
+                if future.cancelled():
+                    continue
+                try:
+                    result = await self._run(job, enqueued_at)
+                except Exception as exc:
+                    if not future.cancelled():
+                        future.set_exception(exc)
+                else:
+                    if not future.cancelled():
+                        future.set_result(result)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: WriteJob, enqueued_at: float) -> Any:
+        started = time.perf_counter()
+        waited = started - enqueued_at
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+        attempt = 0
+        try:
+            while True:
+                async with self.session_factory() as session:
+                    try:
+                        result = await job(session)
+                    except Exception as exc:
+                        await session.rollback()
+                        if not is_busy_error(exc) or attempt >= self.max_retries:
+                            raise
+                    else:
+                        self.completed += 1
+                        return result
+                attempt += 1
+                self.retries += 1
+                # Full jitter keeps retrying writers from waking up in lockstep
+                await asyncio.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+        except HTTPException:
+            self.rejected += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.run_total += time.perf_counter() - started
+
+    async def close(self):
+        """Let queued jobs finish, then stop the worker"""
+        if self._worker is None:
+            return
+        if not self._worker.done():
+            await self._queue.join()
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+        self._queue = None
+
+    def stats(self) -> dict:
+        finished = self.completed + self.failed + self.rejected
+        return {
+            "serialized": self.serialize,
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_depth": self.max_depth,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "busy_retries": self.retries,
+            "wait_avg_ms": round(self.wait_total / finished * 1000, 3) if finished else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+            "run_avg_ms": round(self.run_total / finished * 1000, 3) if finished else 0.0,
+        }
@@ -1,10 +1,19 @@
 @echo off
 setlocal enabledelayedexpansion
 
-set PYTHONPATH=C:\Users\chakk\OneDrive\Desktop\Zenooptspot\Zenooptspot\public\backend
-cd /d "C:\Users\chakk\OneDrive\Desktop\Zenooptspot\Zenooptspot\public\backend"
+REM Run from this script's directory, whatever the checkout's location
+cd /d "%~dp0"
+set PYTHONPATH=%CD%
+
+echo Applying database migrations...
+venv_310\Scripts\python.exe -m src.migrations upgrade
+if errorlevel 1 (
+    echo Migrations failed, not starting the backend
+    pause
+    exit /b 1
+)
 
 echo Starting FastAPI Backend on port 8001...
-py -3.10 -m uvicorn src.main:app --host 127.0.0.1 --port 8001
+venv_310\Scripts\python.exe -m uvicorn src.main:app --host 127.0.0.1 --port 8001
 
 pause
@@ -23,18 +23,13 @@ import api from "../../utils/api";
 import UserAssignmentModal from "./UserAssignmentModal";
 import AssignTeamMembersModal from "./AssignTeamMembersModal";
 import { useAuth } from "../../context/useAuth";
-import {
-  canEditBusiness,
-  canDeleteBusiness,
-  canManageTeam,
-  getUserBusinessRole,
-} from "../../utils/permissions";
+import { canOnBusiness, fetchMyPermissions } from "../../utils/permissions";
 import "./BusinessPage.css";
 
 export default function BusinessPage() {
   const { user } = useAuth(); // user.role = ORGANIZATION-level role
   const [businesses, setBusinesses] = useState([]);
-  const [businessUsers, setBusinessUsers] = useState({}); // Track users assigned to each business
+  const [permissions, setPermissions] = useState({}); // Current user's role and actions per business
   const [loading, setLoading] = useState(false);
   const [isModalVisible, setIsModalVisible] = useState(false);
   const [isEditMode, setIsEditMode] = useState(false);
@@ -54,28 +49,22 @@ export default function BusinessPage() {
   const fetchBusinesses = async () => {
     try {
       setLoading(true);
-      console.log("📡 Fetching businesses - GET /businesses/");
-      const response = await api.get("/businesses/");
+      // Team members come embedded, instead of one request per business
+      console.log("📡 Fetching businesses - GET /businesses/?include=users");
+      const response = await api.get("/businesses/?include=users");
       console.log("📦 Got response:", response);
       const businesses = Array.isArray(response)
         ? response
         : response.data || [];
       setBusinesses(businesses);
 
-      // Fetch users for each business to check roles
-      const usersMap = {};
-      for (const business of businesses) {
-        try {
-          const users = await api.get(`/businesses/${business.id}/users/`);
-          usersMap[business.id] = Array.isArray(users)
-            ? users
-            : users.data || [];
-        } catch (err) {
-          console.warn(`Failed to fetch users for business ${business.id}`);
-          usersMap[business.id] = [];
-        }
+      // One request for the current user's permissions in every business
+      try {
+        setPermissions(await fetchMyPermissions(api));
+      } catch (err) {
+        console.warn("Failed to fetch permissions");
+        setPermissions({});
       }
-      setBusinessUsers(usersMap);
     } catch (error) {
       message.error("Failed to fetch businesses");
       console.error("Fetch error:", error);
@@ -210,16 +199,10 @@ export default function BusinessPage() {
       key: "actions",
       width: "25%",
       render: (_, record) => {
-        // Get the users assigned to THIS SPECIFIC business
-        const businessUsersList = businessUsers[record.id] || [];
-
-        // Get current user's BUSINESS-LEVEL role in THIS business
-        // (not their organization role - that's checked elsewhere for menu visibility)
-        const userRole = getUserBusinessRole(businessUsersList, user?.id);
-
-        // Check BUSINESS-level permissions based on role in THIS business
-        const canEdit = canEditBusiness(userRole); // Need Manager or Owner
-        const canDelete = canDeleteBusiness(userRole); // Need Owner only
+        // BUSINESS-level permissions in THIS business, as computed by the backend
+        // (org owners get every action in every business)
+        const canEdit = canOnBusiness(permissions, record.id, "edit"); // Manager or Owner
+        const canDelete = canOnBusiness(permissions, record.id, "delete"); // Owner only
 
         return (
           <Space size="small" wrap>
@@ -230,7 +213,7 @@ export default function BusinessPage() {
               icon={<TeamOutlined />}
               onClick={() => handleAssignTeamMembers(record)}
             >
-              Team
+              Team ({(record.users || []).length})
             </Button>
             {/* Customers always accessible */}
             <Button
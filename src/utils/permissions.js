@@ -23,6 +23,11 @@
  *
  *   When john views Business A → use businessRole for permissions (owner)
  *   When john views Business B → use businessRole for permissions (staff)
+ *
+ * The backend combines both into GET /api/me/permissions: one entry per
+ * business the user can see, with their business role and the actions
+ * ("view", "edit", "manage_team", "change_team_roles", "delete") it allows.
+ * Prefer canOnBusiness with that response over fetching every business's users.
  */
 
 /**
@@ -101,3 +106,34 @@ export const getUserBusinessRole = (businessUsers, userId) => {
   const businessUser = businessUsers.find((bu) => bu.admin_user_id === userId);
   return businessUser ? businessUser.role : null;
 };
+
+/**
+ * Get the current user's effective permissions in one request
+ *
+ * @param {object} api - API client (utils/api)
+ * @returns {Promise<object>} Map of business id → { role, actions }
+ */
+export const fetchMyPermissions = async (api) => {
+  const response = await api.get("/me/permissions");
+  const permissions = {};
+  for (const entry of response.businesses || []) {
+    permissions[entry.business_id] = {
+      role: entry.role,
+      actions: entry.actions,
+    };
+  }
+  return permissions;
+};
+
+/**
+ * Check an action against the map returned by fetchMyPermissions
+ *
+ * @param {object} permissions - Map of business id → { role, actions }
+ * @param {number} businessId - Business to check
+ * @param {string} action - "view", "edit", "manage_team", "change_team_roles" or "delete"
+ * @returns {boolean}
+ */
+export const canOnBusiness = (permissions, businessId, action) => {
+  const permission = permissions[businessId];
+  return Boolean(permission && permission.actions.includes(action));
+};
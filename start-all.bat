@@ -1,6 +1,18 @@
 @echo off
 title ZenoOptSpot - Full Stack Development
 
+REM Bring the database schema up to date before anything serves it
+echo Applying database migrations...
+pushd "%CD%\public\backend"
+venv_310\Scripts\python.exe -m src.migrations upgrade
+if errorlevel 1 (
+    popd
+    echo Migrations failed, not starting the servers
+    pause
+    exit /b 1
+)
+popd
+
 REM Start backend in a new window (using venv python)
 echo Starting backend server...
 start "Backend - FastAPI (8001)" cmd /k "cd /d %CD%\public\backend && venv_310\Scripts\python.exe -m uvicorn src.main:app --host 127.0.0.1 --port 8001 || pause"